@@ -0,0 +1,47 @@
+"""Add reply_queue table
+
+Revision ID: 500f3274782e
+Revises: 58096da853d5
+Create Date: 2026-10-18 20:48:41.908305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '500f3274782e'
+down_revision: Union[str, None] = '58096da853d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'reply_queue',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('character_name_id', sa.String(), nullable=False),
+        sa.Column('platform', sa.String(), nullable=False),
+        sa.Column('message_id', sa.String(), nullable=False),
+        sa.Column('conversation_id', sa.String()),
+        sa.Column('author', sa.String()),
+        sa.Column('wen_posted', sa.DateTime()),
+        sa.Column('score', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('draft', sa.JSON()),
+        sa.Column('drafted_at', sa.DateTime()),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('reply_id', sa.String()),
+        sa.Column('error', sa.String()),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.UniqueConstraint('character_name_id', 'platform', 'message_id', name='uq_reply_queue_character_platform_message')
+    )
+    op.create_index('ix_reply_queue_character_platform_status', 'reply_queue', ['character_name_id', 'platform', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_reply_queue_character_platform_status', table_name='reply_queue')
+    op.drop_table('reply_queue')
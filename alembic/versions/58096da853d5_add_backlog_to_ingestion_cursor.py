@@ -0,0 +1,28 @@
+"""Add backlog pagination to ingestion_cursor
+
+Revision ID: 58096da853d5
+Revises: a2ffc3f5755e
+Create Date: 2026-10-18 15:48:09.552871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '58096da853d5'
+down_revision: Union[str, None] = 'a2ffc3f5755e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('ingestion_cursor', sa.Column('next_token', sa.String()))
+    op.add_column('ingestion_cursor', sa.Column('backlog_newest_id', sa.String()))
+
+
+def downgrade():
+    op.drop_column('ingestion_cursor', 'backlog_newest_id')
+    op.drop_column('ingestion_cursor', 'next_token')
@@ -0,0 +1,33 @@
+"""Add composite indexes matching message access patterns
+
+Revision ID: 61e2a34ba3d9
+Revises: e233804adc91
+Create Date: 2026-10-18 10:12:41.512093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '61e2a34ba3d9'
+down_revision: Union[str, None] = 'e233804adc91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # conversation building: conversation_id = ? ORDER BY wen_posted
+    op.create_index('ix_message_conversation_id_wen_posted', 'message', ['conversation_id', 'wen_posted'])
+    # own tweets and mentions: platform = ? AND author = ?
+    op.create_index('ix_message_platform_author_wen_posted', 'message', ['platform', 'author', 'wen_posted'])
+    # recent messages of a character on a platform
+    op.create_index('ix_message_character_platform_wen_posted', 'message', ['character', 'platform', 'wen_posted'])
+
+
+def downgrade():
+    op.drop_index('ix_message_character_platform_wen_posted', table_name='message')
+    op.drop_index('ix_message_platform_author_wen_posted', table_name='message')
+    op.drop_index('ix_message_conversation_id_wen_posted', table_name='message')
@@ -0,0 +1,38 @@
+"""Add filter_decision table
+
+Revision ID: 6cb798fa07c1
+Revises: 7c1e6d596cd1
+Create Date: 2026-10-18 14:02:11.730954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6cb798fa07c1'
+down_revision: Union[str, None] = '7c1e6d596cd1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'filter_decision',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('character_name_id', sa.String(), nullable=False),
+        sa.Column('rules_hash', sa.String(), nullable=False),
+        sa.Column('should_respond', sa.Boolean(), nullable=False),
+        sa.Column('reason', sa.String()),
+        sa.Column('created_at', sa.DateTime())
+    )
+    op.create_index('ix_filter_decision_character_rules_hash', 'filter_decision', ['character_name_id', 'rules_hash'])
+    op.create_index('ix_filter_decision_created_at', 'filter_decision', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_filter_decision_created_at', table_name='filter_decision')
+    op.drop_index('ix_filter_decision_character_rules_hash', table_name='filter_decision')
+    op.drop_table('filter_decision')
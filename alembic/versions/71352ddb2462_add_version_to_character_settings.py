@@ -0,0 +1,26 @@
+"""Add version to character_settings
+
+Revision ID: 71352ddb2462
+Revises: aba315d9f70f
+Create Date: 2026-10-18 13:41:09.640118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '71352ddb2462'
+down_revision: Union[str, None] = 'aba315d9f70f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('character_settings', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('character_settings', 'version')
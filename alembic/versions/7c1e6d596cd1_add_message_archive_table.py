@@ -0,0 +1,43 @@
+"""Add message_archive table
+
+Revision ID: 7c1e6d596cd1
+Revises: 71352ddb2462
+Create Date: 2026-10-18 13:12:40.518263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e6d596cd1'
+down_revision: Union[str, None] = '71352ddb2462'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'message_archive',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('conversation_id', sa.String()),
+        sa.Column('character', sa.String()),
+        sa.Column('platform', sa.String(), nullable=False),
+        sa.Column('author', sa.String(), nullable=False),
+        sa.Column('wen_posted', sa.DateTime()),
+        sa.Column('partition', sa.String(), nullable=False),
+        sa.Column('archived_at', sa.DateTime()),
+        sa.Column('payload', sa.LargeBinary(), nullable=False)
+    )
+    op.create_index('ix_message_archive_partition', 'message_archive', ['partition'])
+    op.create_index('ix_message_archive_conversation_id', 'message_archive', ['conversation_id'])
+    op.create_index('ix_message_archive_platform_author_wen_posted', 'message_archive', ['platform', 'author', 'wen_posted'])
+
+
+def downgrade():
+    op.drop_index('ix_message_archive_platform_author_wen_posted', table_name='message_archive')
+    op.drop_index('ix_message_archive_conversation_id', table_name='message_archive')
+    op.drop_index('ix_message_archive_partition', table_name='message_archive')
+    op.drop_table('message_archive')
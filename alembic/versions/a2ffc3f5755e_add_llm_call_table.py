@@ -0,0 +1,46 @@
+"""Add llm_call table
+
+Revision ID: a2ffc3f5755e
+Revises: 6cb798fa07c1
+Create Date: 2026-10-18 15:10:42.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2ffc3f5755e'
+down_revision: Union[str, None] = '6cb798fa07c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'llm_call',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('character_name_id', sa.String()),
+        sa.Column('call_site', sa.String(), nullable=False),
+        sa.Column('provider', sa.String(), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('wall_time', sa.Float(), nullable=False),
+        sa.Column('time_to_first_token', sa.Float()),
+        sa.Column('input_tokens', sa.Integer()),
+        sa.Column('output_tokens', sa.Integer()),
+        sa.Column('cost', sa.Float()),
+        sa.Column('outcome', sa.String(), nullable=False),
+        sa.Column('fallback', sa.Boolean()),
+        sa.Column('error', sa.String())
+    )
+    op.create_index('ix_llm_call_call_site_started_at', 'llm_call', ['call_site', 'started_at'])
+    op.create_index('ix_llm_call_started_at', 'llm_call', ['started_at'])
+
+
+def downgrade():
+    op.drop_index('ix_llm_call_started_at', table_name='llm_call')
+    op.drop_index('ix_llm_call_call_site_started_at', table_name='llm_call')
+    op.drop_table('llm_call')
@@ -0,0 +1,34 @@
+"""Add ingestion_cursor table
+
+Revision ID: aba315d9f70f
+Revises: 61e2a34ba3d9
+Create Date: 2026-10-18 11:03:27.184402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'aba315d9f70f'
+down_revision: Union[str, None] = '61e2a34ba3d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'ingestion_cursor',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('character_name_id', sa.String(), nullable=False),
+        sa.Column('platform', sa.String(), nullable=False),
+        sa.Column('last_id', sa.String()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.UniqueConstraint('character_name_id', 'platform', name='uq_ingestion_cursor_character_platform')
+    )
+
+
+def downgrade():
+    op.drop_table('ingestion_cursor')
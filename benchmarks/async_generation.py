@@ -0,0 +1,128 @@
+"""
+
+Throughput of response generation from an event loop, blocking vs async.
+
+A burst of chat messages is answered by one event loop, as SiaTelegram does.
+"blocking" calls Sia.generate_response (the loop stalls on every LLM call);
+"async" calls Sia.agenerate_response with different concurrency limits.
+The LLMs are local stubs that sleep for --latency seconds per call, so the
+numbers show scaling, not provider speed.
+
+Usage:
+    python -m benchmarks.async_generation
+    python -m benchmarks.async_generation --messages 64 --latency 0.5 --limits 1 4 16 64
+
+"""
+
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from sia.sia import Sia
+from sia.llm.registry import SiaLLMRegistry
+from sia.memory.schemas import SiaMessageSchema
+
+
+CHARACTER_JSON = "characters/sia.json"
+
+
+class LatencyChatModel(BaseChatModel):
+    """Stub LLM answering after a fixed delay; with_structured_output returns a passing filter result."""
+
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "latency-stub"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="stub response"))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    def with_structured_output(self, schema, **kwargs):
+        def respond(_):
+            time.sleep(self.latency)
+            return schema(should_respond=True, reason="stub")
+
+        async def arespond(_):
+            await asyncio.sleep(self.latency)
+            return schema(should_respond=True, reason="stub")
+
+        return RunnableLambda(respond, afunc=arespond)
+
+
+def make_sia(db_url, latency, limit):
+    factory = lambda model, temperature: LatencyChatModel(latency=latency)
+    sia = Sia(
+        character_json_filepath=CHARACTER_JSON,
+        memory_db_path=db_url,
+        twitter_creds={"api_key": "x", "api_secret_key": "x", "access_token": "x", "access_token_secret": "x", "bearer_token": "x"},
+        llm_registry=SiaLLMRegistry(factories={"anthropic": factory, "openai": factory}),
+        max_concurrent_generations=limit,
+        logging_enabled=False
+    )
+    # one filtering call and one generation call per response
+    sia.character.responding = {"enabled": True, "filtering_rules": ["Do not respond to spam."]}
+    return sia
+
+
+def make_messages(n):
+    return [
+        SiaMessageSchema(id=f"chat-{i}", conversation_id="chat", platform="telegram", author=f"user_{i}", content=f"hello {i}")
+        for i in range(n)
+    ]
+
+
+async def run_blocking(sia, messages):
+    async def handle(message):
+        return sia.generate_response(message, platform="telegram")
+    return await asyncio.gather(*(handle(message) for message in messages))
+
+
+async def run_async(sia, messages):
+    return await asyncio.gather(*(sia.agenerate_response(message, platform="telegram") for message in messages))
+
+
+def measure(name, sia, runner, messages):
+    start = time.perf_counter()
+    responses = asyncio.run(runner(sia, messages))
+    elapsed = time.perf_counter() - start
+    answered = sum(1 for response in responses if response)
+    print(f"{name:<14} {answered:>4}/{len(messages)} answered in {elapsed:6.2f} s  ->  {answered / elapsed:6.1f} responses/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.25, help="seconds per LLM call")
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 4, 16, 64], help="max_concurrent_generations values to run")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+        print(f"{args.messages} messages, {args.latency} s per LLM call, 2 calls per response\n")
+        measure("blocking", make_sia(db_url, args.latency, 1), run_blocking, messages)
+        for limit in args.limits:
+            measure(f"async x{limit}", make_sia(db_url, args.latency, limit), run_async, messages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+
+Rate limit scheduling of the Twitter client against a local fake API.
+
+FakeTwitterAPI is a requests transport adapter mounted on the tweepy session:
+no network, every response carries x-rate-limit-* headers (and
+x-user-limit-24hour-* for tweeting) from per-endpoint counters with a short
+window, and calls over the limit get a 429, as the real API does.
+
+The script shows that:
+- replies leave the last tweet of a window to scheduled posts (priorities);
+- a rate limited call is deferred (SiaRateLimited) instead of sleeping, and
+  the event loop keeps running while deferred tweets wait for the reset;
+- a 429 from the API (quota used by another client) is turned into a deferral too.
+
+Usage:
+    python -m benchmarks.twitter_rate_limits
+    python -m benchmarks.twitter_rate_limits --window 3 --tweets 4 --searches 5
+
+"""
+
+
+import argparse
+import asyncio
+import json
+import re
+import threading
+import time
+from itertools import count
+
+import requests
+from requests.adapters import BaseAdapter
+
+from sia.clients.twitter.rate_limits import (
+    SiaRateLimitedClient, SiaTwitterRateLimits, SiaRateLimited,
+    PRIORITY_PUBLISH, PRIORITY_REPLY, PRIORITY_SEARCH
+)
+from sia.clients.twitter.twitter_official_api_client import SiaTwitterOfficial
+from sia.memory.schemas import SiaMessageGeneratedSchema
+
+
+class FakeTwitterAPI(BaseAdapter):
+    """
+    Answers POST /2/tweets and GET /2/tweets/search/recent.
+    limits: {(method, path regex): (calls per window, calls per day or None)}
+    """
+
+    def __init__(self, limits: dict, window: float = 3):
+        super().__init__()
+        self.limits = limits
+        self.window = window
+        self.started = time.time()
+        self.calls = {}
+        self.daily_calls = {}
+        self.log = []
+        self._ids = count(1000)
+        self._lock = threading.Lock()
+
+
+    def _match(self, method: str, path: str):
+        for key in self.limits:
+            if key[0] == method and re.fullmatch(key[1], path):
+                return key
+        return None
+
+
+    def use(self, method: str, path: str, calls: int):
+        """Spend calls of an endpoint's quota, as another client of the same account would."""
+        key = self._match(method, path)
+        window_index = int((time.time() - self.started) // self.window)
+        with self._lock:
+            self.calls[(key, window_index)] = self.calls.get((key, window_index), 0) + calls
+
+
+    def send(self, request, **kwargs):
+        path = requests.utils.urlparse(request.url).path
+        key = self._match(request.method, path)
+        now = time.time()
+        window_index = int((now - self.started) // self.window)
+        headers = {"content-type": "application/json"}
+        status = 200
+
+        if key is None:
+            status, body = 404, {"title": "Not Found"}
+        else:
+            limit, daily_limit = self.limits[key]
+            with self._lock:
+                used = self.calls.get((key, window_index), 0)
+                daily_used = self.daily_calls.get(key, 0)
+                allowed = used < limit and (daily_limit is None or daily_used < daily_limit)
+                if allowed:
+                    used += 1
+                    daily_used += 1
+                    self.calls[(key, window_index)] = used
+                    self.daily_calls[key] = daily_used
+            headers.update({
+                "x-rate-limit-limit": str(limit),
+                "x-rate-limit-remaining": str(max(0, limit - used)),
+                "x-rate-limit-reset": str(self.started + (window_index + 1) * self.window),
+            })
+            if daily_limit is not None:
+                headers.update({
+                    "x-user-limit-24hour-limit": str(daily_limit),
+                    "x-user-limit-24hour-remaining": str(max(0, daily_limit - daily_used)),
+                    "x-user-limit-24hour-reset": str(self.started + 24 * 3600),
+                })
+            if not allowed:
+                status, body = 429, {"title": "Too Many Requests"}
+            elif request.method == "POST":
+                text = json.loads(request.body or b"{}").get("text", "")
+                body = {"data": {"id": str(next(self._ids)), "text": text}}
+            else:
+                body = {"data": [], "meta": {"result_count": 0}}
+
+        with self._lock:
+            self.log.append((round(now - self.started, 2), request.method, path, status))
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = requests.status_codes._codes[status][0].upper()
+        response.headers.update(headers)
+        response._content = json.dumps(body).encode("utf-8")
+        response.url = request.url
+        response.request = request
+        return response
+
+
+    def close(self):
+        pass
+
+
+def fake_credentials() -> dict:
+    return dict(consumer_key="key", consumer_secret="secret", access_token="1-token", access_token_secret="token-secret", bearer_token="bearer")
+
+
+def try_call(label: str, priority: int, fn, *args, **kwargs):
+    try:
+        SiaTwitterRateLimits.call(priority, fn, *args, **kwargs)
+        print(f"  {label}: sent")
+        return True
+    except SiaRateLimited as e:
+        print(f"  {label}: deferred, retry in {e.retry_after:.1f} s")
+        return False
+
+
+def priorities(args):
+    print(f"\nPriorities: POST /2/tweets allows {args.tweets} calls per {args.window} s window")
+    api = FakeTwitterAPI({("POST", r"/2/tweets"): (args.tweets, 1000)}, window=args.window)
+    client = SiaRateLimitedClient(**fake_credentials(), rate_limits=SiaTwitterRateLimits(logging_enabled=False))
+    client.session.mount("https://", api)
+
+    replies = 0
+    while try_call(f"reply {replies + 1}", PRIORITY_REPLY, client.create_tweet, text=f"reply {replies + 1}"):
+        replies += 1
+    try_call("post", PRIORITY_PUBLISH, client.create_tweet, text="post")
+    try_call("post", PRIORITY_PUBLISH, client.create_tweet, text="another post")
+    print(f"  {replies} replies sent, 1 call left to the post; the API saw {sum(1 for entry in api.log if entry[3] == 429)} 429s")
+
+
+def searches(args):
+    print(f"\nSearches: another client already used the window's {args.searches} searches")
+    api = FakeTwitterAPI({("GET", r"/2/tweets/search/recent"): (args.searches, None)}, window=args.window)
+    api.use("GET", "/2/tweets/search/recent", args.searches)
+    client = SiaRateLimitedClient(**fake_credentials(), rate_limits=SiaTwitterRateLimits(logging_enabled=False))
+    client.session.mount("https://", api)
+
+    try_call("search (429 from the API)", PRIORITY_SEARCH, client.search_recent_tweets, query="@sia")
+    try_call("search (limit known locally)", PRIORITY_SEARCH, client.search_recent_tweets, query="@sia")
+    print(f"  the API saw {len(api.log)} call(s): the second search never left the client")
+
+
+async def deferral(args):
+    print(f"\nDeferral: {args.tweets + 2} tweets at once through SiaTwitterOfficial._publish_deferred")
+    api = FakeTwitterAPI({("POST", r"/2/tweets"): (args.tweets, 1000)}, window=args.window)
+    twitter = SiaTwitterOfficial(
+        api_key="key", api_secret_key="secret", access_token="1-token", access_token_secret="token-secret", bearer_token="bearer",
+        logging_enabled=False
+    )
+    twitter.client.session.mount("https://", api)
+
+    ticks = 0
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.05)
+            ticks += 1
+
+    started = time.time()
+    beat = asyncio.create_task(heartbeat())
+    posts = [SiaMessageGeneratedSchema(platform="twitter", author="sia", content=f"tweet {i}") for i in range(args.tweets + 2)]
+    tweet_ids = await asyncio.gather(*[
+        twitter._publish_deferred(PRIORITY_PUBLISH if i == 0 else PRIORITY_REPLY, post)
+        for i, post in enumerate(posts)
+    ])
+    elapsed = time.time() - started
+    beat.cancel()
+
+    print(f"  tweet ids: {tweet_ids}")
+    print(f"  all sent in {elapsed:.1f} s; the event loop ticked {ticks} times meanwhile (~{elapsed / 0.05:.0f} expected)")
+    print(f"  API log (time, method, path, status): {api.log}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", type=float, default=3, help="rate limit window of the fake API, in seconds")
+    parser.add_argument("--tweets", type=int, default=3, help="tweets allowed per window")
+    parser.add_argument("--searches", type=int, default=5, help="searches allowed per window")
+    args = parser.parse_args()
+
+    priorities(args)
+    searches(args)
+    asyncio.run(deferral(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import asyncio
+import os
+import time
 from telegram import Bot, Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, CallbackContext
-from telegram.error import TelegramError, Conflict, NetworkError
+from telegram.constants import ChatAction
+from telegram.error import TelegramError, Conflict, NetworkError, RetryAfter, BadRequest
 from sia.clients.client import SiaClient
 from sia.memory.schemas import SiaMessageGeneratedSchema, SiaMessageSchema
 
@@ -12,13 +15,18 @@ class SiaTelegram(SiaClient):
     platform_name = 'telegram'
     
     
-    def __init__(self, sia, tg_bot_token, chat_id=None, logging_enabled=True):
+    def __init__(self, sia, tg_bot_token, chat_id=None, streaming=None, edit_interval=None, logging_enabled=True):
         super().__init__(client=None)
         self.tg_bot_token = tg_bot_token
         self.bot = Bot(token=self.tg_bot_token)
-        self.application = ApplicationBuilder().token(tg_bot_token).build()
+        # updates are handled concurrently, Sia.generation_slots bounds the LLM calls
+        self.application = ApplicationBuilder().token(tg_bot_token).concurrent_updates(True).build()
         self.chat_id = chat_id  # Set this to the chat ID where you want to post messages
         self.sia = sia
+        # stream responses by editing the reply as tokens arrive, at most one edit per edit_interval seconds
+        self.streaming = streaming if streaming is not None else os.getenv("TELEGRAM_STREAMING", "true").lower() == "true"
+        self.edit_interval = edit_interval if edit_interval is not None else float(os.getenv("TELEGRAM_STREAMING_EDIT_INTERVAL", 1.5))
+        self.final_edit_attempts = 5
         self.logging_enabled = logging_enabled
 
         self.logger = setup_logging()
@@ -52,7 +60,7 @@ class SiaTelegram(SiaClient):
             conversation_id=str(chat_id)
         )
         
-        self.sia.memory.add_message(
+        await self.sia.amemory.add_message(
             message_id=f"{chat_id}-{update.message.message_id}",
             message=message
         )
@@ -71,44 +79,121 @@ class SiaTelegram(SiaClient):
             
             if original_username == self.sia.character.platform_settings.get("telegram", {}).get("username", "<no bot username>"):
 
-                generated_response = self.sia.generate_response(
-                    message=SiaMessageSchema(
-                        id=f"{self.chat_id}-{update.message.message_id}",
-                        **message.dict()
-                    )
-                )
-                
-                if generated_response:
-                
-                    tg_reply_response = await update.message.reply_text(generated_response.content)
-
-                    self.sia.memory.add_message(
-                        message_id=f"{self.chat_id}-{tg_reply_response.message_id}",
-                        message=generated_response
-                    )
+                await self.reply(update, SiaMessageSchema(
+                    id=f"{self.chat_id}-{update.message.message_id}",
+                    **message.dict()
+                ))
 
         # Respond to mentions
         if f"@{context.bot.username}" in message_text:
 
-            generated_response = self.sia.generate_response(
-                message=SiaMessageSchema(
-                    id=f"{self.chat_id}-{update.message.message_id}",
-                    **message.dict()
-                )
-            )
-            
-            if generated_response:
-            
-                tg_reply_response = await update.message.reply_text(generated_response.content)
-
-                self.sia.memory.add_message(
-                    message_id=f"{self.chat_id}-{tg_reply_response.message_id}",
-                    message=generated_response
-                )
+            await self.reply(update, SiaMessageSchema(
+                id=f"{self.chat_id}-{update.message.message_id}",
+                **message.dict()
+            ))
         else:
             print(f"[@{context.bot.username}] No reply to message from {username} (ID: {user_id}) in chat '{chat_title}' (ID: {chat_id}, t.me/{chat_username}), message ID {update.message.message_id}: {message_text}")
     
     
+    async def reply(self, update: Update, message: SiaMessageSchema):
+        """Generate a response to the message, send it as a reply and save it."""
+        if self.streaming:
+            return await self.reply_streaming(update, message)
+
+        generated_response = await self.sia.agenerate_response(message=message)
+        
+        if generated_response:
+        
+            tg_reply_response = await update.message.reply_text(generated_response.content)
+
+            await self.sia.amemory.add_message(
+                message_id=f"{self.chat_id}-{tg_reply_response.message_id}",
+                message=generated_response
+            )
+
+
+    async def reply_streaming(self, update: Update, message: SiaMessageSchema):
+        """
+        Like reply, but the reply is sent with the first tokens and edited as
+        the rest arrives. The response is saved once it is complete.
+
+        A failed edit (rate limit, network error) is skipped: the next edit
+        carries the text, and the final edit is retried up to
+        final_edit_attempts times. The reply is deleted only if the stream fails.
+        """
+        try:
+            await update.message.chat.send_action(ChatAction.TYPING)
+        except TelegramError:
+            pass
+
+        tg_reply_response = None
+        text = ""
+        sent_text = ""
+        next_edit_at = 0
+        failed_edits = 0
+
+        async def edit():
+            nonlocal sent_text, next_edit_at, failed_edits
+            try:
+                await tg_reply_response.edit_text(text)
+                sent_text = text
+            except RetryAfter as e:
+                log_message(self.logger, "info", self, f"Telegram edit rate limit, retrying in {e.retry_after} s")
+                next_edit_at = time.monotonic() + (e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after)
+                return
+            except BadRequest as e:
+                # e.g. "message is not modified"
+                log_message(self.logger, "info", self, f"Telegram edit skipped: {e}")
+                sent_text = text
+            except TelegramError as e:
+                # e.g. NetworkError, TimedOut: a later edit sends the text
+                log_message(self.logger, "warning", self, f"Telegram edit failed: {e}")
+                failed_edits += 1
+            next_edit_at = time.monotonic() + self.edit_interval
+
+        try:
+            async for content in self.sia.astream_response(message=message):
+                text += content
+                if tg_reply_response is None:
+                    tg_reply_response = await update.message.reply_text(text)
+                    sent_text = text
+                    next_edit_at = time.monotonic() + self.edit_interval
+                elif time.monotonic() >= next_edit_at and text.strip() != sent_text.strip():
+                    await edit()
+
+        except Exception as e:
+            log_message(self.logger, "error", self, f"Error streaming the response: {e}")
+            if tg_reply_response is not None:
+                try:
+                    await tg_reply_response.delete()
+                except TelegramError:
+                    pass
+            return
+
+        if tg_reply_response is None:
+            return
+
+        # the final text; failures of intermediate edits do not count against it
+        failed_edits = 0
+        while text.strip() != sent_text.strip() and failed_edits < self.final_edit_attempts:
+            await asyncio.sleep(max(0, next_edit_at - time.monotonic()))
+            await edit()
+        if text.strip() != sent_text.strip():
+            log_message(self.logger, "error", self, f"Could not send the complete response after {failed_edits} attempts, the chat shows part of it")
+
+        await self.sia.amemory.add_message(
+            message_id=f"{self.chat_id}-{tg_reply_response.message_id}",
+            message=SiaMessageGeneratedSchema(
+                platform=message.platform,
+                character=self.sia.character.name,
+                author=self.sia.character.platform_settings.get(message.platform, {}).get("username", self.sia.character.name),
+                content=text,
+                response_to=message.id,
+                conversation_id=message.conversation_id
+            )
+        )
+
+
     def is_time_to_post(self):
         platform_settings = self.sia.character.platform_settings['telegram']
 
@@ -125,35 +210,39 @@ class SiaTelegram(SiaClient):
                 
                 bot_username = self.sia.character.platform_settings.get("telegram", {}).get("username", "<no bot username>")
 
-                post, media = self.sia.generate_post(
+                post, media = await self.sia.anext_post(
                     platform=self.platform_name,
                     author=bot_username,
                     character=self.sia.character.name
                 )
 
-                try:
-                    message_send_response = await self.bot.send_message(chat_id=self.chat_id, text=post.content)
-                    print(f"New message id: {message_send_response.message_id}")
-
-                    self.sia.memory.add_message(
-                        message_id=f"{self.chat_id}-{message_send_response.message_id}",
-                        message=SiaMessageGeneratedSchema(
-                            platform=self.platform_name,
-                            character=self.sia.character.name,
-                            author=bot_username,
-                            content=post.content,
-                            conversation_id=str(self.chat_id)
+                if not post:
+                    log_message(self.logger, "info", self, "No post generated.")
+
+                else:
+                    try:
+                        message_send_response = await self.bot.send_message(chat_id=self.chat_id, text=post.content)
+                        print(f"New message id: {message_send_response.message_id}")
+
+                        await self.sia.amemory.add_message(
+                            message_id=f"{self.chat_id}-{message_send_response.message_id}",
+                            message=SiaMessageGeneratedSchema(
+                                platform=self.platform_name,
+                                character=self.sia.character.name,
+                                author=bot_username,
+                                content=post.content,
+                                conversation_id=str(self.chat_id)
+                            )
                         )
-                    )
-
-                    if media:
-                        print(f"Sending media: {media}")
-                        for media_file in media:
-                            with open(media_file, 'rb') as photo_file:
-                                await self.bot.send_photo(chat_id=self.chat_id, photo=photo_file)
-                    print("Post sent successfully!")
-                except TelegramError as e:
-                    print(f"Failed to send post: {e}")
+
+                        if media:
+                            print(f"Sending media: {media}")
+                            for media_file in media:
+                                with open(media_file, 'rb') as photo_file:
+                                    await self.bot.send_photo(chat_id=self.chat_id, photo=photo_file)
+                        print("Post sent successfully!")
+                    except TelegramError as e:
+                        print(f"Failed to send post: {e}")
             post_frequency_hours = self.sia.character.platform_settings.get("telegram", {}).get("post_frequency", 2)
             await asyncio.sleep(post_frequency_hours * 3600)  # Wait for the specified number of hours
 
@@ -0,0 +1,153 @@
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import tweepy
+from tweepy.errors import TooManyRequests, HTTPException
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+# call priorities, most urgent first
+PRIORITY_PUBLISH = 0
+PRIORITY_REPLY = 1
+PRIORITY_SEARCH = 2
+
+# (header prefix, window name, window length in seconds) of the limits reported by the Twitter API
+LIMIT_HEADERS = (
+    ("x-rate-limit", "15min", 15 * 60),
+    ("x-app-limit-24hour", "app-24h", 24 * 3600),
+    ("x-user-limit-24hour", "user-24h", 24 * 3600),
+)
+
+ID_SEGMENT_RE = re.compile(r"/\d+(?=/|$)")
+
+_priority = contextvars.ContextVar("sia_twitter_priority", default=PRIORITY_SEARCH)
+
+
+class SiaRateLimited(Exception):
+    """A call was not made because its endpoint is rate limited; retry after retry_after seconds."""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"{endpoint} is rate limited, retry in {retry_after:.0f} s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def endpoint_of(method: str, route: str) -> str:
+    """"GET /2/users/123/mentions" -> "GET /2/users/:id/mentions": ids share the limit of their endpoint."""
+    return f"{method} {ID_SEGMENT_RE.sub('/:id', route)}"
+
+
+class SiaTwitterRateLimits:
+    """
+    Token buckets of the Twitter API endpoints, filled from the x-rate-limit-*
+    (15 minute window) and x-app-limit-24hour-* / x-user-limit-24hour-*
+    response headers.
+
+    acquire never sleeps: it takes a token, or returns how long the caller has
+    to defer the call. A call of priority p leaves p tokens of every bucket to
+    more urgent calls, so searches cannot use up the capacity that publishing
+    needs, and replies leave the last tweet of a window to scheduled posts.
+    Endpoints without headers yet are not limited.
+    """
+
+    def __init__(self, clock=time.time, logging_enabled: bool = True):
+        self.clock = clock
+        # (endpoint, window) -> {"limit", "remaining", "reset_at", "length"}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    @staticmethod
+    @contextmanager
+    def priority(priority: int):
+        """Priority of the calls made in this context (and in threads started with asyncio.to_thread from it)."""
+        token = _priority.set(priority)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+
+    @classmethod
+    def call(cls, priority: int, fn, *args, **kwargs):
+        with cls.priority(priority):
+            return fn(*args, **kwargs)
+
+
+    def acquire(self, endpoint: str, priority: int = None) -> float:
+        """Take a token for a call; 0 if granted, otherwise the seconds to wait before retrying."""
+        priority = _priority.get() if priority is None else priority
+        now = self.clock()
+        with self._lock:
+            buckets = [bucket for (bucket_endpoint, _), bucket in self._buckets.items() if bucket_endpoint == endpoint]
+            for bucket in buckets:
+                if bucket["reset_at"] <= now:
+                    # refilled until the next response tells better
+                    bucket["remaining"] = bucket["limit"]
+                    bucket["reset_at"] += bucket["length"] * ((now - bucket["reset_at"]) // bucket["length"] + 1)
+            waits = [bucket["reset_at"] - now for bucket in buckets if bucket["remaining"] <= priority]
+            if waits:
+                return max(max(waits), 1)
+            for bucket in buckets:
+                bucket["remaining"] -= 1
+            return 0
+
+
+    def update(self, endpoint: str, headers) -> None:
+        """Set the buckets of an endpoint from the headers of one of its responses."""
+        with self._lock:
+            for prefix, window, length in LIMIT_HEADERS:
+                try:
+                    limit = int(headers[f"{prefix}-limit"])
+                    remaining = int(headers[f"{prefix}-remaining"])
+                    reset_at = float(headers[f"{prefix}-reset"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                self._buckets[(endpoint, window)] = {"limit": limit, "remaining": remaining, "reset_at": reset_at, "length": length}
+
+
+    def status(self) -> dict:
+        with self._lock:
+            return {f"{endpoint} [{window}]": dict(bucket) for (endpoint, window), bucket in self._buckets.items()}
+
+
+class SiaRateLimitedClient(tweepy.Client):
+    """
+    tweepy.Client going through SiaTwitterRateLimits: calls to a limited
+    endpoint raise SiaRateLimited instead of sleeping (wait_on_rate_limit is
+    off), and every response updates the limits of its endpoint.
+    """
+
+    def __init__(self, *args, rate_limits: SiaTwitterRateLimits = None, **kwargs):
+        kwargs["wait_on_rate_limit"] = False
+        super().__init__(*args, **kwargs)
+        self.rate_limits = rate_limits or SiaTwitterRateLimits()
+
+
+    def request(self, method, route, params=None, json=None, user_auth=False):
+        endpoint = endpoint_of(method, route)
+        retry_after = self.rate_limits.acquire(endpoint)
+        if retry_after:
+            raise SiaRateLimited(endpoint, retry_after)
+
+        try:
+            response = super().request(method, route, params=params, json=json, user_auth=user_auth)
+        except TooManyRequests as e:
+            self.rate_limits.update(endpoint, e.response.headers)
+            reset = e.response.headers.get("x-rate-limit-reset")
+            log_message(self.rate_limits.logger, "info", self, f"{endpoint} returned 429")
+            raise SiaRateLimited(endpoint, max(float(reset) - self.rate_limits.clock(), 1) if reset else 60) from e
+        except HTTPException as e:
+            if e.response is not None:
+                self.rate_limits.update(endpoint, e.response.headers)
+            raise
+
+        self.rate_limits.update(endpoint, response.headers)
+        return response
@@ -1,31 +1,52 @@
 import os
+import asyncio
+import contextvars
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import json
 import time
 import random
 from datetime import datetime
+from collections import deque
 
 import tweepy
 from tweepy import Tweet, Forbidden
 
 from sia.clients.client import SiaClient
-from sia.memory.schemas import SiaMessageGeneratedSchema, SiaMessageSchema
+from sia.clients.twitter.rate_limits import (
+    SiaRateLimitedClient, SiaTwitterRateLimits, SiaRateLimited,
+    PRIORITY_PUBLISH, PRIORITY_REPLY, PRIORITY_SEARCH
+)
+from sia.memory.schemas import SiaMessageGeneratedSchema, SiaMessageSchema, SiaMessageRow
 from sia.memory.memory import SiaMemory
 from sia.character import SiaCharacter
 from utils.logging_utils import setup_logging, log_message, enable_logging
 
 from langchain.prompts import ChatPromptTemplate
 
+# files above this size (bytes) are uploaded in chunks, as are GIFs and videos
+MEDIA_CHUNKED_THRESHOLD = 5 * 1024 * 1024
+# uploaded media can be attached to tweets for 24 hours; reuse them a bit less long
+MEDIA_ID_TTL = 23 * 3600
+
+# rate limit bucket of v1.1 media uploads (chunked uploads share it)
+MEDIA_UPLOAD_ENDPOINT = "POST /1.1/media/upload.json"
+
+
 class SiaTwitterOfficial(SiaClient):
     
     def __init__(self, api_key, api_secret_key, access_token, access_token_secret, bearer_token, sia = None, character: SiaCharacter = None, memory: SiaMemory = None, logging_enabled=True):
         super().__init__(
-            client=tweepy.Client(
+            # rate limited calls raise SiaRateLimited and are deferred by the caller, see rate_limits
+            client=SiaRateLimitedClient(
                 consumer_key=api_key, consumer_secret=api_secret_key,
                 access_token=access_token, access_token_secret=access_token_secret,
                 bearer_token=bearer_token,
-                wait_on_rate_limit=True
+                rate_limits=SiaTwitterRateLimits(logging_enabled=logging_enabled)
             )
         )
+        self.rate_limits = self.client.rate_limits
 
         self.logger = setup_logging()
         enable_logging(logging_enabled)
@@ -38,16 +59,33 @@ class SiaTwitterOfficial(SiaClient):
         self.character = character
         self.sia = sia
 
+        # one v1 client for media uploads, and media ids by content hash, see upload_media
+        self._api_v1 = None
+        self._media_ids = {}
+        self._media_lock = threading.Lock()
+
+        # mention ingestion, see get_new_replies_to_my_tweets
+        self.mentions_page_size = int(os.getenv("TWITTER_MENTIONS_PAGE_SIZE", 100))
+        self.mentions_max_pages = int(os.getenv("TWITTER_MENTIONS_MAX_PAGES", 10))
+
+        # scheduler cadences (seconds), see run
+        self.mentions_interval = (70, 90)
+        self.reply_spacing = (70, 90)
+        self.reply_workers = 2
+        # replies generated ahead of publishing, see reply_task
+        self.max_drafts = int(os.getenv("TWITTER_REPLY_MAX_DRAFTS", 4))
+        self.post_retry_interval = 60
+        self.forbidden_backoff = 600
+        self.settings_recheck_interval = 300
+        self._loop = None
+        self._tasks = []
+        self._stopping = False
+        self._reschedule = None
+
 
     def publish_post(self, post:SiaMessageGeneratedSchema, media:dict=[], in_reply_to_tweet_id:str=None) -> str:
         
-        media_ids = None
-        if media:
-            media_ids = []
-            for m in media:
-                media_ids.append(
-                    self.upload_media(m)
-                )
+        media_ids = self.upload_media_files(media) if media else None
         
         try:
             print(f"post: {post}")
@@ -62,199 +100,473 @@ class SiaTwitterOfficial(SiaClient):
             )
             print(f"Tweet sent successfully!: {response}")
             return response.data['id']
+        except SiaRateLimited:
+            raise
         except Exception as e:
             print(f"Failed to send tweet: {e}")
             print(f"Response headers: {e.response.headers}")
 
 
-    def upload_media(self, media_filepath):
-        auth = tweepy.OAuth1UserHandler(self.api_key, self.api_secret_key)
-        auth.set_access_token(
-            self.access_token,
-            self.access_token_secret,
-        )
-        client_v1 = tweepy.API(auth)
+    @property
+    def api_v1(self) -> tweepy.API:
+        """v1.1 API client (media upload is not available in v2), created once."""
+        if self._api_v1 is None:
+            with self._media_lock:
+                if self._api_v1 is None:
+                    auth = tweepy.OAuth1UserHandler(self.api_key, self.api_secret_key)
+                    auth.set_access_token(
+                        self.access_token,
+                        self.access_token_secret,
+                    )
+                    self._api_v1 = tweepy.API(auth)
+        return self._api_v1
+
+
+    @staticmethod
+    def media_hash(media_filepath) -> str:
+        digest = hashlib.sha256()
+        with open(media_filepath, "rb") as media_file:
+            for block in iter(lambda: media_file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
 
-        media = client_v1.media_upload(filename=media_filepath)
+    def upload_media(self, media_filepath):
+        """
+        Upload a file and return its media id. Large files, GIFs and videos are
+        uploaded in chunks. A file with the same content uploaded less than
+        MEDIA_ID_TTL seconds ago is not uploaded again.
+        """
+        content_hash = self.media_hash(media_filepath)
+        with self._media_lock:
+            cached = self._media_ids.get(content_hash)
+            if cached and cached[1] > time.time():
+                log_message(self.logger, "info", self, f"Reusing media id {cached[0]} for {media_filepath}")
+                return cached[0]
+
+        chunked = os.path.getsize(media_filepath) > MEDIA_CHUNKED_THRESHOLD or media_filepath.lower().endswith((".gif", ".mp4", ".mov"))
+        retry_after = self.rate_limits.acquire(MEDIA_UPLOAD_ENDPOINT)
+        if retry_after:
+            raise SiaRateLimited(MEDIA_UPLOAD_ENDPOINT, retry_after)
+        try:
+            media = self.api_v1.media_upload(filename=media_filepath, chunked=chunked)
+        except tweepy.TooManyRequests as e:
+            self.rate_limits.update(MEDIA_UPLOAD_ENDPOINT, e.response.headers)
+            reset = e.response.headers.get("x-rate-limit-reset")
+            raise SiaRateLimited(MEDIA_UPLOAD_ENDPOINT, max(float(reset) - time.time(), 1) if reset else 60) from e
+        if self.api_v1.last_response is not None:
+            self.rate_limits.update(MEDIA_UPLOAD_ENDPOINT, self.api_v1.last_response.headers)
+
+        expires_after = getattr(media, "expires_after_secs", None)
+        ttl = min(MEDIA_ID_TTL, expires_after - 600) if expires_after else MEDIA_ID_TTL
+        with self._media_lock:
+            now = time.time()
+            self._media_ids = {key: value for key, value in self._media_ids.items() if value[1] > now}
+            self._media_ids[content_hash] = (media.media_id, now + ttl)
         
         return media.media_id
 
 
+    def upload_media_files(self, media: list) -> list:
+        """Upload the attachments of a tweet concurrently; media ids are in the order of the files."""
+        if len(media) == 1:
+            return [self.upload_media(media[0])]
+        # executor threads do not inherit the caller's context (and its rate limit priority)
+        contexts = [contextvars.copy_context() for _ in media]
+        with ThreadPoolExecutor(max_workers=min(len(media), 4), thread_name_prefix="sia-media") as executor:
+            return list(executor.map(lambda context, media_filepath: context.run(self.upload_media, media_filepath), contexts, media))
+
+
     def get_my_tweet_ids(self):
         log_message(self.logger, "info", self, f"Getting my tweet ids for {self.character.twitter_username}")
-        my_tweets = self.memory.get_messages(platform="twitter", author=self.character.twitter_username)
+        my_tweets = self.memory.get_messages(platform="twitter", author=self.character.twitter_username, fields=["id"])
         return [tweet.id for tweet in my_tweets]
     
     
     def get_last_retrieved_reply_id(self):
-        replies = self.memory.get_messages(platform="twitter", not_author=self.character.name)
-        if replies:
-            return max(replies, key=lambda reply: reply.id).id
+        cursor = self.memory.get_ingestion_cursor(platform="twitter")
+        if cursor:
+            return cursor.last_id
 
+        # no cursor yet: start from the newest mention already stored
+        last_id = self.memory.get_latest_message_id(platform="twitter", not_author=self.character.twitter_username)
+        if last_id:
+            self.memory.advance_ingestion_cursor(platform="twitter", last_id=last_id)
+        return last_id
 
-    def get_new_replies_to_my_tweets(self) -> list[SiaMessageSchema]:
-        since_id = self.get_last_retrieved_reply_id()
-        log_message(self.logger, "info", self, f"since_id: {since_id}")
 
-        messages = []
-        
-        try:
-            new_replies_to_my_tweets = self.client.search_recent_tweets(
-                query=f"to:{self.character.twitter_username} OR @{self.character.twitter_username}",
-                since_id=since_id,
-                tweet_fields=["conversation_id","created_at","in_reply_to_user_id"],
-                expansions=["author_id","referenced_tweets.id"]
-            )
-        except Exception as e:
-            log_message(self.logger, "error", self, f"Error getting replies: {e}")
+    def _store_mentions_page(self, page) -> list[SiaMessageSchema]:
+        """Moderate and store one page of search results; returns the newly stored mentions."""
+        if not page.data:
             return []
-        
-        if not new_replies_to_my_tweets.data:
-            return []
-        
-        for reply in new_replies_to_my_tweets.data:
+
+        # exclude replies from the character itself
+        replies = []
+        for reply in page.data:
             
             log_message(self.logger, "info", self, f"processing new mention: {reply}")
             
-            # exclude replies from the character itself
-            author = next((user.username for user in new_replies_to_my_tweets.includes['users'] if user.id == reply.author_id), None)
+            author = next((user.username for user in page.includes['users'] if user.id == reply.author_id), None)
             log_message(self.logger, "info", self, f"author of the received reply: {author}")
             if author == self.character.twitter_username:
                 continue
-            
+            replies.append((reply, author))
+
+        # moderate the whole page in one request
+        flags = self.sia.moderator.moderate([reply.text for reply, _ in replies])
+
+        new_messages = []
+        for (reply, author), flagged in zip(replies, flags):
+            new_messages.append((
+                str(reply.id),
+                SiaMessageGeneratedSchema(
+                    conversation_id=str(reply.data['conversation_id']),
+                    content=reply.text,
+                    platform="twitter",
+                    author=author,
+                    response_to=str(next((ref.id for ref in reply.referenced_tweets if ref.type == "replied_to"), None)) if reply.referenced_tweets else None,
+                    flagged=int(flagged)
+                ),
+                reply.data
+            ))
+
+        # store the whole page at once, skipping mentions stored before
+        return self.memory.add_messages(new_messages)
+
+
+    def get_new_replies_to_my_tweets(self) -> list[SiaMessageSchema]:
+        """
+        Ingest the mentions received since the ingestion cursor, mentions_page_size
+        per page, newest first. Every page is stored as soon as it arrives.
+
+        At most mentions_max_pages pages are read per call. A larger backlog is
+        resumed on the next call from the next_token saved in the cursor; the
+        cursor's last_id moves past the backlog once its last page is stored.
+        """
+        since_id = self.get_last_retrieved_reply_id()
+        cursor = self.memory.get_ingestion_cursor(platform="twitter")
+        next_token = cursor.next_token if cursor else None
+        backlog_newest_id = cursor.backlog_newest_id if cursor else None
+        backlog_saved = bool(next_token or backlog_newest_id)
+        log_message(self.logger, "info", self, f"since_id: {since_id}, next_token: {next_token}")
+
+        messages = []
+        for _ in range(self.mentions_max_pages):
             try:
-                from openai import OpenAI
-                client = OpenAI()
-                moderation_response = client.moderations.create(
-                    model="omni-moderation-latest",
-                    input=reply.text,
+                page = self.rate_limits.call(PRIORITY_SEARCH, self.client.search_recent_tweets,
+                    query=f"to:{self.character.twitter_username} OR @{self.character.twitter_username}",
+                    since_id=since_id,
+                    max_results=self.mentions_page_size,
+                    tweet_fields=["conversation_id","created_at","in_reply_to_user_id"],
+                    expansions=["author_id","referenced_tweets.id"],
+                    **({"next_token": next_token} if next_token else {})
                 )
-                flagged = moderation_response.results[0].flagged
-                if flagged:
-                    log_message(self.logger, "info", self, f"flagged reply: {reply.text}")
+            except SiaRateLimited as e:
+                # the saved backlog is resumed on a later poll
+                log_message(self.logger, "info", self, f"Not reading more mentions: {e}")
+                return messages
+            except tweepy.BadRequest as e:
+                log_message(self.logger, "error", self, f"Error getting replies: {e}")
+                if next_token:
+                    # the pagination token has expired: the backlog is read again from the start, stored mentions are skipped
+                    self.memory.update_ingestion_backlog("twitter", None, None)
+                return messages
             except Exception as e:
-                log_message(self.logger, "error", self, f"Error moderating reply: {e}")
-                flagged = False
+                log_message(self.logger, "error", self, f"Error getting replies: {e}")
+                return messages
 
             try:
-                message = self.memory.add_message(
-                    message_id=str(reply.id),
-                    message=SiaMessageGeneratedSchema(
-                        conversation_id=str(reply.data['conversation_id']),
-                        content=reply.text,
-                        platform="twitter",
-                        author=next(user.username for user in new_replies_to_my_tweets.includes['users'] if user.id == reply.author_id),
-                        response_to=str(next((ref.id for ref in reply.referenced_tweets if ref.type == "replied_to"), None)) if reply.referenced_tweets else None,
-                        wen_posted=reply.created_at,
-                        flagged=int(flagged),
-                        metadata=moderation_response
-                    ),
-                    original_data=reply.data
-                )
-                messages.append(message)
+                messages += self._store_mentions_page(page)
             except Exception as e:
-                log_message(self.logger, "error", self, f"Error adding message: {e}")
-
+                log_message(self.logger, "error", self, f"Error adding messages: {e}")
+                return messages
+
+            meta = page.meta or {}
+            # the first page holds the newest tweets, including the character's own
+            backlog_newest_id = backlog_newest_id or meta.get("newest_id") or (str(max(page.data, key=lambda reply: int(reply.id)).id) if page.data else None)
+            next_token = meta.get("next_token")
+
+            if not next_token:
+                # the backlog is drained: move the watermark past everything received
+                if backlog_newest_id:
+                    self.memory.advance_ingestion_cursor(platform="twitter", last_id=str(backlog_newest_id))
+                if backlog_saved:
+                    self.memory.update_ingestion_backlog("twitter", None, None)
+                return messages
+
+            self.memory.update_ingestion_backlog("twitter", next_token, str(backlog_newest_id) if backlog_newest_id else None)
+            backlog_saved = True
+
+        log_message(self.logger, "info", self, f"Read {self.mentions_max_pages} pages of mentions, the rest of the backlog is read on the next poll")
         return messages
 
 
-    def get_conversation(self, conversation_id: str) -> list[SiaMessageSchema]:
-        messages = self.memory.get_messages(conversation_id=conversation_id, sort_by="wen_posted", sort_order="asc", flagged=False)
+    def get_conversation(self, conversation_id: str, fields: list[str] = None) -> list[SiaMessageSchema]|list[SiaMessageRow]:
+        messages = self.memory.get_messages(conversation_id=conversation_id, sort_by="wen_posted", sort_order="asc", flagged=False, fields=fields)
         return messages
 
 
 
+    @staticmethod
+    def created_at(message: SiaMessageSchema) -> datetime:
+        """When a stored tweet was created (local time), from its original data; wen_posted if unknown."""
+        try:
+            return datetime.fromisoformat(message.original_data["created_at"]).astimezone().replace(tzinfo=None)
+        except (TypeError, KeyError, ValueError):
+            return message.wen_posted
+
+
     async def run(self):
+        """
+        Run the Twitter client as independent asyncio tasks:
+
+        - posting: a timer that fires at twitter.next_post_time;
+        - mention polling: every mentions_interval seconds, new mentions are
+          added to the reply queue (SiaMemory.reply_queue), which persists them
+          with a priority;
+        - reply generation: reply_workers tasks generate drafts for the queued
+          mentions with the highest priority, up to max_drafts ahead of publishing;
+        - publishing: the best draft is tweeted whenever pacing allows, one at a
+          time, reply_spacing seconds apart and at most
+          responding.responses_an_hour an hour.
+
+        Generation does not wait for pacing, only for a free draft slot. Queued
+        mentions and drafts survive restarts.
+
+        Blocking calls (Twitter API, database) run in worker threads. Cancelling
+        run (or calling stop) stops all the tasks.
+        """
 
         if not self.character.platform_settings.get("twitter", {}).get("enabled", True):
             return
-        
-        while 1:
 
-            character_settings = self.memory.get_character_settings()
-            
-            next_post_time = character_settings.character_settings.get('twitter', {}).get('next_post_time', 0)
-            next_post_datetime = datetime.fromtimestamp(next_post_time).strftime('%Y-%m-%d %H:%M:%S') if next_post_time else "N/A"
-            now_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            print(f"Current time: {now_time}")
-            next_post_time_seconds = next_post_time - time.time()
-            next_post_hours = next_post_time_seconds // 3600
-            next_post_minutes = (next_post_time_seconds % 3600) // 60
-            print(f"Next post time: {next_post_datetime} (posting in {next_post_hours}h {next_post_minutes}m)")
-            
-            
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._reschedule = asyncio.Event()
+        # wake up the workers: mentions were queued, a draft is ready, a draft was consumed
+        self._queued = asyncio.Event()
+        self._drafted = asyncio.Event()
+        self._published = asyncio.Event()
+        self._generating = 0
+        self._sent_at = deque()
+
+        # generations interrupted by the last stop are queued again
+        recovered = await asyncio.to_thread(self.sia.memory.reply_queue.recover, "twitter")
+        if recovered:
+            log_message(self.logger, "info", self, f"Queued {recovered} interrupted replies again")
+
+        tasks = [asyncio.create_task(self.posting_task(), name="twitter-posting")]
+        if self.character.responding.get("enabled", True):
+            tasks.append(asyncio.create_task(self.mentions_task(), name="twitter-mentions"))
+            tasks += [asyncio.create_task(self.reply_task(), name=f"twitter-reply-{i}") for i in range(self.reply_workers)]
+            tasks.append(asyncio.create_task(self.publishing_task(), name="twitter-publishing"))
+        self._tasks = tasks
 
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # stop() cancels the tasks; anything else cancelling run is propagated
+            if not self._stopping:
+                raise
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            log_message(self.logger, "info", self, "Twitter client stopped")
+
+
+    def stop(self):
+        """Stop run(); safe to call from any thread."""
+        if self._loop and self._tasks:
+            self._stopping = True
+            for task in self._tasks:
+                self._loop.call_soon_threadsafe(task.cancel)
+
+
+    def reschedule(self):
+        """Re-read twitter.next_post_time now (e.g. after it was changed); safe to call from any thread."""
+        if self._loop and self._reschedule:
+            self._loop.call_soon_threadsafe(self._reschedule.set)
+
+
+    async def _sleep(self, seconds: float, event: asyncio.Event = None):
+        """Sleep for seconds, or until event is set."""
+        if event is None:
+            await asyncio.sleep(max(0, seconds))
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout=max(0, seconds))
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
 
-            
-            # posting
-            #   new tweet
-            if time.time() > next_post_time:
-                
-                
-                post, media = self.sia.generate_post(
+
+    async def _publish_deferred(self, priority: int, post: SiaMessageGeneratedSchema, media: list = [], in_reply_to_tweet_id: str = None) -> str:
+        """publish_post in a worker thread; while the endpoints it needs are rate limited, retry when they reset without blocking other tasks."""
+        while True:
+            try:
+                return await asyncio.to_thread(self.rate_limits.call, priority, self.publish_post, post, media, in_reply_to_tweet_id)
+            except SiaRateLimited as e:
+                log_message(self.logger, "info", self, f"Deferring a tweet: {e}")
+                await self._sleep(e.retry_after)
+
+
+    async def _retry_until_done(self, action: str, step):
+        """Await step() until it succeeds, every post_retry_interval seconds (for bookkeeping after a tweet was published)."""
+        while True:
+            try:
+                return await step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error {action}, retrying: {e}")
+                await self._sleep(self.post_retry_interval)
+
+
+    async def posting_task(self):
+        while True:
+            try:
+                next_post_time = await asyncio.to_thread(self.sia.memory.settings.get, "twitter.next_post_time", 0)
+                wait = next_post_time - time.time()
+                if wait > 0:
+                    log_message(self.logger, "info", self, f"Next post at {datetime.fromtimestamp(next_post_time).strftime('%Y-%m-%d %H:%M:%S')} (in {int(wait // 3600)}h {int(wait % 3600 // 60)}m)")
+                    # wake up early now and then: next_post_time may be changed in the database
+                    await self._sleep(min(wait, self.settings_recheck_interval), self._reschedule)
+                    continue
+
+                post, media = await self.sia.anext_post(
                     platform="twitter",
                     author=self.character.twitter_username,
                     character=self.character.name
                 )
-                
-                if post or media:
-                    print(f"Generated post: {len(post.content)} characters")
-                    tweet_id = self.publish_post(post, media)
-                    if tweet_id and tweet_id is not Forbidden:
-                        self.memory.add_message(message_id=tweet_id, message=post)
-
-                        character_settings.character_settings = {
-                            "twitter": {
-                                "next_post_time": time.time() + self.character.platform_settings.get("twitter", {}).get("post_frequency", 2) * 3600
-                            }
-                        }
-                        self.memory.update_character_settings(character_settings)
-                else:
+                if not post:
                     log_message(self.logger, "info", self, "No post or media generated.")
-
-                time.sleep(30)
+                    await self._sleep(self.post_retry_interval)
+                    continue
+
+                print(f"Generated post: {len(post.content)} characters")
+                tweet_id = await self._publish_deferred(PRIORITY_PUBLISH, post, media)
+                if not tweet_id:
+                    await self._sleep(self.post_retry_interval)
+                    continue
+
+                # the tweet is out: from here on a failure must not send the loop back to generating and publishing
+                next_post_time = time.time() + self.character.platform_settings.get("twitter", {}).get("post_frequency", 2) * 3600
+                await self._retry_until_done("scheduling the next post", lambda: asyncio.to_thread(self.sia.memory.settings.patch, {"twitter.next_post_time": next_post_time}))
+                await self._retry_until_done(f"storing tweet {tweet_id}", lambda: self.sia.amemory.add_message(message_id=tweet_id, message=post))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error posting: {e}")
+                await self._sleep(self.post_retry_interval)
 
 
-            # replying
-            #   to new replies
-            
-            replies_sent = 0
-            
-            if self.character.responding.get("enabled", True):
+    async def mentions_task(self):
+        while True:
+            try:
                 print("Checking for new replies...")
-                replies = self.get_new_replies_to_my_tweets()
-                if replies:
-                    
-                    # randomize the order of replies
-                    replies.sort(key=lambda x: random.random())
-                    
-                    for r in replies:
-                        
-                        max_responses_an_hour = character_settings.character_settings.get("responding", {}).get("responses_an_hour", 3)
-                        log_message(self.logger, "info", self, f"Replies sent during this hour: {replies_sent}, max allowed: {max_responses_an_hour}")
-                        if replies_sent >= max_responses_an_hour:
-                            break
-
-                        print(f"Reply: {r}")
-                        if r.flagged:
-                            print(f"Skipping flagged reply: {r}")
-                            continue
-                        generated_response = self.sia.generate_response(r)
-                        if not generated_response:
-                            print(f"No response generated for reply: {r}")
-                            continue
-                        print(f"Generated response: {len(generated_response.content)} characters")
-                        tweet_id = self.sia.twitter.publish_post(post=generated_response, in_reply_to_tweet_id=r.id)
-                        self.memory.add_message(message_id=tweet_id, message=generated_response)
-                        replies_sent += 1
-                        if isinstance(tweet_id, Forbidden):
-                            print(f"\n\nFailed to send reply: {tweet_id}. Sleeping for 10 minutes.\n\n")
-                            time.sleep(600)
-                        time.sleep(random.randint(70, 90))
-                else:
+                replies = await asyncio.to_thread(self.get_new_replies_to_my_tweets)
+                replies = [r for r in replies if not r.flagged]
+                if not replies:
                     print("No new replies yet.")
-                print("\n\n")
+                # recency is counted from the tweet's creation, not from its ingestion
+                replies = [r.model_copy(update={"wen_posted": self.created_at(r)}) for r in replies]
+                queued = await asyncio.to_thread(self.sia.memory.reply_queue.push, "twitter", replies, self.character.twitter_username)
+                if queued:
+                    self._queued.set()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error polling mentions: {e}")
+            await self._sleep(random.uniform(*self.mentions_interval))
+
 
-            time.sleep(random.randint(70, 90))
+    async def reply_task(self):
+        reply_queue = self.sia.memory.reply_queue
+        while True:
+            # reserve a draft slot before awaiting anything: workers checking the
+            # count concurrently could otherwise all pass it
+            self._generating += 1
+            item = None
+            try:
+                drafted = await asyncio.to_thread(reply_queue.drafted_count, "twitter")
+                if drafted + self._generating > self.max_drafts:
+                    wait = (self.settings_recheck_interval, self._published)
+                else:
+                    item = await asyncio.to_thread(reply_queue.claim, "twitter")
+                    wait = (self.settings_recheck_interval, self._queued)
+            except asyncio.CancelledError:
+                self._generating -= 1
+                raise
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error reading the reply queue: {e}")
+                wait = (self.post_retry_interval, None)
 
+            if item is None:
+                # nothing to generate: release the slot while waiting
+                self._generating -= 1
+                await self._sleep(*wait)
+                continue
 
+            # an item claimed when the client stops stays "generating" until recover() on the next run
+            try:
+                r = (await self.sia.amemory.get_messages(id=item.message_id, platform="twitter") or [None])[0]
+                print(f"Reply: {r}")
+                generated_response = await self.sia.agenerate_response(r) if r else None
+                if not generated_response:
+                    print(f"No response generated for reply: {item.message_id}")
+                else:
+                    print(f"Generated response: {len(generated_response.content)} characters")
+                await asyncio.to_thread(reply_queue.save_draft, item.id, generated_response)
+                if generated_response:
+                    self._drafted.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error generating a reply to {item.message_id}: {e}")
+                await asyncio.to_thread(reply_queue.fail, item.id, str(e))
+            finally:
+                self._generating -= 1
+
+
+    async def _wait_for_hourly_limit(self):
+        while True:
+            max_responses_an_hour = await asyncio.to_thread(self.sia.memory.settings.get, "responding.responses_an_hour", 3)
+            while self._sent_at and self._sent_at[0] < time.time() - 3600:
+                self._sent_at.popleft()
+            log_message(self.logger, "info", self, f"Replies sent during the last hour: {len(self._sent_at)}, max allowed: {max_responses_an_hour}")
+            if len(self._sent_at) < max_responses_an_hour:
+                return
+            await self._sleep(self._sent_at[0] + 3600 - time.time() if self._sent_at else self.post_retry_interval)
+
+
+    async def publishing_task(self):
+        reply_queue = self.sia.memory.reply_queue
+        while True:
+            await self._wait_for_hourly_limit()
+            try:
+                draft = await asyncio.to_thread(reply_queue.next_draft, "twitter")
+                if draft is None:
+                    await self._sleep(self.settings_recheck_interval, self._drafted)
+                    continue
+                item, generated_response = draft
+
+                tweet_id = await self._publish_deferred(PRIORITY_REPLY, generated_response, [], item.message_id)
+                if not tweet_id or isinstance(tweet_id, Forbidden):
+                    print(f"\n\nFailed to send reply: {tweet_id}. Sleeping for {self.forbidden_backoff} seconds.\n\n")
+                    await asyncio.to_thread(reply_queue.fail, item.id, f"not published: {tweet_id}")
+                    self._queued.set()
+                    await self._sleep(self.forbidden_backoff)
+                    continue
+                self._sent_at.append(time.time())
+                self._published.set()
+                # the item stays publishing (never taken again) until it is marked sent
+                await self._retry_until_done(f"marking reply {tweet_id} sent", lambda: asyncio.to_thread(reply_queue.mark_sent, item.id, tweet_id))
+                await self._retry_until_done(f"storing reply {tweet_id}", lambda: self.sia.amemory.add_message(message_id=tweet_id, message=generated_response))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error publishing a reply: {e}")
+            await self._sleep(random.uniform(*self.reply_spacing))
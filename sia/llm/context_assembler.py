@@ -0,0 +1,182 @@
+import os
+import threading
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+# default prompt token budgets per call type, overridable with LLM_PROMPT_BUDGET_<CALL>, e.g. LLM_PROMPT_BUDGET_RESPONSE=2000
+DEFAULT_BUDGETS = {
+    "post": 6000,
+    "response": 3000,
+    "news": 3000,
+}
+
+# chars per token when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+class SiaTokenCounter:
+    """
+    Counts tokens with tiktoken's cl100k_base encoding, a close enough
+    approximation for both Claude and GPT-4o for budgeting purposes.
+    tiktoken downloads the encoding on first use; if it is not installed or the
+    download fails, counts fall back to len(text) / CHARS_PER_TOKEN (logged once).
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", logging_enabled: bool = True):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        self._encoding = None
+                        log_message(self.logger, "warning", self, f"tiktoken encoding {self.encoding_name} unavailable ({e}), token counts are estimated from text length")
+                    self._loaded = True
+        return self._encoding
+
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(text) // CHARS_PER_TOKEN + 1
+
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The beginning of text, at most max_tokens long."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+class SiaContextSection:
+    """
+    One input of a prompt.
+
+    value: a string, or a list of items (examples, posts, conversation lines).
+    priority: sections with higher priority get their tokens first.
+    drop: which items go first when a list does not fit: "last" (e.g. examples
+    picked at random) or "first" (e.g. the oldest conversation lines).
+    keep_first: leading items that are kept whenever possible (e.g. the root post of a conversation).
+    joiner: if set, the kept items are joined into one string.
+    """
+
+    def __init__(self, name: str, value: str|list, priority: int = 0, drop: str = "last", keep_first: int = 0, joiner: str = None):
+        self.name = name
+        self.value = value
+        self.priority = priority
+        self.drop = drop
+        self.keep_first = keep_first
+        self.joiner = joiner
+
+
+class SiaContextAssembler:
+    """
+    Fits prompt inputs into a per-call token budget.
+
+    The fixed part of the prompt (the template) is counted first; the remaining
+    tokens go to the sections in order of priority. A list section keeps as many
+    items as fit, dropping items from its `drop` end; a string section that does
+    not fit is cut. Lower-priority sections get what is left, possibly nothing.
+
+    Every call returns the inputs and a report with the tokens used per section,
+    which is also logged, so budgets can be tuned against time-to-first-token.
+    """
+
+    def __init__(self, budgets: dict[str, int] = None, counter: SiaTokenCounter = None, logging_enabled: bool = True):
+        self.budgets = dict(DEFAULT_BUDGETS)
+        for call in self.budgets:
+            value = os.getenv(f"LLM_PROMPT_BUDGET_{call.upper()}")
+            if value:
+                self.budgets[call] = int(value)
+        self.budgets.update(budgets or {})
+        self.counter = counter or SiaTokenCounter(logging_enabled=logging_enabled)
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    def template_tokens(self, prompt_template) -> int:
+        """Tokens of the fixed text of a ChatPromptTemplate (placeholders included, they are short)."""
+        tokens = 0
+        for message in getattr(prompt_template, "messages", []):
+            template = getattr(getattr(message, "prompt", None), "template", None)
+            if template:
+                tokens += self.counter.count(template)
+        template = getattr(prompt_template, "template", None)
+        if isinstance(template, str):
+            tokens += self.counter.count(template)
+        return tokens
+
+
+    def _fit_items(self, section: SiaContextSection, items: list, available: int) -> tuple[list, int]:
+        counts = [self.counter.count(str(item)) for item in items]
+        kept = [False] * len(items)
+        used = 0
+
+        # leading items first, then the others from the end that is kept longest
+        order = list(range(min(section.keep_first, len(items))))
+        rest = list(range(len(order), len(items)))
+        order += rest if section.drop == "last" else rest[::-1]
+        for i in order:
+            if used + counts[i] > available:
+                # items are dropped from one end only, so the kept ones stay contiguous
+                if i >= section.keep_first:
+                    break
+                continue
+            kept[i] = True
+            used += counts[i]
+
+        return [item for item, keep in zip(items, kept) if keep], used
+
+
+    def assemble(self, call: str, sections: list[SiaContextSection], prompt_template=None) -> tuple[dict, dict]:
+        """
+        Output:
+        - {section name: value that fits}, ready to be merged into the prompt input
+        - report: {"call", "budget", "template", "sections": {name: {"tokens", "items", "items_total", "truncated"}}, "total"}
+        """
+        budget = self.budgets.get(call, max(DEFAULT_BUDGETS.values()))
+        template = self.template_tokens(prompt_template) if prompt_template is not None else 0
+        available = budget - template
+
+        values = {}
+        report = {"call": call, "budget": budget, "template": template, "sections": {}}
+
+        for section in sorted(sections, key=lambda section: -section.priority):
+            if isinstance(section.value, list):
+                items, used = self._fit_items(section, section.value, available)
+                values[section.name] = section.joiner.join(str(item) for item in items) if section.joiner is not None else items
+                report["sections"][section.name] = {"tokens": used, "items": len(items), "items_total": len(section.value), "truncated": len(items) < len(section.value)}
+            else:
+                text = section.value or ""
+                used = self.counter.count(text)
+                truncated = used > available
+                if truncated:
+                    text = self.counter.truncate(text, available)
+                    used = self.counter.count(text)
+                values[section.name] = text
+                report["sections"][section.name] = {"tokens": used, "items": 1, "items_total": 1, "truncated": truncated}
+            available = max(0, available - used)
+
+        report["total"] = template + sum(section["tokens"] for section in report["sections"].values())
+        breakdown = ", ".join(f"{name}={s['tokens']}" + (f" ({s['items']}/{s['items_total']})" if s["truncated"] else "") for name, s in report["sections"].items())
+        log_message(self.logger, "info", self, f"Prompt budget [{call}]: {report['total']}/{budget} tokens, template={template}, {breakdown}")
+        return values, report
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import weakref
+from typing import Callable
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+from langchain_anthropic import ChatAnthropic
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+# (provider, model, temperature) of the models Sia uses
+POST_MODEL = ("anthropic", "claude-3-5-sonnet-20240620", 0.3)
+FALLBACK_MODEL = ("openai", "gpt-4o", 0.0)
+FILTERING_MODEL = ("openai", "gpt-4o-mini", 0.0)
+
+DEFAULT_MODELS = [POST_MODEL, FALLBACK_MODEL, FILTERING_MODEL]
+
+
+class SiaLLMRegistry:
+    """
+    Process-wide cache of chat models keyed by (provider, model, temperature).
+
+    Models are created once and reused, so their HTTP connection pools and TLS
+    sessions survive between calls. OpenAI models share one pooled httpx client;
+    Anthropic models keep the pooled client of their SDK instance.
+
+    Factories are injectable: a factory is called as factory(model=..., temperature=...)
+    and must return a BaseChatModel, e.g. a local stub in tests:
+
+        registry = SiaLLMRegistry(factories={"anthropic": lambda model, temperature: FakeListChatModel(responses=["gm"])})
+    """
+
+    def __init__(
+        self,
+        factories: dict[str, Callable[..., BaseChatModel]] = None,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60,
+        timeout: float = 60,
+        logging_enabled: bool = True
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self._http_client = None
+        self.factories = {
+            "anthropic": self._create_anthropic,
+            "openai": self._create_openai,
+        }
+        self.factories.update(factories or {})
+        self._models = {}
+        # event loop -> {key: model}, see aget
+        self._loop_models = weakref.WeakKeyDictionary()
+        # models set with set_model, shared by all loops
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+        return self._http_client
+
+
+    def _create_anthropic(self, model: str, temperature: float) -> BaseChatModel:
+        return ChatAnthropic(model=model, temperature=temperature, default_request_timeout=self.timeout)
+
+
+    def _create_openai(self, model: str, temperature: float) -> BaseChatModel:
+        return ChatOpenAI(model=model, temperature=temperature, http_client=self.http_client)
+
+
+    def get(self, provider: str, model: str, temperature: float = 0.0) -> BaseChatModel:
+        key = (provider, model, float(temperature))
+        llm = self._models.get(key)
+        if llm is not None:
+            return llm
+        with self._lock:
+            if key not in self._models:
+                if provider not in self.factories:
+                    raise ValueError(f"No LLM factory registered for provider {provider}")
+                self._models[key] = self.factories[provider](model=model, temperature=temperature)
+                log_message(self.logger, "info", self, f"Created LLM client {key}")
+            return self._models[key]
+
+
+    def aget(self, provider: str, model: str, temperature: float = 0.0) -> BaseChatModel:
+        """
+        Like get, for models used with ainvoke/astream.
+        Async HTTP connections cannot be shared between event loops (the Telegram
+        and Twitter clients run their own), so every loop gets its own instances.
+        """
+        key = (provider, model, float(temperature))
+        if key in self._pinned:
+            return self._pinned[key]
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            models = self._loop_models.setdefault(loop, {})
+            if key not in models:
+                if provider not in self.factories:
+                    raise ValueError(f"No LLM factory registered for provider {provider}")
+                models[key] = self.factories[provider](model=model, temperature=temperature)
+                log_message(self.logger, "info", self, f"Created async LLM client {key}")
+            return models[key]
+
+
+    def set_factory(self, provider: str, factory: Callable[..., BaseChatModel]):
+        """Replace the factory of a provider; models it already created are dropped."""
+        with self._lock:
+            self.factories[provider] = factory
+            for models in [self._models, *self._loop_models.values()]:
+                for key in [key for key in models if key[0] == provider]:
+                    del models[key]
+
+
+    def set_model(self, provider: str, model: str, temperature: float, llm: BaseChatModel):
+        """Use llm for this exact key, e.g. a stub in tests."""
+        with self._lock:
+            self._models[(provider, model, float(temperature))] = llm
+            self._pinned[(provider, model, float(temperature))] = llm
+
+
+    def warmup(self, models: list[tuple[str, str, float]] = None, ping: bool = False):
+        """
+        Create the clients of the models up front.
+        With ping, send each model a 1-token request so that connections are
+        open before the first post or reply (costs a few tokens per model).
+        Errors are logged, not raised: a model that fails here is retried on first use.
+        """
+        for provider, model, temperature in models or DEFAULT_MODELS:
+            try:
+                llm = self.get(provider, model, temperature)
+                if ping:
+                    llm.invoke("ping", max_tokens=1)
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error warming up {provider} {model}: {e}")
+
+
+    def close(self):
+        with self._lock:
+            self._models.clear()
+            self._loop_models.clear()
+            self._pinned.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_registry() -> SiaLLMRegistry:
+    """The process-wide registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SiaLLMRegistry()
+        return _registry
+
+
+def set_llm_registry(registry: SiaLLMRegistry):
+    """Replace the process-wide registry, e.g. with one using stub factories."""
+    global _registry
+    with _registry_lock:
+        _registry = registry
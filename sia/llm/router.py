@@ -0,0 +1,415 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, AsyncIterator, Callable
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
+
+from sia.llm.registry import SiaLLMRegistry
+from sia.llm.telemetry import SiaLLMTelemetry, SiaLLMCallRecorder
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+# (provider, model, temperature), see sia.llm.registry
+Route = tuple[str, str, float]
+
+
+class SiaLLMUnavailableError(Exception):
+    pass
+
+
+class SiaLatencyStats:
+    """Latencies of the latest successful calls of each route."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+
+    def record(self, route: Route, latency: float):
+        with self._lock:
+            self._latencies.setdefault(route, deque(maxlen=self.window)).append(latency)
+
+
+    def count(self, route: Route) -> int:
+        with self._lock:
+            return len(self._latencies.get(route, ()))
+
+
+    def routes(self) -> list[Route]:
+        with self._lock:
+            return list(self._latencies)
+
+
+    def quantile(self, route: Route, q: float) -> float|None:
+        with self._lock:
+            latencies = sorted(self._latencies.get(route, ()))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class SiaCircuitBreaker:
+    """
+    Remembers failing routes.
+    After failure_threshold consecutive failures a route is open (skipped) for
+    reset_after seconds, then half-open: one call is let through, and the route
+    closes on success or opens again, for twice as long, on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_after: float = 30, max_reset_after: float = 600):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.max_reset_after = max_reset_after
+        self._states = {}
+        self._lock = threading.Lock()
+
+
+    def _state(self, route: Route) -> dict:
+        return self._states.setdefault(route, {"failures": 0, "opened_at": None, "open_for": self.reset_after, "trial": False})
+
+
+    def available(self, route: Route) -> bool:
+        """Whether a call may be started: the route is closed, or half-open with no trial call running."""
+        with self._lock:
+            state = self._state(route)
+            if state["opened_at"] is None:
+                return True
+            return time.monotonic() - state["opened_at"] >= state["open_for"] and not state["trial"]
+
+
+    def begin(self, route: Route) -> bool:
+        """Register a call; False if the route is not available (anymore)."""
+        with self._lock:
+            state = self._state(route)
+            if state["opened_at"] is None:
+                return True
+            if time.monotonic() - state["opened_at"] < state["open_for"] or state["trial"]:
+                return False
+            # half-open: this call is the trial
+            state["trial"] = True
+            return True
+
+
+    def release(self, route: Route):
+        """A call was abandoned without a result (e.g. it lost a hedge): allow another trial."""
+        with self._lock:
+            self._state(route)["trial"] = False
+
+
+    def record_success(self, route: Route):
+        with self._lock:
+            self._states[route] = {"failures": 0, "opened_at": None, "open_for": self.reset_after, "trial": False}
+
+
+    def record_failure(self, route: Route):
+        with self._lock:
+            state = self._state(route)
+            state["failures"] += 1
+            if state["trial"]:
+                state["open_for"] = min(state["open_for"] * 2, self.max_reset_after)
+            if state["trial"] or state["failures"] >= self.failure_threshold:
+                state["opened_at"] = time.monotonic()
+            state["trial"] = False
+
+
+    def is_open(self, route: Route) -> bool:
+        with self._lock:
+            return self._state(route)["opened_at"] is not None
+
+
+class SiaLLMRouter:
+    """
+    Runs a chain against a list of routes (models in order of preference) with:
+
+    - a deadline per call: a hung provider costs at most `timeout` seconds;
+    - failover: when a route fails, the next one is tried within the same deadline;
+    - a circuit breaker: routes that keep failing are skipped until they recover;
+    - hedging: if the first route has not answered after its recent p95 latency,
+      the next route is started too and the first answer wins.
+
+    With adaptive=True, routes whose p95 latency is known are ordered by it,
+    the fastest first; otherwise the configured order is kept.
+
+    Every call attempt is recorded by `telemetry` (if given) under its call site.
+    """
+
+    def __init__(
+        self,
+        registry: SiaLLMRegistry,
+        routes: list[Route],
+        timeout: float = 30,
+        hedging: bool = True,
+        hedge_quantile: float = 0.95,
+        default_hedge_delay: float = 10,
+        min_hedge_delay: float = 1,
+        min_samples: int = 20,
+        adaptive: bool = False,
+        breaker: SiaCircuitBreaker = None,
+        stats: SiaLatencyStats = None,
+        telemetry: SiaLLMTelemetry = None,
+        max_workers: int = 16,
+        logging_enabled: bool = True
+    ):
+        self.registry = registry
+        self.routes = list(routes)
+        self.timeout = timeout
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.adaptive = adaptive
+        self.breaker = breaker or SiaCircuitBreaker()
+        self.stats = stats or SiaLatencyStats()
+        self.telemetry = telemetry
+        # abandoned calls (deadline passed, lost the hedge) keep running here until the HTTP client times out
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sia-llm")
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    def candidates(self, routes: list[Route] = None) -> list[Route]:
+        """Routes in the order they will be tried, without routes whose circuit is open."""
+        routes = list(routes or self.routes)
+        if self.adaptive:
+            def expected_latency(indexed_route):
+                index, route = indexed_route
+                p95 = self.stats.quantile(route, self.hedge_quantile) if self.stats.count(route) >= self.min_samples else None
+                return (p95 is None, p95 or 0, index)
+            routes = [route for _, route in sorted(enumerate(routes), key=expected_latency)]
+        return [route for route in routes if self.breaker.available(route)]
+
+
+    def hedge_delay(self, route: Route) -> float:
+        if self.stats.count(route) < self.min_samples:
+            delay = self.default_hedge_delay
+        else:
+            delay = self.stats.quantile(route, self.hedge_quantile)
+        return min(max(delay, self.min_hedge_delay), self.timeout)
+
+
+    def _recorder(self, route: Route, routes: list[Route], call_site: str) -> SiaLLMCallRecorder:
+        return SiaLLMCallRecorder(call_site, route, fallback=route != (routes or self.routes)[0])
+
+
+    def _succeeded(self, recorder: SiaLLMCallRecorder):
+        self.stats.record(recorder.route, recorder.elapsed())
+        self.breaker.record_success(recorder.route)
+        if self.telemetry:
+            self.telemetry.record(recorder, "ok")
+
+
+    def _failed(self, recorder: SiaLLMCallRecorder, error: BaseException|str, outcome: str = "error"):
+        self.breaker.record_failure(recorder.route)
+        log_message(self.logger, "error", self, f"LLM call to {recorder.route[0]} {recorder.route[1]} failed: {error}")
+        if self.telemetry:
+            self.telemetry.record(recorder, outcome, error)
+
+
+    def _abandoned(self, recorder: SiaLLMCallRecorder):
+        """The call lost a hedge or its consumer went away: it is neither a success nor a failure of the route."""
+        self.breaker.release(recorder.route)
+        if self.telemetry:
+            self.telemetry.record(recorder, "abandoned")
+
+
+    def invoke(self, build_chain: Callable[[BaseChatModel], Runnable], ai_input: dict, routes: list[Route] = None, call_site: str = "unknown") -> Any:
+        """
+        Run build_chain(llm).invoke(ai_input) on the routes, see the class docstring.
+        Raises SiaLLMUnavailableError if no route answered before the deadline.
+        """
+        candidates = self.candidates(routes)
+        if not candidates:
+            raise SiaLLMUnavailableError("All LLM routes are open")
+
+        deadline = time.monotonic() + self.timeout
+        pending = {}
+
+        def start(route) -> bool:
+            if not self.breaker.begin(route):
+                return False
+            recorder = self._recorder(route, routes, call_site)
+            try:
+                chain = build_chain(self.registry.get(*route))
+            except Exception as e:
+                # a client that cannot be built (e.g. a missing API key) is a failure of its route
+                self._failed(recorder, e)
+                return False
+            pending[self._executor.submit(chain.invoke, ai_input, {"callbacks": [recorder]})] = recorder
+            return True
+
+        while candidates and not pending:
+            start(candidates.pop(0))
+        hedge_at = time.monotonic() + self.hedge_delay(next(iter(pending.values())).route) if self.hedging and pending else None
+
+        while pending:
+            now = time.monotonic()
+            wait_until = min(deadline, hedge_at) if hedge_at and candidates else deadline
+            done, _ = wait(pending, timeout=max(0, wait_until - now), return_when=FIRST_COMPLETED)
+
+            if not done:
+                if time.monotonic() >= deadline:
+                    break
+                # hedge: the first route is slower than usual, start the next one as well
+                log_message(self.logger, "info", self, f"Hedging with {candidates[0][0]} {candidates[0][1]}")
+                while candidates and not start(candidates.pop(0)):
+                    pass
+                hedge_at = None
+                continue
+
+            for future in done:
+                recorder = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self._failed(recorder, e)
+                    while candidates and not pending:
+                        start(candidates.pop(0))
+                    continue
+                self._succeeded(recorder)
+                for abandoned, abandoned_recorder in pending.items():
+                    abandoned.cancel()
+                    self._abandoned(abandoned_recorder)
+                return result
+
+        for recorder in pending.values():
+            self._failed(recorder, f"no answer within {self.timeout} s", "timeout")
+        raise SiaLLMUnavailableError(f"No LLM route answered within {self.timeout} s")
+
+
+    async def ainvoke(self, build_chain: Callable[[BaseChatModel], Runnable], ai_input: dict, routes: list[Route] = None, call_site: str = "unknown") -> Any:
+        """Async counterpart of invoke; calls that lose or miss the deadline are cancelled."""
+        candidates = self.candidates(routes)
+        if not candidates:
+            raise SiaLLMUnavailableError("All LLM routes are open")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        pending = {}
+
+        def start(route) -> bool:
+            if not self.breaker.begin(route):
+                return False
+            recorder = self._recorder(route, routes, call_site)
+            try:
+                chain = build_chain(self.registry.aget(*route))
+            except Exception as e:
+                self._failed(recorder, e)
+                return False
+            pending[asyncio.ensure_future(chain.ainvoke(ai_input, {"callbacks": [recorder]}))] = recorder
+            return True
+
+        while candidates and not pending:
+            start(candidates.pop(0))
+        hedge_at = loop.time() + self.hedge_delay(next(iter(pending.values())).route) if self.hedging and pending else None
+
+        try:
+            while pending:
+                wait_until = min(deadline, hedge_at) if hedge_at and candidates else deadline
+                done, _ = await asyncio.wait(pending, timeout=max(0, wait_until - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if loop.time() >= deadline:
+                        break
+                    log_message(self.logger, "info", self, f"Hedging with {candidates[0][0]} {candidates[0][1]}")
+                    while candidates and not start(candidates.pop(0)):
+                        pass
+                    hedge_at = None
+                    continue
+
+                for task in done:
+                    recorder = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self._failed(recorder, e)
+                        while candidates and not pending:
+                            start(candidates.pop(0))
+                        continue
+                    self._succeeded(recorder)
+                    return result
+
+            for recorder in pending.values():
+                self._failed(recorder, f"no answer within {self.timeout} s", "timeout")
+            pending.clear()
+            raise SiaLLMUnavailableError(f"No LLM route answered within {self.timeout} s")
+
+        finally:
+            for task, recorder in pending.items():
+                task.cancel()
+                self._abandoned(recorder)
+
+
+    async def astream(self, build_chain: Callable[[BaseChatModel], Runnable], ai_input: dict, routes: list[Route] = None, call_site: str = "unknown") -> AsyncIterator[Any]:
+        """
+        Stream the chunks of build_chain(llm).astream(ai_input) from the first route that answers.
+        Routes fail over (without hedging) only until the first chunk: once chunks have been
+        yielded, an error is raised to the caller. The whole stream must end within `timeout` seconds.
+        """
+        candidates = self.candidates(routes)
+        if not candidates:
+            raise SiaLLMUnavailableError("All LLM routes are open")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        for route in candidates:
+            if not self.breaker.begin(route):
+                continue
+            recorder = self._recorder(route, routes, call_site)
+            try:
+                stream = build_chain(self.registry.aget(*route)).astream(ai_input, {"callbacks": [recorder]}).__aiter__()
+            except Exception as e:
+                self._failed(recorder, e)
+                continue
+            streamed = False
+            finished = False
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    streamed = True
+                    recorder.first_token()
+                    yield chunk
+                finished = True
+            except Exception as e:
+                finished = True
+                if isinstance(e, asyncio.TimeoutError):
+                    self._failed(recorder, f"no answer within {self.timeout} s", "timeout")
+                else:
+                    self._failed(recorder, e)
+                if streamed:
+                    raise
+                continue
+            finally:
+                if not finished:
+                    # the caller stopped consuming the stream
+                    self._abandoned(recorder)
+                if hasattr(stream, "aclose"):
+                    await stream.aclose()
+            self._succeeded(recorder)
+            return
+
+        raise SiaLLMUnavailableError(f"No LLM route answered within {self.timeout} s")
+
+
+    def report(self) -> dict:
+        """Latency quantiles and circuit state of every route seen so far."""
+        return {
+            route: {
+                "calls": self.stats.count(route),
+                "p50": self.stats.quantile(route, 0.5),
+                "p95": self.stats.quantile(route, 0.95),
+                "circuit_open": self.breaker.is_open(route),
+            }
+            for route in dict.fromkeys(self.routes + self.stats.routes())
+        }
@@ -0,0 +1,270 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy import insert, select, delete
+
+from sia.memory.models_db import SiaLLMCallModel
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+# estimated prices in USD per million (input, output) tokens
+PRICES = {
+    "claude-3-5-sonnet-20240620": (3.0, 15.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+
+def estimate_cost(model: str, input_tokens: int|None, output_tokens: int|None) -> float|None:
+    price = PRICES.get(model)
+    if price is None or (input_tokens is None and output_tokens is None):
+        return None
+    return ((input_tokens or 0) * price[0] + (output_tokens or 0) * price[1]) / 1_000_000
+
+
+def quantile(values, q: float) -> float|None:
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class SiaLLMCallRecorder(BaseCallbackHandler):
+    """
+    Measures one LLM call: passed as a LangChain callback to the chain, it
+    catches the first streamed token and the token usage reported by the model.
+    """
+
+    run_inline = True
+
+    def __init__(self, call_site: str, route: tuple, fallback: bool = False):
+        self.call_site = call_site
+        self.route = route
+        self.fallback = fallback
+        self.started_at = datetime.now()
+        self._started = time.monotonic()
+        self._first_token = None
+        self.input_tokens = None
+        self.output_tokens = None
+
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+
+    def first_token(self):
+        if self._first_token is None:
+            self._first_token = time.monotonic()
+
+
+    @property
+    def time_to_first_token(self) -> float|None:
+        return self._first_token - self._started if self._first_token is not None else None
+
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.first_token()
+
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.input_tokens = (self.input_tokens or 0) + usage.get("input_tokens", 0)
+                    self.output_tokens = (self.output_tokens or 0) + usage.get("output_tokens", 0)
+        if self.input_tokens is None:
+            usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage") or {}
+            if usage:
+                self.input_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+                self.output_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+
+
+class SiaLLMTelemetry:
+    """
+    Records every LLM call made through SiaLLMRouter: call site (post, response,
+    filtering, news...), provider, model, wall time, time to first token
+    (streamed calls only), tokens, estimated cost, outcome and whether a
+    fallback route was used.
+
+    Calls are aggregated in memory (latest `window` calls per call site, see
+    stats) and written to the llm_call table in batches by a background thread
+    (see query_stats), so recording never waits for the database.
+    Rows older than max_age_days are deleted.
+    """
+
+    def __init__(self, Session=None, character_name_id: str = None, window: int = 1000, batch_size: int = 100, flush_interval: float = 5, max_age_days: int = 30, logging_enabled: bool = True):
+        self.Session = Session
+        self.character_name_id = character_name_id
+        self.window = window
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_age_days = max_age_days
+        self._sites = {}
+        self._lock = threading.Lock()
+        # rows not written yet; _flush_lock is held while they are written
+        self._rows = []
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._last_prune = 0
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    def record(self, recorder: SiaLLMCallRecorder, outcome: str = "ok", error: BaseException|str = None):
+        provider, model = recorder.route[0], recorder.route[1]
+        row = {
+            "character_name_id": self.character_name_id,
+            "call_site": recorder.call_site,
+            "provider": provider,
+            "model": model,
+            "started_at": recorder.started_at,
+            "wall_time": recorder.elapsed(),
+            "time_to_first_token": recorder.time_to_first_token,
+            "input_tokens": recorder.input_tokens,
+            "output_tokens": recorder.output_tokens,
+            "cost": estimate_cost(model, recorder.input_tokens, recorder.output_tokens),
+            "outcome": outcome,
+            "fallback": recorder.fallback,
+            "error": str(error)[:500] if error else None,
+        }
+        self._aggregate(row)
+        if self.Session is not None:
+            with self._lock:
+                self._rows.append(row)
+                full = len(self._rows) >= self.batch_size
+            if full:
+                self._wakeup.set()
+            self._start_writer()
+
+
+    @staticmethod
+    def _new_site(window: int = None) -> dict:
+        return {
+            "wall_times": deque(maxlen=window), "ttfts": deque(maxlen=window),
+            "calls": 0, "outcomes": {}, "fallbacks": 0, "models": {},
+            "input_tokens": 0, "output_tokens": 0, "cost": 0.0,
+        }
+
+
+    @staticmethod
+    def _add(site: dict, row: dict):
+        site["calls"] += 1
+        site["outcomes"][row["outcome"]] = site["outcomes"].get(row["outcome"], 0) + 1
+        site["models"][row["model"]] = site["models"].get(row["model"], 0) + 1
+        site["fallbacks"] += 1 if row["fallback"] and row["outcome"] == "ok" else 0
+        site["input_tokens"] += row["input_tokens"] or 0
+        site["output_tokens"] += row["output_tokens"] or 0
+        site["cost"] += row["cost"] or 0
+        if row["outcome"] == "ok":
+            site["wall_times"].append(row["wall_time"])
+            if row["time_to_first_token"] is not None:
+                site["ttfts"].append(row["time_to_first_token"])
+
+
+    def _aggregate(self, row: dict):
+        with self._lock:
+            if row["call_site"] not in self._sites:
+                self._sites[row["call_site"]] = self._new_site(self.window)
+            self._add(self._sites[row["call_site"]], row)
+
+
+    @staticmethod
+    def _summary(wall_times, ttfts) -> dict:
+        return {
+            "p50": quantile(wall_times, 0.5),
+            "p95": quantile(wall_times, 0.95),
+            "ttft_p50": quantile(ttfts, 0.5),
+            "ttft_p95": quantile(ttfts, 0.95),
+        }
+
+
+    def _report(self, sites: dict) -> dict:
+        return {
+            name: {
+                **{key: value for key, value in site.items() if key not in ("wall_times", "ttfts", "outcomes", "models")},
+                "outcomes": dict(site["outcomes"]),
+                "models": dict(site["models"]),
+                **self._summary(site["wall_times"], site["ttfts"]),
+            }
+            for name, site in sites.items()
+        }
+
+
+    def stats(self, call_site: str = None) -> dict:
+        """
+        In-process statistics since start, per call site:
+        {call_site: {"calls", "outcomes", "fallbacks", "models", "input_tokens", "output_tokens", "cost", "p50", "p95", "ttft_p50", "ttft_p95"}}
+        Latency quantiles (seconds) are over the latest `window` successful calls.
+        """
+        with self._lock:
+            return self._report({name: site for name, site in self._sites.items() if call_site is None or name == call_site})
+
+
+    def query_stats(self, since: datetime = None, call_site: str = None) -> dict:
+        """Same as stats, computed from the llm_call table for the calls started after since (default: the last 24 hours)."""
+        self.flush()
+        since = since or datetime.now() - timedelta(days=1)
+        query = select(SiaLLMCallModel).where(SiaLLMCallModel.started_at >= since)
+        if self.character_name_id:
+            query = query.where(SiaLLMCallModel.character_name_id == self.character_name_id)
+        if call_site:
+            query = query.where(SiaLLMCallModel.call_site == call_site)
+
+        sites = {}
+        session = self.Session()
+        try:
+            for row in session.execute(query.execution_options(yield_per=1000)).scalars():
+                if row.call_site not in sites:
+                    sites[row.call_site] = self._new_site()
+                self._add(sites[row.call_site], {column: getattr(row, column) for column in ("outcome", "model", "fallback", "input_tokens", "output_tokens", "cost", "wall_time", "time_to_first_token")})
+        finally:
+            session.close()
+
+        return self._report(sites)
+
+
+    def _write(self, rows: list[dict]):
+        session = self.Session()
+        try:
+            session.execute(insert(SiaLLMCallModel), rows)
+            if time.monotonic() - self._last_prune > 3600:
+                session.execute(delete(SiaLLMCallModel).where(SiaLLMCallModel.started_at < datetime.now() - timedelta(days=self.max_age_days)))
+                self._last_prune = time.monotonic()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            log_message(self.logger, "error", self, f"Error storing LLM call telemetry: {e}")
+        finally:
+            session.close()
+
+
+    def flush(self) -> int:
+        """Write the recorded calls now. Returns the number of written calls."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if rows:
+                self._write(rows)
+            return len(rows)
+
+
+    def _run_writer(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+    def _start_writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run_writer, name="sia-llm-telemetry", daemon=True)
+                    self._writer.start()
@@ -0,0 +1,43 @@
+"""
+Encoding of archived messages (see SiaMessageArchiveModel).
+"""
+
+import json
+import zlib
+from datetime import datetime
+
+
+def partition_of(wen_posted: datetime|None) -> str:
+    """Archive partition of a message: the month it was posted in, e.g. "2024-11"."""
+    return wen_posted.strftime("%Y-%m") if wen_posted else "unknown"
+
+
+def pack_message(row: dict) -> bytes:
+    """Full message row -> zlib-compressed JSON."""
+    row = dict(row)
+    if isinstance(row.get("wen_posted"), datetime):
+        row["wen_posted"] = row["wen_posted"].isoformat()
+    return zlib.compress(json.dumps(row, default=str).encode("utf-8"))
+
+
+def unpack_message(payload: bytes) -> dict:
+    """Inverse of pack_message: a row that can be inserted into the message table."""
+    row = json.loads(zlib.decompress(payload).decode("utf-8"))
+    if row.get("wen_posted"):
+        row["wen_posted"] = datetime.fromisoformat(row["wen_posted"])
+    return row
+
+
+def archive_row(row: dict) -> dict:
+    """message_archive row for a message row."""
+    return {
+        "id": row["id"],
+        "conversation_id": row["conversation_id"],
+        "character": row["character"],
+        "platform": row["platform"],
+        "author": row["author"],
+        "wen_posted": row["wen_posted"],
+        "partition": partition_of(row["wen_posted"]),
+        "archived_at": datetime.now(),
+        "payload": pack_message(row)
+    }
@@ -0,0 +1,310 @@
+import asyncio
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+
+from .models_db import SiaMessageModel, SiaCharacterSettingsModel, SiaIngestionCursorModel
+from .schemas import SiaMessageSchema, SiaMessageGeneratedSchema, SiaMessageRow, SiaCharacterSettingsSchema, SiaIngestionCursorSchema, SiaEngineProfileSchema
+from .engine import engine_kwargs, apply_sqlite_pragmas, is_sqlite_url
+from .recent_posts import SiaRecentPostsBuffer
+from .transcripts import SiaConversationTranscripts
+from .novelty import SiaNoveltyIndex
+from .settings_store import SiaCharacterSettingsStore
+from . import queries
+from sia.character import SiaCharacter
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_db_path(db_path: str) -> str:
+    """sqlite:///... -> sqlite+aiosqlite:///..., postgresql://... -> postgresql+asyncpg://..."""
+    url = make_url(db_path)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    if url.get_driver_name() in ("aiosqlite", "asyncpg"):
+        return db_path
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+class AsyncSiaMemory:
+    """
+    asyncio counterpart of SiaMemory for the Telegram and Twitter event loops.
+
+    Same API as SiaMemory, with coroutines instead of blocking calls. Tables are
+    created by SiaMemory; pass its recent_posts, transcripts, settings and novelty so that
+    both memories share the same caches.
+
+    Async connections cannot be shared between event loops, and the Twitter and
+    Telegram clients run their own loops in separate threads, so an engine is
+    created lazily for every loop that uses the memory.
+    """
+
+    def __init__(self, db_path: str, character: SiaCharacter, engine_profile: SiaEngineProfileSchema = None, recent_posts: SiaRecentPostsBuffer = None, transcripts: SiaConversationTranscripts = None, settings: SiaCharacterSettingsStore = None, novelty: SiaNoveltyIndex = None):
+        self.db_path = to_async_db_path(db_path)
+        self.character = character
+        self.engine_profile = engine_profile or SiaEngineProfileSchema.from_env()
+        self.recent_posts = recent_posts or SiaRecentPostsBuffer()
+        self.transcripts = transcripts or SiaConversationTranscripts()
+        self.settings = settings
+        self.novelty = novelty
+        self._engines = {}
+        self._sessionmakers = {}
+        self.logging_enabled = self.character.logging_enabled
+
+        self.logger = setup_logging()
+        enable_logging(self.logging_enabled)
+
+
+    def _create_engine(self, loop):
+        engine = create_async_engine(self.db_path, **engine_kwargs(self.db_path, self.engine_profile))
+        if is_sqlite_url(self.db_path):
+            apply_sqlite_pragmas(engine.sync_engine, self.engine_profile)
+        self._engines[loop] = engine
+        self._sessionmakers[loop] = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+    @property
+    def engine(self) -> AsyncEngine:
+        """Engine of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._engines:
+            self._create_engine(loop)
+        return self._engines[loop]
+
+
+    def Session(self) -> AsyncSession:
+        loop = asyncio.get_running_loop()
+        if loop not in self._sessionmakers:
+            self._create_engine(loop)
+        return self._sessionmakers[loop]()
+
+
+    async def dispose(self):
+        """Close the connections of the running event loop's engine."""
+        loop = asyncio.get_running_loop()
+        self._sessionmakers.pop(loop, None)
+        engine = self._engines.pop(loop, None)
+        if engine:
+            await engine.dispose()
+
+
+    async def add_message(self, message_id: str, message: SiaMessageGeneratedSchema, original_data: dict = None) -> SiaMessageSchema:
+        message_model = SiaMessageModel(
+            id=message_id,
+            platform=message.platform,
+            character=message.character,
+            author=message.author,
+            content=message.content,
+            conversation_id=message.conversation_id,
+            response_to=message.response_to,
+            flagged=message.flagged,
+            message_metadata=message.message_metadata,
+            original_data=original_data
+        )
+
+        async with self.Session() as session:
+            try:
+                session.add(message_model)
+                await session.commit()
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error adding message to database: {e}")
+                await session.rollback()
+                raise e
+
+            message_schema = SiaMessageSchema.from_orm(message_model)
+
+        self._cache_added(message_schema)
+        return message_schema
+
+
+    def _cache_added(self, message_schema: SiaMessageSchema):
+        """See SiaMemory._cache_added."""
+        for cache in (self.recent_posts, self.transcripts, self.novelty):
+            if cache is None:
+                continue
+            try:
+                cache.add(message_schema)
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error caching message {message_schema.id} in {type(cache).__name__}: {e}")
+
+
+    async def add_messages(self, messages: list[tuple[str, SiaMessageGeneratedSchema, dict|None]]) -> list[SiaMessageSchema]:
+        """See SiaMemory.add_messages."""
+        rows = queries.message_rows(messages)
+        if not rows:
+            return []
+
+        async with self.Session() as session:
+            try:
+                inserted_ids = set()
+                statements = queries.insert_messages_ignoring_conflicts(self.engine.dialect.name, list(rows.values()))
+                if statements is not None:
+                    for stmt in statements:
+                        inserted_ids.update((await session.execute(stmt)).scalars())
+                else:
+                    for row in rows.values():
+                        try:
+                            async with session.begin_nested():
+                                session.add(SiaMessageModel(**row))
+                            inserted_ids.add(row["id"])
+                        except IntegrityError:
+                            pass
+                await session.commit()
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error adding messages to database: {e}")
+                await session.rollback()
+                raise e
+
+        inserted = [SiaMessageSchema(**row) for message_id, row in rows.items() if message_id in inserted_ids]
+        for message_schema in inserted:
+            self._cache_added(message_schema)
+        return inserted
+
+
+    async def get_messages(self, id=None, platform: str = None, author: str = None, not_author: str = None, character: str = None, conversation_id: str = None, flagged: bool = False, sort_by: str = None, sort_order: str = "asc", is_post: bool = None, from_datetime=None, fields: list[str] = None) -> list[SiaMessageSchema]|list[SiaMessageRow]:
+        """See SiaMemory.get_messages."""
+        query = queries.select_messages(
+            id=id, platform=platform, author=author, not_author=not_author, character=character,
+            conversation_id=conversation_id, flagged=flagged, sort_by=sort_by, sort_order=sort_order,
+            is_post=is_post, from_datetime=from_datetime, fields=fields
+        )
+        async with self.Session() as session:
+            result = await session.execute(query)
+            if fields:
+                return [SiaMessageRow(dict(post._mapping)) for post in result.all()]
+            return [SiaMessageSchema.from_orm(post) for post in result.scalars().all()]
+
+
+    async def get_recent_posts(self, character: str = None, platform: str = "twitter", limit: int = 10) -> list[SiaMessageSchema]:
+        """See SiaMemory.get_recent_posts."""
+        character = character or self.character.name
+
+        if limit <= self.recent_posts.size:
+            posts = self.recent_posts.get(character, platform, limit)
+            if posts is not None:
+                return posts
+
+        writes_count = self.recent_posts.writes_count(character, platform)
+        async with self.Session() as session:
+            posts = (await session.execute(queries.select_recent_posts(character, platform, max(limit, self.recent_posts.size)))).all()
+            posts = [SiaMessageRow(dict(post._mapping)).to_schema() for post in reversed(posts)]
+
+        if limit <= self.recent_posts.size:
+            self.recent_posts.load(character, platform, posts, writes_count)
+
+        return posts[-limit:] if limit else []
+
+
+    async def get_conversation_window(self, conversation_id: str, window: int = 20, fields: list[str] = None) -> list[SiaMessageRow]:
+        """See SiaMemory.get_conversation_window."""
+        fields = fields or queries.CONVERSATION_FIELDS
+        async with self.Session() as session:
+            root = (await session.execute(queries.select_conversation_root(conversation_id, fields))).all()
+            tail = (await session.execute(queries.select_conversation_tail(conversation_id, window, fields))).all()
+            return [SiaMessageRow(dict(message._mapping)) for message in root + tail[::-1]]
+
+
+    async def get_conversation_transcript(self, conversation_id: str, window: int = 20) -> str:
+        """See SiaMemory.get_conversation_transcript."""
+        if not conversation_id:
+            return ""
+        if window != self.transcripts.window:
+            messages = await self.get_conversation_window(conversation_id, window)
+            return "\n".join(self.transcripts.format_message(message) for message in messages)
+
+        transcript = self.transcripts.get(conversation_id)
+        if transcript is not None:
+            return transcript
+
+        writes_count = self.transcripts.begin_load(conversation_id)
+        messages = None
+        try:
+            messages = await self.get_conversation_window(conversation_id, window)
+        finally:
+            self.transcripts.finish_load(conversation_id, writes_count, messages)
+        return "\n".join(self.transcripts.format_message(message) for message in messages)
+
+
+    async def get_latest_message_id(self, platform: str, not_author: str = None) -> str|None:
+        async with self.Session() as session:
+            latest = (await session.execute(queries.select_latest_message_id(platform, not_author))).first()
+            return latest.id if latest else None
+
+
+    async def get_ingestion_cursor(self, platform: str) -> SiaIngestionCursorSchema|None:
+        async with self.Session() as session:
+            cursor = (await session.execute(queries.select_ingestion_cursor(self.character.name_id, platform))).scalars().first()
+            return SiaIngestionCursorSchema.from_orm(cursor) if cursor else None
+
+
+    async def advance_ingestion_cursor(self, platform: str, last_id: str) -> SiaIngestionCursorSchema:
+        """See SiaMemory.advance_ingestion_cursor."""
+        async with self.Session() as session:
+            try:
+                updated = (await session.execute(queries.advance_ingestion_cursor(self.character.name_id, platform, last_id))).rowcount
+                if not updated:
+                    cursor_exists = (await session.execute(queries.select_ingestion_cursor(self.character.name_id, platform))).first()
+                    if not cursor_exists:
+                        session.add(SiaIngestionCursorModel(character_name_id=self.character.name_id, platform=platform, last_id=last_id))
+                await session.commit()
+            except IntegrityError:
+                # another writer has created the cursor in the meantime
+                await session.rollback()
+                return await self.advance_ingestion_cursor(platform, last_id)
+
+        return await self.get_ingestion_cursor(platform)
+
+
+    async def update_ingestion_backlog(self, platform: str, next_token: str|None, backlog_newest_id: str|None) -> SiaIngestionCursorSchema:
+        """See SiaMemory.update_ingestion_backlog."""
+        async with self.Session() as session:
+            try:
+                updated = (await session.execute(queries.update_ingestion_backlog(self.character.name_id, platform, next_token, backlog_newest_id))).rowcount
+                if not updated:
+                    session.add(SiaIngestionCursorModel(character_name_id=self.character.name_id, platform=platform, next_token=next_token, backlog_newest_id=backlog_newest_id))
+                await session.commit()
+            except IntegrityError:
+                # another writer has created the cursor in the meantime
+                await session.rollback()
+                return await self.update_ingestion_backlog(platform, next_token, backlog_newest_id)
+
+        return await self.get_ingestion_cursor(platform)
+
+
+    async def get_character_settings(self) -> SiaCharacterSettingsSchema:
+        if self.settings:
+            return await asyncio.to_thread(self.settings.get_schema)
+
+        async with self.Session() as session:
+            character_settings = (await session.execute(queries.select_character_settings(self.character.name_id))).scalars().first()
+            if not character_settings:
+                character_settings = SiaCharacterSettingsModel(
+                    character_name_id=self.character.name_id,
+                    character_settings={}
+                )
+                session.add(character_settings)
+                await session.commit()
+            return SiaCharacterSettingsSchema.from_orm(character_settings)
+
+
+    async def update_character_settings(self, character_settings: SiaCharacterSettingsSchema):
+        if self.settings:
+            await asyncio.to_thread(self.settings.replace, character_settings.character_settings)
+            return
+
+        async with self.Session() as session:
+            await session.execute(
+                queries.update_character_settings(self.character.name_id).values(
+                    character_settings=character_settings.character_settings,
+                    version=SiaCharacterSettingsModel.version + 1
+                )
+            )
+            await session.commit()
@@ -0,0 +1,66 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+
+from .schemas import SiaEngineProfileSchema
+
+
+def is_sqlite_url(db_path: str) -> bool:
+    return make_url(db_path).get_backend_name() == "sqlite"
+
+
+def sqlite_pragmas(profile: SiaEngineProfileSchema) -> list[str]:
+    pragmas = []
+    if profile.sqlite_journal_mode:
+        pragmas.append(f"PRAGMA journal_mode={profile.sqlite_journal_mode}")
+    if profile.sqlite_synchronous:
+        pragmas.append(f"PRAGMA synchronous={profile.sqlite_synchronous}")
+    if profile.sqlite_busy_timeout_ms is not None:
+        pragmas.append(f"PRAGMA busy_timeout={int(profile.sqlite_busy_timeout_ms)}")
+    return pragmas
+
+
+def engine_kwargs(db_path: str, profile: SiaEngineProfileSchema) -> dict:
+    """create_engine keyword arguments for the profile, shared by the sync and async engines."""
+    kwargs = {"pool_pre_ping": profile.pool_pre_ping}
+
+    url = make_url(db_path)
+    if url.get_backend_name() == "sqlite":
+        # aiosqlite always uses NullPool; in-memory databases use a single connection per thread
+        if url.get_driver_name() == "pysqlite":
+            if url.database and url.database != ":memory:":
+                kwargs.update(pool_size=profile.pool_size, max_overflow=profile.max_overflow, pool_timeout=profile.pool_timeout)
+            # pooled connections are handed to whichever thread checks them out
+            kwargs["connect_args"] = {"check_same_thread": False}
+            if profile.sqlite_busy_timeout_ms is not None:
+                kwargs["connect_args"]["timeout"] = profile.sqlite_busy_timeout_ms / 1000
+    else:
+        kwargs.update(
+            pool_size=profile.pool_size,
+            max_overflow=profile.max_overflow,
+            pool_timeout=profile.pool_timeout,
+            pool_recycle=profile.pool_recycle
+        )
+
+    return kwargs
+
+
+def apply_sqlite_pragmas(engine: Engine, profile: SiaEngineProfileSchema):
+    pragmas = sqlite_pragmas(profile)
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def create_sia_engine(db_path: str, profile: SiaEngineProfileSchema = None) -> Engine:
+    """Create the SQLAlchemy engine for SiaMemory according to the profile."""
+    profile = profile or SiaEngineProfileSchema()
+    engine = create_engine(db_path, **engine_kwargs(db_path, profile))
+    if is_sqlite_url(db_path):
+        apply_sqlite_pragmas(engine, profile)
+    return engine
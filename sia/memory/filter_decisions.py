@@ -0,0 +1,174 @@
+import hashlib
+import json
+import re
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+
+from .models_db import SiaFilterDecisionModel
+from sia.schemas.schemas import ResponseFilteringResultLLMSchema
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+MENTION_RE = re.compile(r"@\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop @mentions and surrounding punctuation: "@sia_really GM!!" -> "gm"."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = MENTION_RE.sub(" ", text)
+    return " ".join(text.split()).strip(string.punctuation + " ")
+
+
+def rules_hash(filtering_rules, model: tuple = None) -> str:
+    """Hash of the filtering rules (and the model deciding on them): changing either invalidates cached decisions."""
+    payload = json.dumps({"rules": filtering_rules, "model": model}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SiaFilterDecisionCache:
+    """
+    Decisions of a character's response filtering call, keyed by the rules hash,
+    a short context and the normalized message text. The context is the platform
+    and whether the message replies to the character's own message; it does not
+    include the conversation, so the same "gm" under different posts is decided once.
+
+    Lookups hit an in-process LRU first and the filter_decision table second,
+    so decisions survive restarts. Entries expire after ttl seconds; the LRU holds
+    at most max_size entries and the table at most max_rows rows. Rows written for
+    other rules are deleted when the rules change.
+    """
+
+    def __init__(self, Session, character_name_id: str, ttl: float = 7 * 24 * 3600, max_size: int = 10000, max_rows: int = 100000, prune_every: int = 500, logging_enabled: bool = True):
+        self.Session = Session
+        self.character_name_id = character_name_id
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        # key -> (ResponseFilteringResultLLMSchema, expires_at)
+        self._lru = OrderedDict()
+        self._puts = 0
+        self._current_rules_hash = None
+        self._lock = threading.Lock()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    def key(self, rules_hash: str, platform: str, reply_to_character: bool, message_text: str) -> str:
+        context = hashlib.sha256(f"{platform}|{'reply' if reply_to_character else 'mention'}".encode("utf-8")).hexdigest()[:12]
+        return hashlib.sha256(f"{self.character_name_id}|{rules_hash}|{context}|{normalize_text(message_text)}".encode("utf-8")).hexdigest()
+
+
+    def get_cached(self, key: str) -> ResponseFilteringResultLLMSchema|None:
+        """In-process lookup only (never touches the database)."""
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return entry[0]
+
+
+    def _remember(self, key: str, decision: ResponseFilteringResultLLMSchema, expires_at: float):
+        with self._lock:
+            self._lru[key] = (decision, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+
+    def get(self, key: str) -> ResponseFilteringResultLLMSchema|None:
+        decision = self.get_cached(key)
+        if decision is not None:
+            return decision
+
+        session = self.Session()
+        try:
+            row = session.get(SiaFilterDecisionModel, key)
+            if row is None:
+                return None
+            expires_at = row.created_at.timestamp() + self.ttl
+            if expires_at < time.time():
+                return None
+            decision = ResponseFilteringResultLLMSchema(should_respond=row.should_respond, reason=row.reason or "")
+        finally:
+            session.close()
+
+        self._remember(key, decision, expires_at)
+        return decision
+
+
+    def put(self, key: str, rules_hash: str, decision: ResponseFilteringResultLLMSchema):
+        self._remember(key, decision, time.time() + self.ttl)
+
+        session = self.Session()
+        try:
+            session.merge(SiaFilterDecisionModel(
+                key=key,
+                character_name_id=self.character_name_id,
+                rules_hash=rules_hash,
+                should_respond=decision.should_respond,
+                reason=decision.reason,
+                created_at=datetime.now()
+            ))
+            session.commit()
+        except IntegrityError:
+            # the same decision was stored concurrently
+            session.rollback()
+        except Exception as e:
+            session.rollback()
+            log_message(self.logger, "error", self, f"Error storing filter decision: {e}")
+        finally:
+            session.close()
+
+        with self._lock:
+            self._puts += 1
+            rules_changed = rules_hash != self._current_rules_hash
+            self._current_rules_hash = rules_hash
+            prune = rules_changed or self._puts % self.prune_every == 0
+        if prune:
+            self.prune(rules_hash)
+
+
+    def prune(self, rules_hash: str):
+        """Delete the character's rows of other rules, expired rows and the oldest rows above max_rows."""
+        session = self.Session()
+        try:
+            session.execute(delete(SiaFilterDecisionModel).where(
+                (
+                    (SiaFilterDecisionModel.character_name_id == self.character_name_id)
+                    & (SiaFilterDecisionModel.rules_hash != rules_hash)
+                )
+                | (SiaFilterDecisionModel.created_at < datetime.now() - timedelta(seconds=self.ttl))
+            ).execution_options(synchronize_session=False))
+            surplus = session.execute(
+                select(func.count()).select_from(SiaFilterDecisionModel).where(SiaFilterDecisionModel.character_name_id == self.character_name_id)
+            ).scalar() - self.max_rows
+            if surplus > 0:
+                oldest = select(SiaFilterDecisionModel.key).where(
+                    SiaFilterDecisionModel.character_name_id == self.character_name_id
+                ).order_by(SiaFilterDecisionModel.created_at).limit(surplus)
+                session.execute(delete(SiaFilterDecisionModel).where(SiaFilterDecisionModel.key.in_(oldest)).execution_options(synchronize_session=False))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            log_message(self.logger, "error", self, f"Error pruning filter decisions: {e}")
+        finally:
+            session.close()
+
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
@@ -1,21 +1,44 @@
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, asc, desc, or_, and_
-from .models_db import SiaMessageModel, SiaCharacterSettingsModel, Base
-from .schemas import SiaMessageSchema, SiaMessageGeneratedSchema, SiaCharacterSettingsSchema
+from sqlalchemy.exc import IntegrityError
+from .models_db import SiaMessageModel, SiaIngestionCursorModel, Base
+from .schemas import SiaMessageSchema, SiaMessageGeneratedSchema, SiaMessageRow, SiaCharacterSettingsSchema, SiaIngestionCursorSchema, SiaEngineProfileSchema, SiaRetentionPolicySchema
+from .engine import create_sia_engine
+from .recent_posts import SiaRecentPostsBuffer
+from .transcripts import SiaConversationTranscripts
+from .settings_store import SiaCharacterSettingsStore
+from .retention import SiaMessageRetention
+from .filter_decisions import SiaFilterDecisionCache
+from .novelty import SiaNoveltyIndex
+from .reply_queue import SiaReplyQueue
+from . import queries
 from sia.character import SiaCharacter
 import json
 
 from utils.logging_utils import setup_logging, log_message, enable_logging
 
+
 class SiaMemory:
 
-    def __init__(self, db_path: str, character: SiaCharacter):
+    def __init__(self, db_path: str, character: SiaCharacter, engine_profile: SiaEngineProfileSchema = None, retention_policy: SiaRetentionPolicySchema = None):
         self.db_path = db_path
         self.character = character
-        self.engine = create_engine(self.db_path)
+        self.engine_profile = engine_profile or SiaEngineProfileSchema.from_env()
+        self.engine = create_sia_engine(self.db_path, self.engine_profile)
         Base.metadata.create_all(self.engine)
+        # a new session per call: methods open and close their own session, so
+        # nested calls on one thread never close the caller's session
         self.Session = sessionmaker(bind=self.engine)
+        self.recent_posts = SiaRecentPostsBuffer()
+        self.transcripts = SiaConversationTranscripts()
+        self.settings = SiaCharacterSettingsStore(self.Session, self.character.name_id)
         self.logging_enabled = self.character.logging_enabled
+        self.retention = SiaMessageRetention(self.Session, retention_policy, logging_enabled=self.logging_enabled)
+        self.filter_decisions = SiaFilterDecisionCache(self.Session, self.character.name_id, logging_enabled=self.logging_enabled)
+        self.novelty = SiaNoveltyIndex(self.Session, self.character.name, archived_posts=lambda: (
+            message.content for message in self.retention.iter_archived_messages(character=self.character.name)
+            if self.recent_posts.is_post(message) and not message.flagged
+        ))
+        self.reply_queue = SiaReplyQueue(self.Session, self.character.name_id, logging_enabled=self.logging_enabled)
 
         self.logger = setup_logging()
         enable_logging(self.logging_enabled)
@@ -47,7 +70,6 @@ class SiaMemory:
 
             # Convert the model to a schema
             message_schema = SiaMessageSchema.from_orm(message_model)
-            return message_schema
         
         except Exception as e:
             log_message(self.logger, "error", self, f"Error adding message to database: {e}")
@@ -57,85 +79,255 @@ class SiaMemory:
         
         finally:
             session.close()
-        
 
-    def get_messages(self, id=None, platform: str = None, author: str = None, not_author: str = None, character: str = None, conversation_id: str = None, flagged: bool = False, sort_by: str = None, sort_order: str = "asc", is_post: bool = None, from_datetime=None):
+        self._cache_added(message_schema)
+        return message_schema
+
+
+    def _cache_added(self, message_schema: SiaMessageSchema):
+        """
+        Add a stored message to the in-process caches. The row is committed
+        already, so a failing cache is logged, not raised: the caller must not
+        retry (and e.g. tweet again) for a message that is stored.
+        """
+        for cache in (self.recent_posts, self.transcripts, self.novelty):
+            try:
+                cache.add(message_schema)
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error caching message {message_schema.id} in {type(cache).__name__}: {e}")
+
+
+    def add_messages(self, messages: list[tuple[str, SiaMessageGeneratedSchema, dict|None]]) -> list[SiaMessageSchema]:
+        """
+        Add a batch of messages in one transaction.
+
+        Input: list of (message_id, message, original_data) tuples.
+        Messages whose id is already stored are skipped (ON CONFLICT DO NOTHING on
+        SQLite and Postgres), so the same page can be ingested twice safely.
+
+        Output: the newly inserted messages, in input order.
+        """
+        rows = queries.message_rows(messages)
+        if not rows:
+            return []
+
         session = self.Session()
-        query = session.query(SiaMessageModel)
-        if id:
-            query = query.filter_by(id=id)
-        if character:
-            query = query.filter_by(character=character)
-        if platform:
-            query = query.filter_by(platform=platform)
-        if author:
-            query = query.filter_by(author=author)
-        if not_author:
-            query = query.filter(SiaMessageModel.author != not_author)
-        if conversation_id:
-            query = query.filter_by(conversation_id=conversation_id)
-        if from_datetime:
-            query = query.filter(SiaMessageModel.wen_posted >= from_datetime)
-        # if is_post is not None:
-        if is_post:
-            # For posts: id matches conversation_id or conversation_id is None
-            query = query.filter(or_(
-                SiaMessageModel.id == SiaMessageModel.conversation_id,
-                SiaMessageModel.conversation_id == None
-            ))
-            # else:
-            #     # For responses: id does not match conversation_id and conversation_id is not None
-            #     query = query.filter(and_(
-            #         SiaMessageModel.id != SiaMessageModel.conversation_id,
-            #         SiaMessageModel.conversation_id != None
-            #     ))
-        query = query.filter_by(flagged=flagged)
-        if sort_by:
-            if sort_order == "asc":
-                query = query.order_by(asc(sort_by))
+        try:
+            inserted_ids = set()
+            statements = queries.insert_messages_ignoring_conflicts(self.engine.dialect.name, list(rows.values()))
+            if statements is not None:
+                for stmt in statements:
+                    inserted_ids.update(session.execute(stmt).scalars())
             else:
-                query = query.order_by(desc(sort_by))
-        posts = query.all()
-        session.close()
-        return [SiaMessageSchema.from_orm(post) for post in posts]
+                for row in rows.values():
+                    try:
+                        with session.begin_nested():
+                            session.add(SiaMessageModel(**row))
+                        inserted_ids.add(row["id"])
+                    except IntegrityError:
+                        pass
+            session.commit()
+
+        except Exception as e:
+            log_message(self.logger, "error", self, f"Error adding messages to database: {e}")
+            session.rollback()
+            raise e
+
+        finally:
+            session.close()
+
+        inserted = [SiaMessageSchema(**row) for message_id, row in rows.items() if message_id in inserted_ids]
+        for message_schema in inserted:
+            self._cache_added(message_schema)
+        return inserted
+
+
+    def get_messages(self, id=None, platform: str = None, author: str = None, not_author: str = None, character: str = None, conversation_id: str = None, flagged: bool = False, sort_by: str = None, sort_order: str = "asc", is_post: bool = None, from_datetime=None, fields: list[str] = None) -> list[SiaMessageSchema]|list[SiaMessageRow]:
+        """
+        Get messages matching the filters.
+
+        If fields is given, only those columns are read and SiaMessageRow objects are
+        returned instead of SiaMessageSchema, which is much cheaper for large results.
+        """
+        query = queries.select_messages(
+            id=id, platform=platform, author=author, not_author=not_author, character=character,
+            conversation_id=conversation_id, flagged=flagged, sort_by=sort_by, sort_order=sort_order,
+            is_post=is_post, from_datetime=from_datetime, fields=fields
+        )
+        session = self.Session()
+        try:
+            if fields:
+                return [SiaMessageRow(dict(post._mapping)) for post in session.execute(query).all()]
+            return [SiaMessageSchema.from_orm(post) for post in session.execute(query).scalars().all()]
+        finally:
+            session.close()
     
     
+    def get_recent_posts(self, character: str = None, platform: str = "twitter", limit: int = 10) -> list[SiaMessageSchema]:
+        """
+        Get the latest posts (not replies) of the character on the platform, oldest first.
+        Served from the in-process ring buffer once it has been loaded.
+        """
+        character = character or self.character.name
+        
+        if limit <= self.recent_posts.size:
+            posts = self.recent_posts.get(character, platform, limit)
+            if posts is not None:
+                return posts
+        
+        writes_count = self.recent_posts.writes_count(character, platform)
+        session = self.Session()
+        try:
+            posts = session.execute(queries.select_recent_posts(character, platform, max(limit, self.recent_posts.size))).all()
+            posts = [SiaMessageRow(dict(post._mapping)).to_schema() for post in reversed(posts)]
+        finally:
+            session.close()
+        
+        if limit <= self.recent_posts.size:
+            self.recent_posts.load(character, platform, posts, writes_count)
+        
+        return posts[-limit:] if limit else []
+
+
+    def get_conversation_window(self, conversation_id: str, window: int = 20, fields: list[str] = None) -> list[SiaMessageRow]:
+        """
+        Root message and the latest `window` other messages of a conversation, oldest first.
+        Only the window is read from the database, however long the conversation is.
+        """
+        fields = fields or queries.CONVERSATION_FIELDS
+        session = self.Session()
+        try:
+            root = session.execute(queries.select_conversation_root(conversation_id, fields)).all()
+            tail = session.execute(queries.select_conversation_tail(conversation_id, window, fields)).all()
+            return [SiaMessageRow(dict(message._mapping)) for message in root + tail[::-1]]
+        finally:
+            session.close()
+
+
+    def get_conversation_transcript(self, conversation_id: str, window: int = 20) -> str:
+        """
+        The conversation formatted for prompts, one "[wen_posted] author: content" line per message.
+        Served from the transcripts cache when window matches its window.
+        """
+        if not conversation_id:
+            return ""
+        if window != self.transcripts.window:
+            messages = self.get_conversation_window(conversation_id, window)
+            return "\n".join(self.transcripts.format_message(message) for message in messages)
+
+        transcript = self.transcripts.get(conversation_id)
+        if transcript is not None:
+            return transcript
+
+        writes_count = self.transcripts.begin_load(conversation_id)
+        messages = None
+        try:
+            messages = self.get_conversation_window(conversation_id, window)
+        finally:
+            self.transcripts.finish_load(conversation_id, writes_count, messages)
+        return "\n".join(self.transcripts.format_message(message) for message in messages)
+
+
+    def get_latest_message_id(self, platform: str, not_author: str = None) -> str|None:
+        """
+        Get the highest message id on the platform.
+        Ids are compared numerically (by length first), as Twitter snowflake ids differ in length.
+        """
+        session = self.Session()
+        try:
+            latest = session.execute(queries.select_latest_message_id(platform, not_author)).first()
+            return latest.id if latest else None
+        finally:
+            session.close()
+
+
+    def get_ingestion_cursor(self, platform: str) -> SiaIngestionCursorSchema|None:
+        session = self.Session()
+        try:
+            cursor = session.execute(queries.select_ingestion_cursor(self.character.name_id, platform)).scalars().first()
+            return SiaIngestionCursorSchema.from_orm(cursor) if cursor else None
+        finally:
+            session.close()
+
+
+    def advance_ingestion_cursor(self, platform: str, last_id: str) -> SiaIngestionCursorSchema:
+        """
+        Move the ingestion cursor of the character on the platform forward to last_id.
+        The cursor never moves backwards.
+        """
+        session = self.Session()
+        try:
+            updated = session.execute(queries.advance_ingestion_cursor(self.character.name_id, platform, last_id)).rowcount
+            if not updated:
+                cursor_exists = session.execute(queries.select_ingestion_cursor(self.character.name_id, platform)).first()
+                if not cursor_exists:
+                    session.add(SiaIngestionCursorModel(character_name_id=self.character.name_id, platform=platform, last_id=last_id))
+            session.commit()
+
+        except IntegrityError:
+            # another writer has created the cursor in the meantime
+            session.rollback()
+            session.close()
+            return self.advance_ingestion_cursor(platform, last_id)
+        
+        finally:
+            session.close()
+
+        return self.get_ingestion_cursor(platform)
+
+
+    def update_ingestion_backlog(self, platform: str, next_token: str|None, backlog_newest_id: str|None) -> SiaIngestionCursorSchema:
+        """
+        Save the position in a backlog that is ingested page by page, so that an
+        interrupted ingestion resumes from next_token. Pass None, None once the
+        backlog has been drained.
+        """
+        session = self.Session()
+        try:
+            updated = session.execute(queries.update_ingestion_backlog(self.character.name_id, platform, next_token, backlog_newest_id)).rowcount
+            if not updated:
+                session.add(SiaIngestionCursorModel(character_name_id=self.character.name_id, platform=platform, next_token=next_token, backlog_newest_id=backlog_newest_id))
+            session.commit()
+
+        except IntegrityError:
+            # another writer has created the cursor in the meantime
+            session.rollback()
+            session.close()
+            return self.update_ingestion_backlog(platform, next_token, backlog_newest_id)
+
+        finally:
+            session.close()
+
+        return self.get_ingestion_cursor(platform)
+
+
     def clear_messages(self):
         session = self.Session()
         session.query(SiaMessageModel).filter_by(character=self.character.name).delete()
         session.commit()
         session.close()
+        self.recent_posts.clear(character=self.character.name)
+        self.transcripts.clear()
+        self.novelty.clear()
+        self.reply_queue.clear()
 
 
     def reset_database(self):
         Base.metadata.drop_all(self.engine)
         Base.metadata.create_all(self.engine)
+        self.recent_posts.clear()
+        self.transcripts.clear()
+        self.novelty.clear()
 
 
-    def get_character_settings(self):
-        session = self.Session()
-        try:
-            character_settings = session.query(SiaCharacterSettingsModel).filter_by(character_name_id=self.character.name_id).first()
-            if not character_settings:
-                character_settings = SiaCharacterSettingsModel(
-                    character_name_id=self.character.name_id,
-                    character_settings={}
-                )
-                session.add(character_settings)
-                session.commit()
-            
-            # Convert the SQLAlchemy model to a Pydantic schema before closing the session
-            character_settings_schema = SiaCharacterSettingsSchema.from_orm(character_settings)
-            return character_settings_schema
-
-        finally:
-            session.close()
+    def get_character_settings(self) -> SiaCharacterSettingsSchema:
+        """Served from the settings store cache; see SiaCharacterSettingsStore."""
+        return self.settings.get_schema()
     
         
     def update_character_settings(self, character_settings: SiaCharacterSettingsSchema):
-        session = self.Session()
-        # Convert the Pydantic schema to a dictionary
-        character_settings_dict = character_settings.dict(exclude_unset=True)
-        session.query(SiaCharacterSettingsModel).filter_by(character_name_id=self.character.name_id).update(character_settings_dict)
-        session.commit()
-        session.close()
+        """
+        Replace all settings of the character.
+        Prefer self.settings.patch() for changing single keys, it does not drop keys written by others.
+        """
+        self.settings.replace(character_settings.character_settings)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, Float, JSON, DateTime, Boolean, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 from uuid import uuid4
@@ -20,6 +20,41 @@ class SiaMessageModel(Base):
     flagged = Column(Boolean, nullable=True, default=False)
     message_metadata = Column(JSON)
 
+    __table_args__ = (
+        # conversation building: conversation_id = ? ORDER BY wen_posted
+        Index('ix_message_conversation_id_wen_posted', 'conversation_id', 'wen_posted'),
+        # own tweets and mentions: platform = ? AND author = ?
+        Index('ix_message_platform_author_wen_posted', 'platform', 'author', 'wen_posted'),
+        # recent messages of a character on a platform
+        Index('ix_message_character_platform_wen_posted', 'character', 'platform', 'wen_posted'),
+    )
+
+
+class SiaMessageArchiveModel(Base):
+    """
+    Cold storage for messages moved out of the message table by the retention policy.
+    The full row is kept as zlib-compressed JSON in payload; the columns needed
+    to find archived messages are kept uncompressed.
+    """
+    __tablename__ = 'message_archive'
+
+    id = Column(String, primary_key=True)
+    conversation_id = Column(String)
+    character = Column(String)
+    platform = Column(String, nullable=False)
+    author = Column(String, nullable=False)
+    wen_posted = Column(DateTime)
+    # month of wen_posted, "YYYY-MM"; the unit in which archived messages are purged
+    partition = Column(String, nullable=False)
+    archived_at = Column(DateTime, default=lambda: datetime.now())
+    payload = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index('ix_message_archive_partition', 'partition'),
+        Index('ix_message_archive_conversation_id', 'conversation_id'),
+        Index('ix_message_archive_platform_author_wen_posted', 'platform', 'author', 'wen_posted'),
+    )
+
 
 class SiaCharacterSettingsModel(Base):
     __tablename__ = 'character_settings'
@@ -27,3 +62,102 @@ class SiaCharacterSettingsModel(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid4()))
     character_name_id = Column(String)
     character_settings = Column(JSON)
+    # incremented on every write, used for optimistic concurrency control
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+class SiaIngestionCursorModel(Base):
+    __tablename__ = 'ingestion_cursor'
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    character_name_id = Column(String, nullable=False)
+    platform = Column(String, nullable=False)
+    last_id = Column(String)
+    # backlog being drained page by page: token of the next page and newest id
+    # of the backlog, last_id moves to it once the last page has been stored
+    next_token = Column(String)
+    backlog_newest_id = Column(String)
+    updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now())
+
+    __table_args__ = (
+        UniqueConstraint('character_name_id', 'platform', name='uq_ingestion_cursor_character_platform'),
+    )
+
+
+class SiaFilterDecisionModel(Base):
+    """Cached results of the response filtering LLM call, see SiaFilterDecisionCache."""
+    __tablename__ = 'filter_decision'
+
+    # hash of the filtering rules, the conversation and the normalized message text
+    key = Column(String, primary_key=True)
+    character_name_id = Column(String, nullable=False)
+    rules_hash = Column(String, nullable=False)
+    should_respond = Column(Boolean, nullable=False)
+    reason = Column(String)
+    created_at = Column(DateTime, default=lambda: datetime.now())
+
+    __table_args__ = (
+        Index('ix_filter_decision_character_rules_hash', 'character_name_id', 'rules_hash'),
+        Index('ix_filter_decision_created_at', 'created_at'),
+    )
+
+
+class SiaLLMCallModel(Base):
+    """One LLM call (one attempt on one route), see SiaLLMTelemetry."""
+    __tablename__ = 'llm_call'
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    character_name_id = Column(String)
+    call_site = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    # seconds
+    wall_time = Column(Float, nullable=False)
+    time_to_first_token = Column(Float)
+    input_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    # estimated, USD
+    cost = Column(Float)
+    # ok, error, timeout or abandoned (lost a hedge, consumer stopped)
+    outcome = Column(String, nullable=False)
+    # the call was made on a route other than the preferred one
+    fallback = Column(Boolean, default=False)
+    error = Column(String)
+
+    __table_args__ = (
+        Index('ix_llm_call_call_site_started_at', 'call_site', 'started_at'),
+        Index('ix_llm_call_started_at', 'started_at'),
+    )
+
+
+class SiaReplyQueueModel(Base):
+    """A message waiting for a reply, its draft and its state, see SiaReplyQueue."""
+    __tablename__ = 'reply_queue'
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    character_name_id = Column(String, nullable=False)
+    platform = Column(String, nullable=False)
+    # the message to reply to
+    message_id = Column(String, nullable=False)
+    conversation_id = Column(String)
+    author = Column(String)
+    wen_posted = Column(DateTime)
+    # priority without recency, which is added when items are picked
+    score = Column(Float, nullable=False, default=0)
+    # pending, generating, drafted, publishing, sent, skipped or failed
+    status = Column(String, nullable=False, default='pending')
+    # SiaMessageGeneratedSchema of the reply
+    draft = Column(JSON)
+    drafted_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+    # id of the published reply
+    reply_id = Column(String)
+    error = Column(String)
+    created_at = Column(DateTime, default=lambda: datetime.now())
+    updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now())
+
+    __table_args__ = (
+        UniqueConstraint('character_name_id', 'platform', 'message_id', name='uq_reply_queue_character_platform_message'),
+        Index('ix_reply_queue_character_platform_status', 'character_name_id', 'platform', 'status'),
+    )
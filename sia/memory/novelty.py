@@ -0,0 +1,135 @@
+import math
+import os
+import re
+import threading
+import zlib
+from itertools import islice
+from typing import Callable, Iterable
+
+import numpy as np
+from sqlalchemy import select
+
+from .models_db import SiaMessageModel
+from .schemas import SiaMessageSchema
+from . import queries
+
+
+WORD_RE = re.compile(r"\w+")
+
+
+def features(text: str) -> list[str]:
+    """Word unigrams and bigrams of the lowercased text, without @mentions and links."""
+    text = re.sub(r"https?://\S+|@\w+", " ", (text or "").lower())
+    words = WORD_RE.findall(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SiaNoveltyIndex:
+    """
+    Similarity of new posts to every past post of a character.
+
+    Posts are embedded as hashed n-gram vectors (word unigrams and bigrams
+    hashed into `dim` buckets, sublinear term frequency, L2-normalized) kept in
+    a NumPy matrix, so checking a draft is one matrix-vector product over the
+    whole post history. No model or network call is involved.
+
+    The index is loaded on first use from the message table and, if given,
+    archived_posts (a callable returning the contents of archived posts), and
+    then kept up to date by SiaMemory.add_message.
+    """
+
+    def __init__(self, Session, character: str, archived_posts: Callable[[], Iterable[str]] = None, dim: int = 1024, threshold: float = None, batch_size: int = 1000):
+        self.Session = Session
+        self.character = character
+        self.archived_posts = archived_posts
+        self.dim = dim
+        # cosine similarity above which a post is a repetition
+        self.threshold = threshold or float(os.getenv("POST_NOVELTY_THRESHOLD", 0.6))
+        self.batch_size = batch_size
+        self._matrix = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+
+    def vectorize(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in features(text):
+                bucket = zlib.crc32(feature.encode("utf-8")) % self.dim
+                counts[bucket] = counts.get(bucket, 0) + 1
+            for bucket, count in counts.items():
+                vectors[row, bucket] = 1 + math.log(count)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+    def _append(self, vectors: np.ndarray):
+        if self._size + len(vectors) > len(self._matrix):
+            capacity = max(2 * len(self._matrix), self._size + len(vectors))
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+        self._matrix[self._size:self._size + len(vectors)] = vectors
+        self._size += len(vectors)
+
+
+    def _load(self):
+        """Called with the lock held, so posts added meanwhile wait for the load (and may be indexed twice, which is harmless)."""
+        self._matrix = np.zeros((self.batch_size, self.dim), dtype=np.float32)
+        self._size = 0
+        query = select(SiaMessageModel.content).where(
+            SiaMessageModel.character == self.character,
+            SiaMessageModel.flagged == False,
+            queries.is_post_condition()
+        ).execution_options(yield_per=self.batch_size)
+
+        session = self.Session()
+        try:
+            for partition in session.execute(query).scalars().partitions():
+                self._append(self.vectorize(list(partition)))
+        finally:
+            session.close()
+
+        if self.archived_posts:
+            contents = iter(self.archived_posts())
+            while batch := list(islice(contents, self.batch_size)):
+                self._append(self.vectorize(batch))
+
+
+    def add(self, message: SiaMessageSchema):
+        is_post = message.conversation_id is None or message.conversation_id == message.id
+        if not is_post or message.flagged or message.character != self.character:
+            return
+        with self._lock:
+            if self._matrix is not None:
+                self._append(self.vectorize([message.content]))
+
+
+    def size(self) -> int:
+        with self._lock:
+            if self._matrix is None:
+                self._load()
+            return self._size
+
+
+    def max_similarity(self, text: str, others: list[str] = ()) -> float:
+        """Highest cosine similarity of text to a past post or to one of others (e.g. other drafts)."""
+        vector = self.vectorize([text])[0]
+        with self._lock:
+            if self._matrix is None:
+                self._load()
+            similarities = self._matrix[:self._size] @ vector
+        if others:
+            similarities = np.concatenate([similarities, self.vectorize(list(others)) @ vector])
+        return float(similarities.max()) if len(similarities) else 0.0
+
+
+    def is_novel(self, text: str, others: list[str] = ()) -> bool:
+        return self.max_similarity(text, others) <= self.threshold
+
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._size = 0
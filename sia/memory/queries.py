@@ -0,0 +1,245 @@
+"""
+SQL statements used by both SiaMemory and AsyncSiaMemory.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, asc, desc, or_, and_, func, cast, Text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+
+from .models_db import SiaMessageModel, SiaMessageArchiveModel, SiaCharacterSettingsModel, SiaIngestionCursorModel
+from .schemas import SiaMessageGeneratedSchema, SiaMessageRow
+
+
+# rows per INSERT statement in add_messages
+ADD_MESSAGES_CHUNK_SIZE = 50
+
+# all message columns except the JSON blobs
+MESSAGE_SUMMARY_FIELDS = ["id", "conversation_id", "character", "platform", "author", "content", "response_to", "wen_posted", "flagged"]
+
+# what a conversation transcript needs
+CONVERSATION_FIELDS = ["id", "conversation_id", "author", "content", "wen_posted"]
+
+
+def message_columns(fields: list[str]):
+    """
+    Columns to select for a projected messages query.
+    JSON columns are selected as text so that they are decoded only if accessed.
+    """
+    columns = []
+    for field in fields:
+        column = SiaMessageModel.__table__.columns.get(field)
+        if column is None:
+            raise ValueError(f"Unknown message field: {field}")
+        if field in SiaMessageRow.json_fields:
+            columns.append(cast(column, Text).label(field))
+        else:
+            columns.append(getattr(SiaMessageModel, field))
+    return columns
+
+
+def is_post_condition():
+    # For posts: id matches conversation_id or conversation_id is None
+    return or_(
+        SiaMessageModel.id == SiaMessageModel.conversation_id,
+        SiaMessageModel.conversation_id == None
+    )
+
+
+def select_messages(id=None, platform: str = None, author: str = None, not_author: str = None, character: str = None, conversation_id: str = None, flagged: bool = False, sort_by: str = None, sort_order: str = "asc", is_post: bool = None, from_datetime=None, fields: list[str] = None):
+    if fields:
+        query = select(*message_columns(fields))
+    else:
+        query = select(SiaMessageModel)
+    if id:
+        query = query.where(SiaMessageModel.id == id)
+    if character:
+        query = query.where(SiaMessageModel.character == character)
+    if platform:
+        query = query.where(SiaMessageModel.platform == platform)
+    if author:
+        query = query.where(SiaMessageModel.author == author)
+    if not_author:
+        query = query.where(SiaMessageModel.author != not_author)
+    if conversation_id:
+        query = query.where(SiaMessageModel.conversation_id == conversation_id)
+    if from_datetime:
+        query = query.where(SiaMessageModel.wen_posted >= from_datetime)
+    if is_post:
+        query = query.where(is_post_condition())
+    query = query.where(SiaMessageModel.flagged == flagged)
+    if sort_by:
+        sort_column = getattr(SiaMessageModel, sort_by)
+        if sort_order == "asc":
+            query = query.order_by(asc(sort_column))
+        else:
+            query = query.order_by(desc(sort_column))
+    return query
+
+
+def select_recent_posts(character: str, platform: str, limit: int):
+    """Latest posts, newest first, without the JSON blobs."""
+    return select(*message_columns(MESSAGE_SUMMARY_FIELDS)).where(
+        SiaMessageModel.character == character,
+        SiaMessageModel.platform == platform,
+        SiaMessageModel.flagged == False,
+        is_post_condition()
+    ).order_by(desc(SiaMessageModel.wen_posted)).limit(limit)
+
+
+def select_conversation_root(conversation_id: str, fields: list[str] = CONVERSATION_FIELDS):
+    return select(*message_columns(fields)).where(
+        SiaMessageModel.id == conversation_id,
+        SiaMessageModel.flagged == False
+    )
+
+
+def select_conversation_tail(conversation_id: str, window: int, fields: list[str] = CONVERSATION_FIELDS):
+    """Latest `window` messages of a conversation without its root, newest first."""
+    return select(*message_columns(fields)).where(
+        SiaMessageModel.conversation_id == conversation_id,
+        SiaMessageModel.id != conversation_id,
+        SiaMessageModel.flagged == False
+    ).order_by(desc(SiaMessageModel.wen_posted)).limit(window)
+
+
+def select_latest_message_id(platform: str, not_author: str = None):
+    """Ids are compared numerically (by length first), as Twitter snowflake ids differ in length."""
+    query = select(SiaMessageModel.id).where(SiaMessageModel.platform == platform)
+    if not_author:
+        query = query.where(SiaMessageModel.author != not_author)
+    return query.order_by(desc(func.length(SiaMessageModel.id)), desc(SiaMessageModel.id)).limit(1)
+
+
+def message_rows(messages: list[tuple[str, SiaMessageGeneratedSchema, dict|None]]) -> dict[str, dict]:
+    """Table rows for add_messages, keyed by message id (the first occurrence of an id wins)."""
+    rows = {}
+    wen_posted = datetime.now()
+    for message_id, message, original_data in messages:
+        if message_id in rows:
+            continue
+        rows[message_id] = {
+            "id": message_id,
+            "platform": message.platform,
+            "character": message.character,
+            "author": message.author,
+            "content": message.content,
+            "conversation_id": message.conversation_id,
+            "response_to": message.response_to,
+            "flagged": message.flagged,
+            "message_metadata": message.message_metadata,
+            "original_data": original_data,
+            "wen_posted": wen_posted
+        }
+    return rows
+
+
+def insert_messages_ignoring_conflicts(dialect_name: str, rows: list[dict]) -> list|None:
+    """
+    INSERT ... ON CONFLICT (id) DO NOTHING RETURNING id statements, chunked to keep
+    the number of bound parameters below SQLite's limit.
+    None if the dialect has no upsert support.
+    """
+    if dialect_name == "sqlite":
+        insert = sqlite_insert
+    elif dialect_name == "postgresql":
+        insert = postgresql_insert
+    else:
+        return None
+    return [
+        insert(SiaMessageModel).values(rows[i:i + ADD_MESSAGES_CHUNK_SIZE]).on_conflict_do_nothing(index_elements=["id"]).returning(SiaMessageModel.id)
+        for i in range(0, len(rows), ADD_MESSAGES_CHUNK_SIZE)
+    ]
+
+
+def select_ingestion_cursor(character_name_id: str, platform: str):
+    return select(SiaIngestionCursorModel).where(
+        SiaIngestionCursorModel.character_name_id == character_name_id,
+        SiaIngestionCursorModel.platform == platform
+    )
+
+
+def advance_ingestion_cursor(character_name_id: str, platform: str, last_id: str):
+    """
+    UPDATE moving the cursor to last_id only if last_id is newer.
+    The comparison happens inside the statement, so concurrent writers can never move the cursor backwards.
+    """
+    is_newer = or_(
+        SiaIngestionCursorModel.last_id == None,
+        func.length(SiaIngestionCursorModel.last_id) < len(last_id),
+        and_(
+            func.length(SiaIngestionCursorModel.last_id) == len(last_id),
+            SiaIngestionCursorModel.last_id < last_id
+        )
+    )
+    return update(SiaIngestionCursorModel).where(
+        SiaIngestionCursorModel.character_name_id == character_name_id,
+        SiaIngestionCursorModel.platform == platform,
+        is_newer
+    ).values(last_id=last_id).execution_options(synchronize_session=False)
+
+
+def update_ingestion_backlog(character_name_id: str, platform: str, next_token: str|None, backlog_newest_id: str|None):
+    return update(SiaIngestionCursorModel).where(
+        SiaIngestionCursorModel.character_name_id == character_name_id,
+        SiaIngestionCursorModel.platform == platform
+    ).values(next_token=next_token, backlog_newest_id=backlog_newest_id, updated_at=datetime.now())
+
+
+def select_character_settings(character_name_id: str):
+    return select(SiaCharacterSettingsModel).where(SiaCharacterSettingsModel.character_name_id == character_name_id)
+
+
+def update_character_settings(character_name_id: str):
+    return update(SiaCharacterSettingsModel).where(SiaCharacterSettingsModel.character_name_id == character_name_id)
+
+
+def conversation_key():
+    # posts have no conversation_id (or their own id), replies have the id of the post
+    return func.coalesce(SiaMessageModel.conversation_id, SiaMessageModel.id)
+
+
+def select_archivable_messages(cutoff: datetime, limit: int):
+    """
+    Full rows of messages posted before cutoff, oldest first, except messages
+    of conversations with messages posted after cutoff.
+    """
+    live_conversations = select(conversation_key()).where(SiaMessageModel.wen_posted >= cutoff)
+    return select(SiaMessageModel.__table__).where(
+        SiaMessageModel.wen_posted < cutoff,
+        conversation_key().not_in(live_conversations)
+    ).order_by(asc(SiaMessageModel.wen_posted)).limit(limit)
+
+
+def select_archived_messages(ids: list[str] = None, platform: str = None, author: str = None, character: str = None, conversation_id: str = None, from_datetime: datetime = None, to_datetime: datetime = None):
+    """Ids and payloads of archived messages, oldest first."""
+    query = select(SiaMessageArchiveModel.id, SiaMessageArchiveModel.payload)
+    if ids is not None:
+        query = query.where(SiaMessageArchiveModel.id.in_(ids))
+    if platform:
+        query = query.where(SiaMessageArchiveModel.platform == platform)
+    if author:
+        query = query.where(SiaMessageArchiveModel.author == author)
+    if character:
+        query = query.where(SiaMessageArchiveModel.character == character)
+    if conversation_id:
+        query = query.where(SiaMessageArchiveModel.conversation_id == conversation_id)
+    if from_datetime:
+        query = query.where(SiaMessageArchiveModel.wen_posted >= from_datetime)
+    if to_datetime:
+        query = query.where(SiaMessageArchiveModel.wen_posted < to_datetime)
+    return query.order_by(asc(SiaMessageArchiveModel.wen_posted), asc(SiaMessageArchiveModel.id))
+
+
+def delete_archived_messages(ids: list[str]):
+    return delete(SiaMessageArchiveModel).where(SiaMessageArchiveModel.id.in_(ids)).execution_options(synchronize_session=False)
+
+
+def delete_archive_partitions_before(partition: str):
+    """Delete archived messages of all months before partition ("YYYY-MM")."""
+    return delete(SiaMessageArchiveModel).where(SiaMessageArchiveModel.partition < partition).execution_options(synchronize_session=False)
+
+
+def delete_messages(ids: list[str]):
+    return delete(SiaMessageModel).where(SiaMessageModel.id.in_(ids)).execution_options(synchronize_session=False)
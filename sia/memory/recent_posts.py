@@ -0,0 +1,66 @@
+from collections import deque
+import threading
+
+from .schemas import SiaMessageSchema
+
+
+class SiaRecentPostsBuffer:
+    """
+    In-process ring buffer with the latest posts of each character on each platform.
+
+    A buffer is loaded from the database on first use and then kept up to date
+    by SiaMemory.add_message, so reading recent posts does not touch the database.
+    """
+
+    def __init__(self, size: int = 50):
+        self.size = size
+        self._buffers = {}
+        self._writes = {}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def is_post(message: SiaMessageSchema) -> bool:
+        return message.conversation_id is None or message.conversation_id == message.id
+
+
+    def get(self, character: str, platform: str, limit: int) -> list[SiaMessageSchema]|None:
+        """Latest posts, oldest first, or None if the buffer has not been loaded yet."""
+        with self._lock:
+            buffer = self._buffers.get((character, platform))
+            if buffer is None:
+                return None
+            return list(buffer)[-limit:] if limit else []
+
+
+    def writes_count(self, character: str, platform: str) -> int:
+        with self._lock:
+            return self._writes.get((character, platform), 0)
+
+
+    def load(self, character: str, platform: str, posts: list[SiaMessageSchema], writes_count: int):
+        """
+        Fill the buffer with posts read from the database (oldest first).
+        Skipped if a post was added after the database read started, as the read may have missed it.
+        """
+        with self._lock:
+            if self._writes.get((character, platform), 0) != writes_count:
+                return
+            self._buffers[(character, platform)] = deque(posts, maxlen=self.size)
+
+
+    def add(self, message: SiaMessageSchema):
+        if not self.is_post(message) or message.flagged:
+            return
+        key = (message.character, message.platform)
+        with self._lock:
+            self._writes[key] = self._writes.get(key, 0) + 1
+            if key in self._buffers:
+                self._buffers[key].append(message)
+
+
+    def clear(self, character: str = None):
+        with self._lock:
+            for key in list(self._buffers):
+                if character is None or key[0] == character:
+                    del self._buffers[key]
@@ -0,0 +1,353 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+
+from .models_db import SiaReplyQueueModel, SiaMessageModel
+from .schemas import SiaMessageSchema, SiaMessageGeneratedSchema, SiaReplyQueueItemSchema
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+# weights of the reply priority terms, each term is between -1 and 1
+DEFAULT_WEIGHTS = {
+    # the character already takes part in the conversation (negative once it is deeper than max_depth)
+    "conversation": 2.0,
+    # messages received from the author before
+    "author": 1.0,
+    # halves every recency_half_life seconds
+    "recency": 3.0,
+}
+
+# states of a finished item
+DONE = ("sent", "skipped", "failed")
+
+
+class SiaReplyQueue:
+    """
+    Messages to reply to, in the reply_queue table, so that queued messages and
+    generated drafts survive restarts.
+
+    An item goes pending -> generating -> drafted -> publishing -> sent.
+    Generation workers claim the pending item with the highest priority; the
+    publisher takes the drafted item with the highest priority whenever pacing
+    allows a reply, so drafts are generated ahead of time while the publisher
+    waits. An item is publishing from before the API call until it is marked
+    sent, so a published reply is never taken again.
+
+    Priority = score + recency. The score is computed once when a message is
+    queued, from the conversation (is the character already talking there, and
+    how deep) and the author's history; recency decays with the message's age
+    and is added when items are picked.
+
+    Pending messages older than max_age are skipped, drafts older than
+    draft_max_age are generated again, and at most max_pending messages wait
+    (the lowest priorities are skipped). Finished items are deleted after keep_days.
+    """
+
+    def __init__(self, Session, character_name_id: str, weights: dict = None, max_depth: int = 5, author_history_cap: int = 20, recency_half_life: float = 3600, max_pending: int = 100, max_age: float = 24 * 3600, draft_max_age: float = 2 * 3600, max_attempts: int = 3, keep_days: int = 7, logging_enabled: bool = True):
+        self.Session = Session
+        self.character_name_id = character_name_id
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.max_depth = max_depth
+        self.author_history_cap = author_history_cap
+        self.recency_half_life = recency_half_life
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.draft_max_age = draft_max_age
+        self.max_attempts = max_attempts
+        self.keep_days = keep_days
+        self._last_prune = 0
+        self._lock = threading.Lock()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    def _scores(self, session, platform: str, character_author: str, messages: list[SiaMessageSchema]) -> list[float]:
+        conversation_ids = {message.conversation_id for message in messages if message.conversation_id}
+        character_replies = dict(session.execute(
+            select(SiaMessageModel.conversation_id, func.count())
+            .where(SiaMessageModel.platform == platform, SiaMessageModel.author == character_author, SiaMessageModel.conversation_id.in_(conversation_ids))
+            .group_by(SiaMessageModel.conversation_id)
+        ).all()) if conversation_ids and character_author else {}
+
+        authors = {message.author for message in messages}
+        author_messages = dict(session.execute(
+            select(SiaMessageModel.author, func.count())
+            .where(SiaMessageModel.platform == platform, SiaMessageModel.author.in_(authors))
+            .group_by(SiaMessageModel.author)
+        ).all())
+        # the queued messages are stored already: only count the ones before them
+        for message in messages:
+            author_messages[message.author] = author_messages.get(message.author, 0) - 1
+
+        scores = []
+        for message in messages:
+            depth = character_replies.get(message.conversation_id, 0)
+            conversation = 0 if depth == 0 else (1 if depth <= self.max_depth else -1)
+            author = min(max(author_messages.get(message.author, 0), 0), self.author_history_cap) / self.author_history_cap
+            scores.append(self.weights["conversation"] * conversation + self.weights["author"] * author)
+        return scores
+
+
+    def priority(self, score: float, wen_posted: datetime|None, now: datetime = None) -> float:
+        age = max(0, ((now or datetime.now()) - wen_posted).total_seconds()) if wen_posted else 0
+        return score + self.weights["recency"] * 0.5 ** (age / self.recency_half_life)
+
+
+    def push(self, platform: str, messages: list[SiaMessageSchema], character_author: str = None) -> int:
+        """
+        Queue messages to reply to (messages queued before are ignored).
+        character_author: the character's author name on the platform, for the conversation term of the score.
+        Returns the number of queued messages.
+        """
+        if not messages:
+            return 0
+
+        session = self.Session()
+        try:
+            known = set(session.execute(
+                select(SiaReplyQueueModel.message_id).where(
+                    SiaReplyQueueModel.character_name_id == self.character_name_id,
+                    SiaReplyQueueModel.platform == platform,
+                    SiaReplyQueueModel.message_id.in_([message.id for message in messages])
+                )
+            ).scalars())
+            messages = list({message.id: message for message in messages if message.id not in known}.values())
+            if not messages:
+                return 0
+
+            for message, score in zip(messages, self._scores(session, platform, character_author, messages)):
+                session.add(SiaReplyQueueModel(
+                    character_name_id=self.character_name_id,
+                    platform=platform,
+                    message_id=message.id,
+                    conversation_id=message.conversation_id,
+                    author=message.author,
+                    wen_posted=message.wen_posted,
+                    score=score
+                ))
+            session.commit()
+
+        except IntegrityError:
+            # another writer has queued some of the messages in the meantime
+            session.rollback()
+            session.close()
+            return self.push(platform, messages, character_author)
+
+        finally:
+            session.close()
+
+        self._trim(platform)
+        self.prune()
+        return len(messages)
+
+
+    def _pending(self, session, platform: str) -> list:
+        return session.execute(
+            select(SiaReplyQueueModel.id, SiaReplyQueueModel.score, SiaReplyQueueModel.wen_posted, SiaReplyQueueModel.created_at).where(
+                SiaReplyQueueModel.character_name_id == self.character_name_id,
+                SiaReplyQueueModel.platform == platform,
+                SiaReplyQueueModel.status == "pending"
+            )
+        ).all()
+
+
+    def _set_status(self, session, ids: list[str], status: str, from_status: str = None, **values) -> int:
+        query = update(SiaReplyQueueModel).where(SiaReplyQueueModel.id.in_(ids))
+        if from_status:
+            query = query.where(SiaReplyQueueModel.status == from_status)
+        return session.execute(query.values(status=status, updated_at=datetime.now(), **values).execution_options(synchronize_session=False)).rowcount
+
+
+    def _trim(self, platform: str):
+        """Skip the pending messages that are too old, and the lowest priorities above max_pending."""
+        session = self.Session()
+        try:
+            now = datetime.now()
+            pending = self._pending(session, platform)
+            too_old = [row.id for row in pending if (row.wen_posted or row.created_at) < now - timedelta(seconds=self.max_age)]
+            pending = sorted((row for row in pending if row.id not in set(too_old)), key=lambda row: -self.priority(row.score, row.wen_posted, now))
+            surplus = [row.id for row in pending[self.max_pending:]]
+            if too_old:
+                self._set_status(session, too_old, "skipped", "pending", error="too old")
+            if surplus:
+                self._set_status(session, surplus, "skipped", "pending", error="queue full")
+            session.commit()
+            if surplus:
+                log_message(self.logger, "info", self, f"Reply queue is full, skipped {len(surplus)} messages")
+        finally:
+            session.close()
+
+
+    def claim(self, platform: str) -> SiaReplyQueueItemSchema|None:
+        """Take the pending item with the highest priority for generation, or None if there is none."""
+        self._trim(platform)
+        session = self.Session()
+        try:
+            now = datetime.now()
+            for row in sorted(self._pending(session, platform), key=lambda row: -self.priority(row.score, row.wen_posted, now)):
+                # another worker may have claimed it first
+                if self._set_status(session, [row.id], "generating", "pending"):
+                    session.commit()
+                    return SiaReplyQueueItemSchema.from_orm(session.get(SiaReplyQueueModel, row.id))
+            return None
+        finally:
+            session.close()
+
+
+    def save_draft(self, item_id: str, draft: SiaMessageGeneratedSchema|None) -> None:
+        """Store the generated reply; None (nothing to reply) skips the item."""
+        session = self.Session()
+        try:
+            if draft is None:
+                self._set_status(session, [item_id], "skipped", error="no reply generated")
+            else:
+                self._set_status(session, [item_id], "drafted", draft=draft.model_dump(mode="json"), drafted_at=datetime.now())
+            session.commit()
+        finally:
+            session.close()
+
+
+    def fail(self, item_id: str, error: str = None) -> None:
+        """Generation or publishing failed: queue the item again, or give up after max_attempts."""
+        session = self.Session()
+        try:
+            item = session.get(SiaReplyQueueModel, item_id)
+            if item is None:
+                return
+            item.attempts = (item.attempts or 0) + 1
+            item.status = "failed" if item.attempts >= self.max_attempts else "pending"
+            item.draft = None
+            item.error = str(error)[:500] if error else None
+            session.commit()
+        finally:
+            session.close()
+
+
+    def _drafted(self, session, platform: str) -> list:
+        """Drafted items; stale drafts go back to pending."""
+        rows = session.execute(
+            select(SiaReplyQueueModel.id, SiaReplyQueueModel.score, SiaReplyQueueModel.wen_posted, SiaReplyQueueModel.drafted_at).where(
+                SiaReplyQueueModel.character_name_id == self.character_name_id,
+                SiaReplyQueueModel.platform == platform,
+                SiaReplyQueueModel.status == "drafted"
+            )
+        ).all()
+        stale = [row.id for row in rows if row.drafted_at and row.drafted_at < datetime.now() - timedelta(seconds=self.draft_max_age)]
+        if stale:
+            self._set_status(session, stale, "pending", "drafted", draft=None, drafted_at=None)
+            session.commit()
+        return [row for row in rows if row.id not in set(stale)]
+
+
+    def drafted_count(self, platform: str) -> int:
+        session = self.Session()
+        try:
+            return len(self._drafted(session, platform))
+        finally:
+            session.close()
+
+
+    def next_draft(self, platform: str) -> tuple[SiaReplyQueueItemSchema, SiaMessageGeneratedSchema]|None:
+        """
+        Take the drafted item with the highest priority and its reply for publishing.
+        The item is publishing until mark_sent or fail: it is not returned again.
+        """
+        session = self.Session()
+        try:
+            now = datetime.now()
+            for row in sorted(self._drafted(session, platform), key=lambda row: -self.priority(row.score, row.wen_posted, now)):
+                if self._set_status(session, [row.id], "publishing", "drafted"):
+                    session.commit()
+                    item = SiaReplyQueueItemSchema.from_orm(session.get(SiaReplyQueueModel, row.id))
+                    return item, SiaMessageGeneratedSchema(**item.draft)
+            return None
+        finally:
+            session.close()
+
+
+    def mark_sent(self, item_id: str, reply_id: str) -> None:
+        session = self.Session()
+        try:
+            self._set_status(session, [item_id], "sent", "publishing", reply_id=reply_id, error=None)
+            session.commit()
+        finally:
+            session.close()
+
+
+    def recover(self, platform: str) -> int:
+        """
+        After a restart: queue again the items whose generation was interrupted, and
+        give up on the items whose publishing was (they may have been published).
+        Returns the number of items queued again.
+        """
+        session = self.Session()
+        try:
+            rows = session.execute(
+                select(SiaReplyQueueModel.id, SiaReplyQueueModel.status).where(
+                    SiaReplyQueueModel.character_name_id == self.character_name_id,
+                    SiaReplyQueueModel.platform == platform,
+                    SiaReplyQueueModel.status.in_(("generating", "publishing"))
+                )
+            ).all()
+            generating = [row.id for row in rows if row.status == "generating"]
+            publishing = [row.id for row in rows if row.status == "publishing"]
+            if generating:
+                self._set_status(session, generating, "pending", "generating")
+            if publishing:
+                self._set_status(session, publishing, "failed", "publishing", error="interrupted while publishing")
+            session.commit()
+            if publishing:
+                log_message(self.logger, "warning", self, f"{len(publishing)} replies were interrupted while publishing, not publishing them again")
+            return len(generating)
+        finally:
+            session.close()
+
+
+    def counts(self, platform: str) -> dict:
+        """{status: number of items}"""
+        session = self.Session()
+        try:
+            return dict(session.execute(
+                select(SiaReplyQueueModel.status, func.count()).where(
+                    SiaReplyQueueModel.character_name_id == self.character_name_id,
+                    SiaReplyQueueModel.platform == platform
+                ).group_by(SiaReplyQueueModel.status)
+            ).all())
+        finally:
+            session.close()
+
+
+    def prune(self):
+        """Delete the finished items older than keep_days, at most once an hour."""
+        with self._lock:
+            if time.monotonic() - self._last_prune < 3600:
+                return
+            self._last_prune = time.monotonic()
+
+        session = self.Session()
+        try:
+            session.execute(delete(SiaReplyQueueModel).where(
+                SiaReplyQueueModel.character_name_id == self.character_name_id,
+                SiaReplyQueueModel.status.in_(DONE),
+                SiaReplyQueueModel.updated_at < datetime.now() - timedelta(days=self.keep_days)
+            ).execution_options(synchronize_session=False))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            log_message(self.logger, "error", self, f"Error pruning the reply queue: {e}")
+        finally:
+            session.close()
+
+
+    def clear(self):
+        session = self.Session()
+        try:
+            session.execute(delete(SiaReplyQueueModel).where(SiaReplyQueueModel.character_name_id == self.character_name_id))
+            session.commit()
+        finally:
+            session.close()
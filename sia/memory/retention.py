@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import insert
+
+from .models_db import SiaMessageModel, SiaMessageArchiveModel
+from .schemas import SiaMessageSchema, SiaRetentionPolicySchema
+from .archive import archive_row, unpack_message, partition_of
+from . import queries
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+class SiaMessageRetention:
+    """
+    Tiered retention of the message table.
+
+    hot: the message table, read by get_messages and the clients.
+    archive: message_archive, one compressed row per message, partitioned by month.
+    Messages of conversations that are still active stay hot regardless of
+    their age, so responses are always generated with the full conversation.
+    """
+
+    def __init__(self, Session, policy: SiaRetentionPolicySchema = None, logging_enabled: bool = True):
+        self.Session = Session
+        self.policy = policy or SiaRetentionPolicySchema.from_env()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    def archive_messages(self, older_than: datetime = None) -> int:
+        """
+        Move messages posted before older_than (default: policy.hot_days ago) to the archive.
+        Every batch is moved in its own transaction. Returns the number of archived messages.
+        """
+        older_than = older_than or datetime.now() - timedelta(days=self.policy.hot_days)
+        archived = 0
+        while True:
+            session = self.Session()
+            try:
+                rows = [dict(row._mapping) for row in session.execute(queries.select_archivable_messages(older_than, self.policy.batch_size))]
+                if not rows:
+                    break
+                ids = [row["id"] for row in rows]
+                # a message that was archived, restored and is archived again replaces its old copy
+                session.execute(queries.delete_archived_messages(ids))
+                session.execute(insert(SiaMessageArchiveModel), [archive_row(row) for row in rows])
+                session.execute(queries.delete_messages(ids))
+                session.commit()
+                archived += len(rows)
+            except Exception as e:
+                session.rollback()
+                log_message(self.logger, "error", self, f"Error archiving messages: {e}")
+                raise e
+            finally:
+                session.close()
+
+        log_message(self.logger, "info", self, f"Archived {archived} messages posted before {older_than}")
+        return archived
+
+
+    def purge_archive(self, older_than: datetime = None) -> int:
+        """
+        Delete archived messages of the months before the month of older_than
+        (default: policy.archive_days ago; nothing is deleted if archive_days is None).
+        """
+        if older_than is None:
+            if self.policy.archive_days is None:
+                return 0
+            older_than = datetime.now() - timedelta(days=self.policy.archive_days)
+
+        session = self.Session()
+        try:
+            deleted = session.execute(queries.delete_archive_partitions_before(partition_of(older_than))).rowcount
+            session.commit()
+        finally:
+            session.close()
+
+        log_message(self.logger, "info", self, f"Purged {deleted} archived messages posted before {partition_of(older_than)}")
+        return deleted
+
+
+    def apply_policy(self) -> dict:
+        if not self.policy.enabled:
+            return {"archived": 0, "purged": 0}
+        return {"archived": self.archive_messages(), "purged": self.purge_archive()}
+
+
+    def iter_archived_messages(self, platform: str = None, author: str = None, character: str = None, conversation_id: str = None, from_datetime: datetime = None, to_datetime: datetime = None) -> Iterator[SiaMessageSchema]:
+        """
+        Stream archived messages, oldest first.
+        Rows are fetched and decompressed policy.batch_size at a time, so whole partitions can be read without loading them into memory.
+        """
+        query = queries.select_archived_messages(
+            platform=platform, author=author, character=character, conversation_id=conversation_id,
+            from_datetime=from_datetime, to_datetime=to_datetime
+        ).execution_options(yield_per=self.policy.batch_size)
+
+        session = self.Session()
+        try:
+            for row in session.execute(query):
+                yield SiaMessageSchema(**unpack_message(row.payload))
+        finally:
+            session.close()
+
+
+    def restore_messages(self, ids: list[str]) -> int:
+        """
+        Move archived messages back to the message table.
+        Messages that already exist in the message table are left as they are.
+        Returns the number of restored messages.
+        """
+        session = self.Session()
+        try:
+            rows = [unpack_message(row.payload) for row in session.execute(queries.select_archived_messages(ids=ids))]
+            if not rows:
+                return 0
+            statements = queries.insert_messages_ignoring_conflicts(session.get_bind().dialect.name, rows)
+            if statements is not None:
+                for stmt in statements:
+                    session.execute(stmt)
+            else:
+                for row in rows:
+                    if not session.get(SiaMessageModel, row["id"]):
+                        session.add(SiaMessageModel(**row))
+            session.execute(queries.delete_archived_messages([row["id"] for row in rows]))
+            session.commit()
+            return len(rows)
+        except Exception as e:
+            session.rollback()
+            log_message(self.logger, "error", self, f"Error restoring archived messages: {e}")
+            raise e
+        finally:
+            session.close()
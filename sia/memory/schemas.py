@@ -2,6 +2,8 @@ from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 from uuid import uuid4
+import json
+import os
 
 class SiaMessageGeneratedSchema(BaseModel):
     conversation_id: Optional[str] = None
@@ -26,11 +28,125 @@ class SiaMessageSchema(SiaMessageGeneratedSchema):
         # orm_mode = True
         from_attributes = True
 
+class SiaMessageRow:
+    """
+    Lightweight read-only message returned by SiaMemory.get_messages(fields=[...]).
+
+    Only the selected columns are available as attributes. JSON columns
+    (original_data, message_metadata) are fetched as raw text and decoded
+    on first access.
+    """
+    json_fields = ("original_data", "message_metadata")
+    __slots__ = ("_values",)
+
+    def __init__(self, values: dict):
+        self._values = values
+
+    def __getattr__(self, name):
+        try:
+            value = self._values[name]
+        except KeyError:
+            raise AttributeError(f"Field '{name}' was not selected")
+        if name in self.json_fields and isinstance(value, str):
+            value = json.loads(value)
+            self._values[name] = value
+        return value
+
+    def to_schema(self) -> SiaMessageSchema:
+        return SiaMessageSchema(**{name: getattr(self, name) for name in self._values})
+
+    def __repr__(self):
+        return f"SiaMessageRow({', '.join(f'{name}={value!r}' for name, value in self._values.items())})"
+
+
 class SiaCharacterSettingsSchema(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
     character_name_id: str
     character_settings: dict
+    version: int = 0
 
     class Config:
         # orm_mode = True
         from_attributes = True
+
+class SiaIngestionCursorSchema(BaseModel):
+    character_name_id: str
+    platform: str
+    last_id: Optional[str] = None
+    next_token: Optional[str] = None
+    backlog_newest_id: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class SiaReplyQueueItemSchema(BaseModel):
+    id: str
+    platform: str
+    message_id: str
+    conversation_id: Optional[str] = None
+    author: Optional[str] = None
+    wen_posted: Optional[datetime] = None
+    score: float = 0
+    status: str
+    draft: Optional[dict] = None
+    drafted_at: Optional[datetime] = None
+    attempts: int = 0
+    reply_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class SiaEngineProfileSchema(BaseModel):
+    """
+    Engine and session settings of SiaMemory.
+    Pool settings apply to Postgres (and file-based SQLite), sqlite_* settings are
+    applied as PRAGMAs on every new SQLite connection. None leaves the driver default.
+    """
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    sqlite_journal_mode: Optional[str] = "WAL"
+    sqlite_synchronous: Optional[str] = "NORMAL"
+    sqlite_busy_timeout_ms: Optional[int] = 30000
+
+    @classmethod
+    def from_env(cls):
+        """Profile with overrides from DB_* environment variables, e.g. DB_POOL_SIZE=20."""
+        overrides = {}
+        for name in cls.model_fields:
+            value = os.getenv(f"DB_{name.upper()}")
+            if value is not None:
+                overrides[name] = None if value.lower() == "none" else value
+        return cls(**overrides)
+
+
+class SiaRetentionPolicySchema(BaseModel):
+    """
+    Retention of the message table.
+    Messages older than hot_days are moved to the message_archive table, except
+    messages of conversations that had activity within hot_days. Archived messages
+    older than archive_days are deleted (None keeps them forever).
+    Off unless enabled: archiving moves rows out of the message table.
+    """
+    enabled: bool = False
+    hot_days: int = 90
+    archive_days: Optional[int] = None
+    # messages moved per transaction
+    batch_size: int = 500
+    # how often Sia.run applies the policy
+    interval_hours: float = 24
+
+    @classmethod
+    def from_env(cls):
+        """Policy with overrides from MEMORY_RETENTION_* environment variables, e.g. MEMORY_RETENTION_HOT_DAYS=30."""
+        overrides = {}
+        for name in cls.model_fields:
+            value = os.getenv(f"MEMORY_RETENTION_{name.upper()}")
+            if value is not None:
+                overrides[name] = None if value.lower() == "none" else value
+        return cls(**overrides)
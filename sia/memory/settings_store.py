@@ -0,0 +1,158 @@
+import copy
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import update
+
+from .models_db import SiaCharacterSettingsModel
+from .schemas import SiaCharacterSettingsSchema
+from . import queries
+
+
+class SiaSettingsConflictError(Exception):
+    pass
+
+
+class SiaCharacterSettingsStore:
+    """
+    Write-through cache of a character's settings row.
+
+    Reads are served from memory (reloaded after refresh_after seconds to pick
+    up changes made by other processes). Writes are key-level patches: the patch
+    is applied to the cached settings and written with
+    UPDATE ... WHERE version = <cached version>. If another writer got there
+    first, the row is reloaded and the patch is applied again, so concurrent
+    writers of different keys never overwrite each other.
+
+    Keys are addressed with dotted paths, e.g. "twitter.next_post_time".
+    """
+
+    def __init__(self, Session, character_name_id: str, refresh_after: float = 300, max_retries: int = 10):
+        self.Session = Session
+        self.character_name_id = character_name_id
+        self.refresh_after = refresh_after
+        self.max_retries = max_retries
+        self._cached = None
+        self._loaded_at = 0
+        self._lock = threading.RLock()
+
+
+    @staticmethod
+    def _split(path: str|tuple) -> tuple:
+        return tuple(path.split(".")) if isinstance(path, str) else tuple(path)
+
+
+    def _load(self) -> SiaCharacterSettingsSchema:
+        session = self.Session()
+        try:
+            character_settings = session.execute(queries.select_character_settings(self.character_name_id)).scalars().first()
+            if not character_settings:
+                character_settings = SiaCharacterSettingsModel(
+                    character_name_id=self.character_name_id,
+                    character_settings={},
+                    version=0
+                )
+                session.add(character_settings)
+                session.commit()
+            self._cached = SiaCharacterSettingsSchema.from_orm(character_settings)
+            self._loaded_at = time.monotonic()
+            return self._cached
+        finally:
+            session.close()
+
+
+    def refresh(self) -> SiaCharacterSettingsSchema:
+        with self._lock:
+            return self._load()
+
+
+    def get_schema(self) -> SiaCharacterSettingsSchema:
+        """A copy of the whole settings row."""
+        with self._lock:
+            if self._cached is None or time.monotonic() - self._loaded_at > self.refresh_after:
+                self._load()
+            return self._cached.model_copy(deep=True)
+
+
+    def get(self, path: str|tuple = None, default: Any = None) -> Any:
+        """Value at the dotted path (a copy), or the whole settings dict if path is None."""
+        value = self.get_schema().character_settings
+        for key in self._split(path) if path else ():
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return value
+
+
+    def _write(self, mutate) -> dict:
+        """Apply mutate(settings_dict) and write the result, retrying on version conflicts."""
+        with self._lock:
+            for _ in range(self.max_retries):
+                current = self._cached if self._cached is not None else self._load()
+                new_settings = copy.deepcopy(current.character_settings or {})
+                mutate(new_settings)
+
+                session = self.Session()
+                try:
+                    updated = session.execute(
+                        update(SiaCharacterSettingsModel)
+                        .where(
+                            SiaCharacterSettingsModel.id == current.id,
+                            SiaCharacterSettingsModel.version == current.version
+                        )
+                        .values(character_settings=new_settings, version=current.version + 1)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+                    session.commit()
+                finally:
+                    session.close()
+
+                if updated:
+                    self._cached = current.model_copy(update={"character_settings": new_settings, "version": current.version + 1})
+                    self._loaded_at = time.monotonic()
+                    return copy.deepcopy(new_settings)
+
+                # somebody else has written in the meantime: reload and apply the change again
+                self._load()
+
+            raise SiaSettingsConflictError(f"Could not update settings of {self.character_name_id} after {self.max_retries} attempts")
+
+
+    def patch(self, changes: dict[str, Any]) -> dict:
+        """
+        Set values at dotted paths, creating intermediate dicts as needed.
+        Example: store.patch({"twitter.next_post_time": 1733312000})
+        """
+        def mutate(settings):
+            for path, value in changes.items():
+                keys = self._split(path)
+                node = settings
+                for key in keys[:-1]:
+                    if not isinstance(node.get(key), dict):
+                        node[key] = {}
+                    node = node[key]
+                node[keys[-1]] = value
+        return self._write(mutate)
+
+
+    def delete(self, *paths: str|tuple) -> dict:
+        def mutate(settings):
+            for path in paths:
+                keys = self._split(path)
+                node = settings
+                for key in keys[:-1]:
+                    node = node.get(key)
+                    if not isinstance(node, dict):
+                        break
+                else:
+                    node.pop(keys[-1], None)
+        return self._write(mutate)
+
+
+    def replace(self, settings: dict) -> dict:
+        """Replace the whole settings dict (still versioned, but drops keys written by others)."""
+        def mutate(current):
+            current.clear()
+            current.update(copy.deepcopy(settings))
+        return self._write(mutate)
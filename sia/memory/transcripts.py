@@ -0,0 +1,105 @@
+from collections import OrderedDict, deque
+import threading
+
+from .schemas import SiaMessageSchema, SiaMessageRow
+
+
+class SiaConversationTranscripts:
+    """
+    In-process cache of conversation transcripts: the root message and the
+    latest `window` messages of each conversation, formatted for prompts.
+
+    A transcript is loaded from the database on first use and then kept up to
+    date by SiaMemory.add_message, so building the conversation for a response
+    costs O(window) regardless of the length of the thread.
+    At most max_conversations transcripts are kept (least recently used are dropped).
+    """
+
+    def __init__(self, window: int = 20, max_conversations: int = 1000):
+        self.window = window
+        self.max_conversations = max_conversations
+        self._transcripts = OrderedDict()
+        # conversation_id -> [running loads, messages added since the first of them started]
+        self._loading = {}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def conversation_key(message: SiaMessageSchema|SiaMessageRow) -> str|None:
+        # posts have no conversation_id (or their own id)
+        return message.conversation_id or message.id
+
+
+    @staticmethod
+    def format_message(message: SiaMessageSchema|SiaMessageRow) -> str:
+        return f"[{message.wen_posted}] {message.author}: {message.content}"
+
+
+    @staticmethod
+    def join(root: str|None, lines) -> str:
+        return "\n".join(([root] if root else []) + list(lines))
+
+
+    def get(self, conversation_id: str) -> str|None:
+        """The transcript, or None if it has not been loaded yet."""
+        with self._lock:
+            transcript = self._transcripts.get(conversation_id)
+            if transcript is None:
+                return None
+            self._transcripts.move_to_end(conversation_id)
+            return self.join(transcript["root"], transcript["lines"])
+
+
+    def begin_load(self, conversation_id: str) -> int:
+        """Register a database read of the conversation; pass the returned count to finish_load."""
+        with self._lock:
+            loading = self._loading.setdefault(conversation_id, [0, 0])
+            loading[0] += 1
+            return loading[1]
+
+
+    def finish_load(self, conversation_id: str, writes_count: int, messages: list[SiaMessageSchema|SiaMessageRow]|None):
+        """
+        Cache the messages read by SiaMemory.get_conversation_window (None if the read failed).
+        Skipped if a message was added after the read started, as the read may have missed it.
+        """
+        with self._lock:
+            loading = self._loading[conversation_id]
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[conversation_id]
+            if messages is None or loading[1] != writes_count:
+                return
+
+            root = None
+            if messages and messages[0].id == conversation_id:
+                root = self.format_message(messages[0])
+                messages = messages[1:]
+            self._transcripts[conversation_id] = {
+                "root": root,
+                "lines": deque((self.format_message(message) for message in messages), maxlen=self.window)
+            }
+            self._transcripts.move_to_end(conversation_id)
+            while len(self._transcripts) > self.max_conversations:
+                self._transcripts.popitem(last=False)
+
+
+    def add(self, message: SiaMessageSchema):
+        if message.flagged:
+            return
+        conversation_id = self.conversation_key(message)
+        with self._lock:
+            if conversation_id in self._loading:
+                self._loading[conversation_id][1] += 1
+            transcript = self._transcripts.get(conversation_id)
+            if transcript is None:
+                return
+            if message.id == conversation_id:
+                transcript["root"] = self.format_message(message)
+            else:
+                transcript["lines"].append(self.format_message(message))
+
+
+    def clear(self):
+        with self._lock:
+            self._transcripts.clear()
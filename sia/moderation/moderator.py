@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from openai import OpenAI
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+class SiaModerator:
+    """
+    Batched OpenAI moderation.
+
+    A whole page of texts is sent in one moderations request (chunked to
+    batch_size inputs), through one long-lived client. Verdicts are cached by
+    text hash in an LRU of cache_size entries, so texts seen before are not
+    sent again.
+    """
+
+    def __init__(self, client: OpenAI = None, model: str = "omni-moderation-latest", batch_size: int = 32, cache_size: int = 10000, logging_enabled: bool = True):
+        self._client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._verdicts = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI()
+        return self._client
+
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+    def _cached(self, key: str) -> bool|None:
+        with self._lock:
+            flagged = self._verdicts.get(key)
+            if flagged is not None:
+                self._verdicts.move_to_end(key)
+            return flagged
+
+
+    def _remember(self, key: str, flagged: bool):
+        with self._lock:
+            self._verdicts[key] = flagged
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+
+
+    def moderate(self, texts: list[str]) -> list[bool]:
+        """
+        Whether each text is flagged, in input order.
+        Texts that could not be moderated are reported as not flagged (and not cached).
+        """
+        keys = [self.text_hash(text) for text in texts]
+        verdicts = {key: self._cached(key) for key in keys}
+
+        # each distinct uncached text is sent once
+        to_moderate = {}
+        for key, text in zip(keys, texts):
+            if verdicts[key] is None:
+                to_moderate.setdefault(key, text)
+
+        pending = list(to_moderate.items())
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            try:
+                response = self.client.moderations.create(model=self.model, input=[text for _, text in batch])
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error moderating {len(batch)} texts: {e}")
+                continue
+            for (key, text), result in zip(batch, response.results):
+                verdicts[key] = bool(result.flagged)
+                self._remember(key, verdicts[key])
+                if result.flagged:
+                    log_message(self.logger, "info", self, f"flagged text: {text}")
+
+        return [bool(verdicts[key]) for key in keys]
+
+
+    def is_flagged(self, text: str) -> bool:
+        return self.moderate([text])[0]
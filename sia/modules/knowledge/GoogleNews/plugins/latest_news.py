@@ -16,8 +16,9 @@ from sia.modules.knowledge.GoogleNews.models_db import (
 )
 from sia.modules.knowledge.schemas import KnowledgeModuleSettingsSchema
 from sia.modules.knowledge.models_db import KnowledgeModuleSettingsModel
+from sia.llm.registry import FILTERING_MODEL
+from sia.llm.context_assembler import SiaContextSection
 
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 
 from utils.logging_utils import setup_logging, log_message, enable_logging
@@ -64,7 +65,7 @@ class LatestNewsPlugin:
     def pick_one_news(self, latest_news):
         character_details = self.module.sia.character.prompts["you_are"]
 
-        latest_news_str = "\n".join([f"{i+1}. {news.title}. {news.snippet} [{news.link}]" for i, news in enumerate(latest_news)])
+        latest_news_items = [f"{i+1}. {news.title}. {news.snippet} [{news.link}]" for i, news in enumerate(latest_news)]
 
         prompt = ChatPromptTemplate.from_template("""
             {character_details}
@@ -82,9 +83,12 @@ class LatestNewsPlugin:
             Link: <link>
         """.replace("\n", "            "))
         
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
-        ai_chain = prompt | llm
-        return ai_chain.invoke({"character_details": character_details, "latest_news": latest_news_str}).content
+        context, _ = self.module.sia.context_assembler.assemble("news", [
+            SiaContextSection("character_details", character_details, priority=100),
+            SiaContextSection("latest_news", latest_news_items, priority=50, drop="last", joiner="\n"),
+        ], prompt)
+        
+        return self.module.sia.llm_router.invoke(lambda llm: prompt | llm, context, routes=[FILTERING_MODEL], call_site="news").content
     
     
     def get_instructions_and_knowledge(self):
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+
+from sia.memory.schemas import SiaMessageGeneratedSchema
+
+from utils.logging_utils import setup_logging, log_message, enable_logging
+
+
+class SiaBufferedPost:
+
+    def __init__(self, post: SiaMessageGeneratedSchema, plugin, time_of_day: str, created_at: float, expires_at: float):
+        self.post = post
+        # None until generated, see SiaPostBuffer.fill
+        self.media = None
+        # knowledge plugin the post was written with, its settings are updated when the post is published
+        self.plugin = plugin
+        self.time_of_day = time_of_day
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+
+class SiaPostBuffer:
+    """
+    Posts generated ahead of time, so that publishing a scheduled post does not
+    wait for the LLM, DALL-E or Imgflip (and survives a short provider outage).
+
+    A background thread keeps up to `size` ready posts (with their media) per
+    platform. A post is discarded when:
+    - it is older than max_age seconds (knowledge_max_age if it was written
+      with a knowledge plugin, e.g. latest news, which goes stale sooner), but
+      never before the platform's post_frequency times `size`: a post must
+      live until its turn to be published, or it is paid for and thrown away;
+    - the character's time of day has changed since it was generated;
+    - it is too similar to a past post or another buffered post (see SiaNoveltyIndex).
+
+    Media are paid for (DALL-E, Imgflip), so they are only generated for the
+    next post to publish, the head of the buffer, not for every buffered post.
+    Plugin settings (e.g. next_use_after) are updated by Sia.next_post when a
+    buffered post is used, not when it is generated.
+    """
+
+    def __init__(
+        self,
+        sia,
+        platforms: list[str],
+        size: int = None,
+        max_age: float = None,
+        knowledge_max_age: float = None,
+        refill_interval: float = 60,
+        logging_enabled: bool = True
+    ):
+        self.sia = sia
+        self.platforms = list(platforms)
+        self.size = size if size is not None else int(os.getenv("POST_BUFFER_SIZE", 1))
+        self.max_age = max_age or float(os.getenv("POST_BUFFER_MAX_AGE_HOURS", 6)) * 3600
+        self.knowledge_max_age = knowledge_max_age or float(os.getenv("POST_BUFFER_KNOWLEDGE_MAX_AGE_HOURS", 1)) * 3600
+        self.refill_interval = refill_interval
+        self._buffers = {platform: deque() for platform in self.platforms}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.logger = setup_logging()
+        enable_logging(logging_enabled)
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and bool(self.platforms)
+
+
+    def _max_age(self, platform: str, plugin) -> float:
+        post_interval = self.sia.character.platform_settings.get(platform, {}).get("post_frequency", 2) * 3600
+        return max(self.knowledge_max_age if plugin else self.max_age, post_interval * self.size)
+
+
+    def _is_fresh(self, item: SiaBufferedPost) -> bool:
+        return item.expires_at > time.time() and item.time_of_day == self.sia.character.current_time_of_day()
+
+
+    @staticmethod
+    def _remove_media(media: list[str]|None):
+        for media_file in media or ():
+            try:
+                os.remove(media_file)
+            except OSError:
+                pass
+
+
+    def _discard(self, platform: str, item: SiaBufferedPost, reason: str):
+        log_message(self.logger, "info", self, f"Discarding buffered {platform} post ({reason}): {item.post.content}")
+        self._remove_media(item.media)
+
+
+    def pop(self, platform: str) -> tuple[SiaMessageGeneratedSchema, list[str], object]|None:
+        """
+        The oldest ready post of the platform, its media and the plugin it was
+        written with, or None if none is ready. Media not generated yet are
+        generated now.
+        """
+        while True:
+            with self._lock:
+                buffer = self._buffers.get(platform)
+                item = buffer.popleft() if buffer else None
+            if item is None:
+                self._wakeup.set()
+                return None
+
+            if not self._is_fresh(item):
+                self._discard(platform, item, "expired")
+            elif not self.sia.memory.novelty.is_novel(item.post.content):
+                self._discard(platform, item, "too similar to a past post")
+            else:
+                self._wakeup.set()
+                if item.media is None:
+                    item.media = self.sia._post_media(item.post)
+                return item.post, item.media, item.plugin
+
+
+    def ready(self, platform: str) -> int:
+        with self._lock:
+            return len(self._buffers.get(platform, ()))
+
+
+    def fill(self, platform: str) -> bool:
+        """Generate one post for the platform if its buffer is not full. True if a post was added."""
+        with self._lock:
+            buffer = self._buffers[platform]
+            expired = [item for item in buffer if not self._is_fresh(item)]
+            for item in expired:
+                buffer.remove(item)
+            full = len(buffer) >= self.size
+            buffered = [item.post.content for item in buffer]
+        for item in expired:
+            self._discard(platform, item, "expired")
+
+        if self._fill_head_media(platform):
+            return True
+        if full:
+            return False
+
+        time_of_day = self.sia.character.current_time_of_day()
+        prompt_template, ai_input, plugin = self.sia._post_prompt(platform=platform, time_of_day=time_of_day)
+        generated_post = self.sia._invoke_with_fallback(prompt_template, ai_input, "post")
+        if not generated_post or not generated_post.content:
+            return False
+
+        if not self.sia._is_novel_post(generated_post, buffered):
+            return False
+
+        post = self.sia._post_result(generated_post, platform)
+        now = time.time()
+        item = SiaBufferedPost(post, plugin, time_of_day, now, now + self._max_age(platform, plugin))
+        with self._lock:
+            self._buffers[platform].append(item)
+        log_message(self.logger, "info", self, f"Buffered {platform} post, {self.ready(platform)}/{self.size} ready")
+        return True
+
+
+    def _fill_head_media(self, platform: str) -> bool:
+        """Generate the media of the next post to publish if they are missing. True if media were generated."""
+        with self._lock:
+            buffer = self._buffers[platform]
+            head = buffer[0] if buffer and buffer[0].media is None else None
+        if head is None:
+            return False
+
+        media = self.sia._post_media(head.post)
+        with self._lock:
+            # pop may have taken (and generated media for) the post meanwhile
+            kept = head.media is None and bool(self._buffers[platform]) and self._buffers[platform][0] is head
+            if kept:
+                head.media = media
+        if not kept:
+            self._remove_media(media)
+        return kept
+
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            for platform in self.platforms:
+                try:
+                    while not self._stopped.is_set() and self.fill(platform):
+                        pass
+                except Exception as e:
+                    log_message(self.logger, "error", self, f"Error pre-generating a {platform} post: {e}")
+            self._wakeup.wait(self.refill_interval)
+
+
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run, name="sia-post-buffer", daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
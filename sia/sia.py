@@ -7,12 +7,22 @@ from uuid import uuid4
 from pydantic import BaseModel
 import asyncio
 import threading
+import weakref
+from typing import AsyncIterator
 
 from sia.character import SiaCharacter
 from sia.clients.client import SiaClient
 from sia.memory.memory import SiaMemory
-from sia.memory.schemas import SiaMessageGeneratedSchema, SiaMessageSchema
+from sia.memory.async_memory import AsyncSiaMemory
+from sia.memory.schemas import SiaMessageGeneratedSchema, SiaMessageSchema, SiaEngineProfileSchema, SiaRetentionPolicySchema
 from sia.schemas.schemas import ResponseFilteringResultLLMSchema
+from sia.llm.registry import SiaLLMRegistry, get_llm_registry, POST_MODEL, FALLBACK_MODEL, FILTERING_MODEL
+from sia.llm.router import SiaLLMRouter, SiaLLMUnavailableError
+from sia.llm.telemetry import SiaLLMTelemetry
+from sia.memory.filter_decisions import rules_hash
+from sia.moderation.moderator import SiaModerator
+from sia.llm.context_assembler import SiaContextAssembler, SiaContextSection
+from sia.posting.post_buffer import SiaPostBuffer
 from sia.clients.twitter.twitter_official_api_client import SiaTwitterOfficial
 from sia.clients.telegram.telegram_client import SiaTelegram
 from sia.modules.knowledge.models_db import KnowledgeModuleSettingsModel
@@ -20,8 +30,6 @@ from sia.modules.knowledge.models_db import KnowledgeModuleSettingsModel
 from plugins.imgflip_meme_generator import ImgflipMemeGenerator
 
 from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 
 from utils.etc_utils import generate_image_dalle, save_image_from_url
 from utils.logging_utils import setup_logging, log_message, enable_logging
@@ -39,16 +47,51 @@ class Sia:
         telegram_creds = None,
         plugins = [],
         knowledge_module_classes = [],
-        logging_enabled=True
+        logging_enabled=True,
+        memory_engine_profile: SiaEngineProfileSchema = None,
+        memory_retention_policy: SiaRetentionPolicySchema = None,
+        llm_registry: SiaLLMRegistry = None,
+        max_concurrent_generations: int = None,
+        llm_router: SiaLLMRouter = None,
+        llm_telemetry: SiaLLMTelemetry = None,
+        moderator: SiaModerator = None,
+        context_assembler: SiaContextAssembler = None,
+        post_buffer: SiaPostBuffer = None
     ):
         self.character = SiaCharacter(json_file=character_json_filepath, sia=self)
-        self.memory = SiaMemory(character=self.character, db_path=memory_db_path)
+        self.memory = SiaMemory(character=self.character, db_path=memory_db_path, engine_profile=memory_engine_profile, retention_policy=memory_retention_policy)
+        self.amemory = AsyncSiaMemory(character=self.character, db_path=memory_db_path, engine_profile=self.memory.engine_profile, recent_posts=self.memory.recent_posts, transcripts=self.memory.transcripts, settings=self.memory.settings, novelty=self.memory.novelty)
+        self.moderator = moderator or SiaModerator(logging_enabled=logging_enabled)
         self.clients = clients
         self.twitter = SiaTwitterOfficial(sia=self, **twitter_creds) if twitter_creds else None
         self.telegram = SiaTelegram(sia=self, **telegram_creds, chat_id=self.character.platform_settings.get("telegram", {}).get("chat_id", None)) if telegram_creds else None
         self.twitter.character = self.character
         self.twitter.memory = self.memory
         self.plugins = plugins
+        self.llm = llm_registry or get_llm_registry()
+        self.llm.warmup(ping=os.getenv("LLM_WARMUP_PING", "false").lower() == "true")
+        self.llm_telemetry = llm_telemetry or SiaLLMTelemetry(self.memory.Session, self.character.name_id, logging_enabled=logging_enabled)
+        self.llm_router = llm_router or SiaLLMRouter(
+            self.llm,
+            routes=[POST_MODEL, FALLBACK_MODEL],
+            timeout=float(os.getenv("LLM_TIMEOUT", 30)),
+            hedging=os.getenv("LLM_HEDGING", "true").lower() == "true",
+            adaptive=os.getenv("LLM_ADAPTIVE_ROUTING", "true").lower() == "true",
+            telemetry=self.llm_telemetry,
+            logging_enabled=logging_enabled
+        )
+        self.context_assembler = context_assembler or SiaContextAssembler(logging_enabled=logging_enabled)
+        self.post_buffer = post_buffer or SiaPostBuffer(
+            self,
+            platforms=[platform for platform, enabled in (
+                ("twitter", self.twitter and self.character.platform_settings.get("twitter", {}).get("enabled", True)),
+                ("telegram", self.telegram and self.telegram.chat_id)
+            ) if enabled],
+            logging_enabled=logging_enabled
+        )
+        self.post_novelty_attempts = int(os.getenv("POST_NOVELTY_ATTEMPTS", 3))
+        self.max_concurrent_generations = max_concurrent_generations or int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+        self._generation_slots = weakref.WeakKeyDictionary()
 
         self.logger = setup_logging()
         enable_logging(logging_enabled)
@@ -112,7 +155,13 @@ class Sia:
         return None
         
 
-    def generate_post(self, platform="twitter", author=None, character=None, time_of_day=None):
+    def _post_prompt(self, platform="twitter", time_of_day=None):
+        """
+        Prompt and input for a new post.
+
+        Output:
+        - (prompt_template, ai_input, plugin), plugin is None if no knowledge plugin is used
+        """
 
         plugin = self.get_plugin(time_of_day=self.character.current_time_of_day())
         plugin_prompt = ""
@@ -159,44 +208,31 @@ class Sia:
         if not time_of_day:
             time_of_day = self.character.current_time_of_day()
         
+        context, _ = self.context_assembler.assemble("post", [
+            SiaContextSection("you_are", self.character.prompts.get("you_are"), priority=100),
+            SiaContextSection("plugin_prompt", plugin_prompt, priority=90),
+            SiaContextSection("post_examples", self.character.get_post_examples("general", time_of_day=time_of_day, random_pick=7), priority=50, drop="last"),
+            # the novelty index only catches reworded posts: recent posts also steer the opening and structure away from repeats
+            SiaContextSection("previous_posts", [f"[{post.wen_posted}] {post.content}" for post in self.memory.get_recent_posts(character=self.character.name, platform=platform, limit=10)], priority=40, drop="first"),
+        ], prompt_template)
+        
         ai_input = {
-            "you_are": self.character.prompts.get("you_are"),
-            "post_examples": self.character.get_post_examples("general", time_of_day=time_of_day, random_pick=7),
-            "previous_posts": [f"[{post.wen_posted}] {post.content}" for post in self.memory.get_messages()[-10:]],
+            **context,
             "platform": platform,
             "length_range": random.choice(self.character.post_parameters.get("length_ranges")),
-            "plugin_prompt": plugin_prompt,
             # "formatting": self.character.post_parameters.get("formatting")
         }
-        
-        try: 
-            llm = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0.3)
-            
-            ai_chain = prompt_template | llm
 
-            generated_post = ai_chain.invoke(ai_input)
-            
-            log_message(self.logger, "info", self, f"Generated post with Anthropic: {generated_post}")
-            
-        except Exception as e:
-            
-            try:
-                llm = ChatOpenAI(model="gpt-4o", temperature=0.0)
-                
-                ai_chain = prompt_template | llm
+        return prompt_template, ai_input, plugin
 
-                generated_post = ai_chain.invoke(ai_input)
 
-                log_message(self.logger, "info", self, f"Generated post with OpenAI: {generated_post}")
-            
-            except Exception as e:
-                
-                generated_post = None
-                
-                log_message(self.logger, "error", self, f"Error generating post: {e}")
-        
+    def _post_media(self, generated_post) -> list[str]:
+        """Generate the images attached to a post (DALL-E, Imgflip) according to the character's plugin settings."""
         
         image_filepaths = []
+
+        if not generated_post:
+            return image_filepaths
         
         # Generate an image for the post
         if random.random() < self.character.plugins_settings.get("dalle", {}).get("probability_of_posting", 0):
@@ -217,16 +253,27 @@ class Sia:
                 save_image_from_url(image_url, image_filepath)
                 image_filepaths.append(image_filepath)
 
+        return image_filepaths
+
+
+    def _post_result(self, generated_post, platform) -> SiaMessageGeneratedSchema|None:
+        """None if no post was generated (no LLM answered or every draft was a repetition)."""
+
+        if not generated_post:
+            return None
 
-        post_content = generated_post.content if generated_post else None
         generated_post_schema = SiaMessageGeneratedSchema(
-            content=post_content,
+            content=generated_post.content,
             platform=platform,
             author=self.character.twitter_username,
             character=self.character.name
         )
-        
-        
+
+        return generated_post_schema
+
+
+    def _use_plugin(self, plugin):
+        """Record that a post written with the plugin is being published (not when it is only buffered)."""
         if plugin:
             log_message(self.logger, "info", self, f"Updating settings for {plugin.plugin_name}")
             plugin.update_settings(next_use_after=datetime.datetime.now(timezone.utc) + datetime.timedelta(hours=1))
@@ -234,7 +281,214 @@ class Sia:
             log_message(self.logger, "info", self, f"No plugin found")
 
 
-        return generated_post_schema, image_filepaths
+    def _invoke_with_fallback(self, prompt_template, ai_input, what="post"):
+        """Run the prompt on the generation routes (see SiaLLMRouter). None if no route answered."""
+        try:
+            generated = self.llm_router.invoke(lambda llm: prompt_template | llm, ai_input, call_site=what)
+            log_message(self.logger, "info", self, f"Generated {what}: {generated}")
+            return generated
+        except SiaLLMUnavailableError as e:
+            log_message(self.logger, "error", self, f"Error generating {what}: {e}")
+            return None
+
+
+    async def _ainvoke_with_fallback(self, prompt_template, ai_input, what="post"):
+        """Async counterpart of _invoke_with_fallback."""
+        try:
+            generated = await self.llm_router.ainvoke(lambda llm: prompt_template | llm, ai_input, call_site=what)
+            log_message(self.logger, "info", self, f"Generated {what}: {generated}")
+            return generated
+        except SiaLLMUnavailableError as e:
+            log_message(self.logger, "error", self, f"Error generating {what}: {e}")
+            return None
+
+
+    def _is_novel_post(self, generated_post, others: list[str] = ()) -> bool:
+        """Whether a draft is different enough from all past posts and from others, see SiaNoveltyIndex."""
+        similarity = self.memory.novelty.max_similarity(generated_post.content, others)
+        if similarity > self.memory.novelty.threshold:
+            log_message(self.logger, "info", self, f"Generated post is too similar to a past post ({similarity:.2f}): {generated_post.content}")
+            return False
+        return True
+
+
+    def generation_slots(self) -> asyncio.Semaphore:
+        """
+        Semaphore bounding concurrent agenerate_post/agenerate_response calls of the running event loop
+        (asyncio primitives cannot be shared between the Telegram and Twitter loops).
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._generation_slots:
+            self._generation_slots[loop] = asyncio.Semaphore(self.max_concurrent_generations)
+        return self._generation_slots[loop]
+        
+
+    def generate_post(self, platform="twitter", author=None, character=None, time_of_day=None):
+
+        prompt_template, ai_input, plugin = self._post_prompt(platform=platform, time_of_day=time_of_day)
+
+        # drafts too similar to a past post are regenerated, and dropped after post_novelty_attempts attempts
+        generated_post = None
+        for attempt in range(self.post_novelty_attempts):
+            draft = self._invoke_with_fallback(prompt_template, ai_input, "post")
+            if not draft:
+                break
+            if self._is_novel_post(draft):
+                generated_post = draft
+                break
+
+        image_filepaths = self._post_media(generated_post)
+
+        post = self._post_result(generated_post, platform)
+        if post:
+            self._use_plugin(plugin)
+        return post, image_filepaths
+
+
+    async def agenerate_post(self, platform="twitter", author=None, character=None, time_of_day=None):
+        """
+        Async counterpart of generate_post.
+        The LLM call does not block the event loop; knowledge plugins and
+        image generation are still blocking and run in a worker thread.
+        """
+        async with self.generation_slots():
+
+            prompt_template, ai_input, plugin = await asyncio.to_thread(self._post_prompt, platform=platform, time_of_day=time_of_day)
+
+            generated_post = None
+            for attempt in range(self.post_novelty_attempts):
+                draft = await self._ainvoke_with_fallback(prompt_template, ai_input, "post")
+                if not draft:
+                    break
+                if await asyncio.to_thread(self._is_novel_post, draft):
+                    generated_post = draft
+                    break
+
+            image_filepaths = await asyncio.to_thread(self._post_media, generated_post)
+
+            post = self._post_result(generated_post, platform)
+            if post:
+                await asyncio.to_thread(self._use_plugin, plugin)
+            return post, image_filepaths
+
+
+    def next_post(self, platform="twitter", author=None, character=None, time_of_day=None):
+        """
+        The post to publish now: a pre-generated one from the post buffer if
+        one is ready, otherwise generated on the spot (see generate_post).
+        """
+        buffered = self.post_buffer.pop(platform) if self.post_buffer.enabled else None
+        if buffered:
+            log_message(self.logger, "info", self, f"Using a pre-generated {platform} post")
+            post, media, plugin = buffered
+            self._use_plugin(plugin)
+            return post, media
+        return self.generate_post(platform=platform, author=author, character=character, time_of_day=time_of_day)
+
+
+    async def anext_post(self, platform="twitter", author=None, character=None, time_of_day=None):
+        """Async counterpart of next_post."""
+        buffered = await asyncio.to_thread(self.post_buffer.pop, platform) if self.post_buffer.enabled else None
+        if buffered:
+            log_message(self.logger, "info", self, f"Using a pre-generated {platform} post")
+            post, media, plugin = buffered
+            await asyncio.to_thread(self._use_plugin, plugin)
+            return post, media
+        return await self.agenerate_post(platform=platform, author=author, character=character, time_of_day=time_of_day)
+
+
+    def _filtering_chain(self, llm):
+        llm_filtering_prompt_template = ChatPromptTemplate.from_messages([
+            ("system", """
+                You are a message filtering AI. You are given a message and a list of filtering rules. You need to determine if the message passes the filtering rules. If it does, return 'True'. If it does not, return 'False' Only respond with 1 word: 'True' or 'False'.
+            """),
+            ("user", """
+                Conversation:
+                {conversation}
+
+                Message from the conversation to decide whether to respond to:
+                {message}
+                
+                Filtering rules:
+                {filtering_rules}
+                
+                Avoid making assumptions about the message author's intentions. Only apply the filtering rules if the message is in direct conflict with them.
+                
+                Return True unless the message is in direct conflict with the filtering rules.
+            """)
+        ])
+        llm_filtering_structured = llm.with_structured_output(ResponseFilteringResultLLMSchema)
+        
+        return llm_filtering_prompt_template | llm_filtering_structured
+
+
+    def _filter_decision_key(self, message: SiaMessageSchema, reply_to_character: bool) -> tuple[str, str]:
+        """(cache key, rules hash) of the filtering decision for the message, see SiaFilterDecisionCache."""
+        filtering_rules_hash = rules_hash(self.character.responding.get("filtering_rules"), FILTERING_MODEL)
+        return self.memory.filter_decisions.key(filtering_rules_hash, message.platform, reply_to_character, message.content), filtering_rules_hash
+
+
+    def _replies_to_character(self, message: SiaMessageSchema) -> bool:
+        """Whether the message replies to one of the character's own messages."""
+        if not message.response_to:
+            return False
+        return bool(self.memory.get_messages(id=message.response_to, character=self.character.name, fields=["id"]))
+
+
+    async def _areplies_to_character(self, message: SiaMessageSchema) -> bool:
+        if not message.response_to:
+            return False
+        return bool(await self.amemory.get_messages(id=message.response_to, character=self.character.name, fields=["id"]))
+
+
+    def _response_prompt(self, message_to_respond_str: str, conversation_str: str, platform="twitter"):
+        prompt_template = ChatPromptTemplate.from_messages([
+            ("system", """
+                {you_are}
+                
+                {communication_requirements}
+                
+                Your goal is to respond to the message on {platform} provided below in the conversation provided below.
+                
+                Message to response:
+                {message}
+
+                Conversation:
+                {conversation}
+            """),
+            ("user", """
+                Generate your response to the message. Your response length must be fewer than 30 words.
+            """)
+        ])
+
+        # the first transcript line is the root post of the conversation, kept as long as possible
+        context, _ = self.context_assembler.assemble("response", [
+            SiaContextSection("message", message_to_respond_str, priority=100),
+            SiaContextSection("you_are", self.character.prompts.get("you_are"), priority=90),
+            SiaContextSection("communication_requirements", self.character.prompts.get("communication_requirements"), priority=80),
+            SiaContextSection("conversation", conversation_str.split("\n") if conversation_str else [], priority=50, drop="first", keep_first=1, joiner="\n"),
+        ], prompt_template)
+
+        ai_input = {
+            **context,
+            "platform": platform
+        }
+
+        return prompt_template, ai_input
+
+
+    def _response_result(self, message: SiaMessageSchema, generated_response) -> SiaMessageGeneratedSchema:
+        generated_response_schema = SiaMessageGeneratedSchema(
+            content=generated_response.content,
+            platform=message.platform,
+            author=self.character.platform_settings.get(message.platform, {}).get("username", self.character.name),
+            character=self.character.name,
+            response_to=message.id,
+            conversation_id=message.conversation_id
+        )
+        log_message(self.logger, "info", self, f"Generated response: {generated_response_schema}")
+
+        return generated_response_schema
 
 
     def generate_response(
@@ -259,13 +513,11 @@ class Sia:
 
 
         if not conversation:
-            conversation = self.twitter.get_conversation(conversation_id=message.conversation_id)
-            conversation_first_message = self.memory.get_messages(id=message.conversation_id, platform=platform)
-            conversation = conversation_first_message + conversation[-20:]
-            conversation_str = "\n".join([f"[{msg.wen_posted}] {msg.author}: {msg.content}" for msg in conversation])
-            log_message(self.logger, "info", self, f"Conversation: {conversation_str}")
+            # the root message and the latest 20 messages
+            conversation_str = self.memory.get_conversation_transcript(message.conversation_id, window=20)
         else:
-            pass
+            conversation_str = "\n".join([self.memory.transcripts.format_message(msg) for msg in conversation])
+        log_message(self.logger, "info", self, f"Conversation: {conversation_str}")
         
         
         message_to_respond_str = f"[{message.wen_posted}] {message.author}: {message.content}"
@@ -275,37 +527,22 @@ class Sia:
         # do not answer if the message does not pass the filtering rules
         if self.character.responding.get("filtering_rules"):
             log_message(self.logger, "info", self, f"Checking the response against filtering rules: {self.character.responding.get('filtering_rules')}")
-            llm_filtering = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
-            llm_filtering_prompt_template = ChatPromptTemplate.from_messages([
-                ("system", """
-                    You are a message filtering AI. You are given a message and a list of filtering rules. You need to determine if the message passes the filtering rules. If it does, return 'True'. If it does not, return 'False' Only respond with 1 word: 'True' or 'False'.
-                """),
-                ("user", """
-                    Conversation:
-                    {conversation}
-
-                    Message from the conversation to decide whether to respond to:
-                    {message}
-                    
-                    Filtering rules:
-                    {filtering_rules}
-                    
-                    Avoid making assumptions about the message author's intentions. Only apply the filtering rules if the message is in direct conflict with them.
-                    
-                    Return True unless the message is in direct conflict with the filtering rules.
-                """)
-            ])
-            llm_filtering_structured = llm_filtering.with_structured_output(ResponseFilteringResultLLMSchema)
+            filtering_key, filtering_rules_hash = self._filter_decision_key(message, self._replies_to_character(message))
+            filtering_result = self.memory.filter_decisions.get(filtering_key)
             
-            filtering_chain = llm_filtering_prompt_template | llm_filtering_structured
-            
-            try:
-                filtering_result = filtering_chain.invoke({"conversation": conversation_str, "message": message_to_respond_str, "filtering_rules": self.character.responding.get("filtering_rules")})
-                log_message(self.logger, "info", self, f"Response filtering result: {filtering_result}")
+            if filtering_result is not None:
+                log_message(self.logger, "info", self, f"Cached response filtering result: {filtering_result}")
 
-            except Exception as e:
-                log_message(self.logger, "error", self, f"Error getting filtering result: {e}")
-                return None
+            else:
+                try:
+                    filtering_result = self.llm_router.invoke(self._filtering_chain, {"conversation": conversation_str, "message": message_to_respond_str, "filtering_rules": self.character.responding.get("filtering_rules")}, routes=[FILTERING_MODEL], call_site="filtering")
+                    log_message(self.logger, "info", self, f"Response filtering result: {filtering_result}")
+
+                except Exception as e:
+                    log_message(self.logger, "error", self, f"Error getting filtering result: {e}")
+                    return None
+
+                self.memory.filter_decisions.put(filtering_key, filtering_rules_hash, filtering_result)
 
             if not filtering_result.should_respond:
                 return None
@@ -314,67 +551,117 @@ class Sia:
             log_message(self.logger, "info", self, f"No filtering rules found.")
 
         
-        time_of_day = time_of_day if time_of_day else self.character.current_time_of_day()
-        
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """
-                {you_are}
-                
-                {communication_requirements}
-                
-                Your goal is to respond to the message on {platform} provided below in the conversation provided below.
-                
-                Message to response:
-                {message}
+        prompt_template, ai_input = self._response_prompt(message_to_respond_str, conversation_str, platform=platform)
 
-                Conversation:
-                {conversation}
-            """),
-            ("user", """
-                Generate your response to the message. Your response length must be fewer than 30 words.
-            """)
-        ])
+        generated_response = self._invoke_with_fallback(prompt_template, ai_input, "response")
+        if not generated_response:
+            return None
 
-        ai_input = {
-            "you_are": self.character.prompts.get("you_are"),
-            "communication_requirements": self.character.prompts.get("communication_requirements"),
-            "platform": platform,
-            "message": message_to_respond_str,
-            "conversation": conversation_str
-        }
-        
-        try: 
-            llm = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0.3)
-            
-            ai_chain = prompt_template | llm
+        return self._response_result(message, generated_response)
 
-            generated_response = ai_chain.invoke(ai_input)
-            
-        except Exception as e:
-            
-            try:
-                llm = ChatOpenAI(model="gpt-4o", temperature=0.0)
-                
-                ai_chain = prompt_template | llm
 
-                generated_response = ai_chain.invoke(ai_input)
-            
-            except Exception as e:
-                log_message(self.logger, "error", self, f"Error generating response: {e}")
+    async def _aresponse_prompt(self, message: SiaMessageSchema, platform="twitter", conversation=None):
+        """
+        Async transcript, filtering and prompt of a response, see generate_response.
+
+        Output:
+        - (prompt_template, ai_input)
+        - None if the message does not pass the filtering rules or filtering failed
+        """
+
+        if not conversation:
+            conversation_str = await self.amemory.get_conversation_transcript(message.conversation_id, window=20)
+        else:
+            conversation_str = "\n".join([self.memory.transcripts.format_message(msg) for msg in conversation])
+        log_message(self.logger, "info", self, f"Conversation: {conversation_str}")
+
+        message_to_respond_str = f"[{message.wen_posted}] {message.author}: {message.content}"
+        log_message(self.logger, "info", self, f"Message to respond: {message_to_respond_str}")
+
+        if self.character.responding.get("filtering_rules"):
+            filtering_key, filtering_rules_hash = self._filter_decision_key(message, await self._areplies_to_character(message))
+            filtering_result = self.memory.filter_decisions.get_cached(filtering_key)
+            if filtering_result is None:
+                filtering_result = await asyncio.to_thread(self.memory.filter_decisions.get, filtering_key)
+
+            if filtering_result is None:
+                try:
+                    filtering_result = await self.llm_router.ainvoke(self._filtering_chain, {"conversation": conversation_str, "message": message_to_respond_str, "filtering_rules": self.character.responding.get("filtering_rules")}, routes=[FILTERING_MODEL], call_site="filtering")
+                    log_message(self.logger, "info", self, f"Response filtering result: {filtering_result}")
+                except Exception as e:
+                    log_message(self.logger, "error", self, f"Error getting filtering result: {e}")
+                    return None
+                await asyncio.to_thread(self.memory.filter_decisions.put, filtering_key, filtering_rules_hash, filtering_result)
+
+            if not filtering_result.should_respond:
                 return None
-        
-    
-        generated_response_schema = SiaMessageGeneratedSchema(
-            content=generated_response.content,
-            platform=message.platform,
-            author=self.character.platform_settings.get(message.platform, {}).get("username", self.character.name),
-            character=self.character.name,
-            response_to=message.id,
-            conversation_id=message.conversation_id
-        )
-        log_message(self.logger, "info", self, f"Generated response: {generated_response_schema}")
 
-        return generated_response_schema
+        return self._response_prompt(message_to_respond_str, conversation_str, platform=platform)
+
+
+    async def agenerate_response(
+        self,
+        message: SiaMessageSchema,
+        platform="twitter",
+        time_of_day=None,
+        conversation=None
+    ) -> SiaMessageGeneratedSchema|None:
+        """
+        Async counterpart of generate_response: the filtering and generation
+        calls are awaited, so other messages are served while the LLMs respond.
+        At most max_concurrent_generations responses are generated at a time.
+        """
+
+        if not self.character.responding.get("enabled", True):
+            return None
+
+        async with self.generation_slots():
+
+            prompt = await self._aresponse_prompt(message, platform=platform, conversation=conversation)
+            if not prompt:
+                return None
+            prompt_template, ai_input = prompt
+
+            generated_response = await self._ainvoke_with_fallback(prompt_template, ai_input, "response")
+            if not generated_response:
+                return None
+
+            return self._response_result(message, generated_response)
+
+
+    async def astream_response(
+        self,
+        message: SiaMessageSchema,
+        platform="twitter",
+        time_of_day=None,
+        conversation=None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of agenerate_response: yields the text of the response as it is generated.
+        Yields nothing if the message is not responded to or no LLM answered.
+        """
+
+        if not self.character.responding.get("enabled", True):
+            return
+
+        async with self.generation_slots():
+
+            prompt = await self._aresponse_prompt(message, platform=platform, conversation=conversation)
+            if not prompt:
+                return
+            prompt_template, ai_input = prompt
+
+            text = ""
+            try:
+                async for chunk in self.llm_router.astream(lambda llm: prompt_template | llm, ai_input, call_site="response"):
+                    content = chunk.content if isinstance(chunk.content, str) else "".join(block.get("text", "") for block in chunk.content if isinstance(block, dict))
+                    if content:
+                        text += content
+                        yield content
+            except SiaLLMUnavailableError as e:
+                log_message(self.logger, "error", self, f"Error generating response: {e}")
+                return
+            log_message(self.logger, "info", self, f"Generated response: {text}")
 
 
     def publish_post(self, client: SiaClient, post: SiaMessageGeneratedSchema, media: dict = []) -> str:
@@ -391,6 +678,14 @@ class Sia:
         twitter_thread = threading.Thread(target=self.run_twitter)
         twitter_thread.start()
 
+        # Keep posts ready to publish
+        self.post_buffer.start()
+
+        # Archive old messages in the background
+        if self.memory.retention.policy.enabled:
+            retention_thread = threading.Thread(target=self.run_retention, daemon=True)
+            retention_thread.start()
+
         # Join the threads for the main program to wait for them
         telegram_thread.join()
         twitter_thread.join()
@@ -400,3 +695,11 @@ class Sia:
 
     def run_twitter(self):
         asyncio.run(self.twitter.run())
+
+    def run_retention(self):
+        while True:
+            try:
+                self.memory.retention.apply_policy()
+            except Exception as e:
+                log_message(self.logger, "error", self, f"Error applying the retention policy: {e}")
+            time.sleep(self.memory.retention.policy.interval_hours * 3600)